@@ -0,0 +1,43 @@
+"""Idempotency-Key response store.
+
+Revision ID: 0009_idempotency_keys
+Revises: 0008_contacts_support
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0009_idempotency_keys"
+down_revision = "0008_contacts_support"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "sys_idempotency_key",
+        sa.Column("id", sa.String(length=36), primary_key=True),
+        sa.Column("tenant_id", sa.String(length=64), nullable=False),
+        sa.Column("key_hash", sa.String(length=64), nullable=False),
+        sa.Column("idempotency_key", sa.String(length=255), nullable=False),
+        sa.Column("method", sa.String(length=8), nullable=False),
+        sa.Column("path", sa.String(length=512), nullable=False),
+        sa.Column("request_hash", sa.String(length=64), nullable=False),
+        sa.Column("status", sa.String(length=16), nullable=False),
+        sa.Column("response_status", sa.Integer(), nullable=True),
+        sa.Column("response_headers", sa.JSON(), nullable=False),
+        sa.Column("response_body", sa.LargeBinary(), nullable=True),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.UniqueConstraint("key_hash", name="uq_sys_idempotency_key_hash"),
+    )
+    op.create_index("ix_sys_idempotency_key_tenant_id", "sys_idempotency_key", ["tenant_id"])
+    op.create_index("ix_idempotency_expires", "sys_idempotency_key", ["expires_at"])
+
+
+def downgrade():
+    op.drop_index("ix_idempotency_expires", table_name="sys_idempotency_key")
+    op.drop_index("ix_sys_idempotency_key_tenant_id", table_name="sys_idempotency_key")
+    op.drop_table("sys_idempotency_key")
@@ -0,0 +1,28 @@
+"""Hash-keyed idempotency for inventory movements.
+
+Revision ID: 0010_txn_idempotency_key
+Revises: 0009_idempotency_keys
+Create Date: 2026-10-18
+
+Rows written before this revision keep a NULL key (NULLs never conflict), so only
+movements applied after the upgrade are deduplicated by the index.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0010_txn_idempotency_key"
+down_revision = "0009_idempotency_keys"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("wms_inventory_txn", sa.Column("idempotency_key", sa.String(length=64), nullable=True))
+    op.create_index("ux_txn_idempotency_key", "wms_inventory_txn", ["idempotency_key"], unique=True)
+
+
+def downgrade():
+    op.drop_index("ux_txn_idempotency_key", table_name="wms_inventory_txn")
+    op.drop_column("wms_inventory_txn", "idempotency_key")
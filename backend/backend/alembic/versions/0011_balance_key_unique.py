@@ -0,0 +1,48 @@
+"""Unique balance key for atomic balance upserts.
+
+Revision ID: 0011_balance_key_unique
+Revises: 0010_txn_idempotency_key
+Create Date: 2026-10-18
+
+Existing duplicate balance rows (possible under the old read-modify-write path) are
+merged into one row per key before the unique index is built.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0011_balance_key_unique"
+down_revision = "0010_txn_idempotency_key"
+branch_labels = None
+depends_on = None
+
+_KEY = "item_id, location_id, coalesce(lot_id, ''), coalesce(handling_unit_id, ''), state"
+
+
+def upgrade():
+    bind = op.get_bind()
+    dupes = bind.execute(sa.text(
+        f"SELECT {_KEY}, SUM(qty), MIN(id) FROM wms_inventory_balance "
+        f"GROUP BY {_KEY} HAVING COUNT(*) > 1"
+    )).fetchall()
+    for item_id, location_id, lot_id, hu_id, state, total, keep_id in dupes:
+        params = {"item_id": item_id, "location_id": location_id, "lot_id": lot_id,
+                  "hu_id": hu_id, "state": state, "keep_id": keep_id, "total": total}
+        bind.execute(sa.text("UPDATE wms_inventory_balance SET qty = :total WHERE id = :keep_id"), params)
+        bind.execute(sa.text(
+            "DELETE FROM wms_inventory_balance WHERE item_id = :item_id AND location_id = :location_id "
+            "AND coalesce(lot_id, '') = :lot_id AND coalesce(handling_unit_id, '') = :hu_id "
+            "AND state = :state AND id <> :keep_id"
+        ), params)
+
+    op.create_index(
+        "ux_balance_key",
+        "wms_inventory_balance",
+        ["item_id", "location_id", sa.text("coalesce(lot_id, '')"), sa.text("coalesce(handling_unit_id, '')"), "state"],
+        unique=True,
+    )
+
+
+def downgrade():
+    op.drop_index("ux_balance_key", table_name="wms_inventory_balance")
@@ -0,0 +1,25 @@
+"""Record the reserved balance's lot on allocations.
+
+Revision ID: 0012_allocation_lot
+Revises: 0011_balance_key_unique
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0012_allocation_lot"
+down_revision = "0011_balance_key_unique"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("wms_allocation", sa.Column("lot_id", sa.String(length=36), sa.ForeignKey("wms_lot.id"), nullable=True))
+    op.create_index("ix_wms_allocation_lot_id", "wms_allocation", ["lot_id"])
+
+
+def downgrade():
+    op.drop_index("ix_wms_allocation_lot_id", table_name="wms_allocation")
+    op.drop_column("wms_allocation", "lot_id")
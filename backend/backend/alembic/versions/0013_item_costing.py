@@ -0,0 +1,101 @@
+"""Perpetual costing tables + per-item on-hand aggregate.
+
+Revision ID: 0013_item_costing
+Revises: 0012_allocation_lot
+Create Date: 2026-10-18
+
+inv_item_onhand is seeded from the balances at the item master's cost, and inv_item_cost
+starts every item at that on-hand value / qty (else the master's average cost), so issues
+and receipts after the upgrade are costed from the same figures.
+"""
+
+import uuid
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0013_item_costing"
+down_revision = "0012_allocation_lot"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "inv_item_cost",
+        sa.Column("id", sa.String(length=36), primary_key=True),
+        sa.Column("item_id", sa.String(length=36), sa.ForeignKey("inv_item_master.id"), nullable=False),
+        sa.Column("method", sa.String(length=16), nullable=False),
+        sa.Column("currency", sa.String(length=3), nullable=False),
+        sa.Column("avg_cost", sa.Numeric(18, 6), nullable=False),
+        sa.Column("std_cost", sa.Numeric(18, 6), nullable=False),
+        sa.Column("meta", sa.JSON(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.UniqueConstraint("item_id", name="uq_inv_item_cost_item_id"),
+    )
+
+    op.create_table(
+        "inv_valuation_txn",
+        sa.Column("id", sa.String(length=36), primary_key=True),
+        sa.Column("item_id", sa.String(length=36), sa.ForeignKey("inv_item_master.id"), nullable=False),
+        sa.Column("qty", sa.Numeric(18, 6), nullable=False),
+        sa.Column("unit_cost", sa.Numeric(18, 6), nullable=False),
+        sa.Column("extended_cost", sa.Numeric(18, 6), nullable=False),
+        sa.Column("direction", sa.String(length=8), nullable=False),
+        sa.Column("correlation_id", sa.String(length=64), nullable=True),
+        sa.Column("meta", sa.JSON(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index("ix_inv_valuation_txn_item_id", "inv_valuation_txn", ["item_id"])
+    op.create_index("ix_inv_valuation_txn_correlation_id", "inv_valuation_txn", ["correlation_id"])
+    op.create_index("ix_valuation_txn_item_created", "inv_valuation_txn", ["item_id", "created_at"])
+
+    op.create_table(
+        "inv_item_onhand",
+        sa.Column("item_id", sa.String(length=36), sa.ForeignKey("inv_item_master.id"), primary_key=True),
+        sa.Column("qty", sa.Numeric(18, 6), nullable=False),
+        sa.Column("value", sa.Numeric(18, 6), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    # Seed from current balances, valued at the item master's average (or standard) cost.
+    op.execute(
+        "INSERT INTO inv_item_onhand (item_id, qty, value, updated_at) "
+        "SELECT b.item_id, SUM(b.qty), SUM(b.qty) * COALESCE(MAX(i.average_cost), MAX(i.standard_cost), 0), CURRENT_TIMESTAMP "
+        "FROM wms_inventory_balance b JOIN inv_item_master i ON i.id = b.item_id "
+        "GROUP BY b.item_id"
+    )
+    _seed_item_costs(op.get_bind())
+
+
+def _seed_item_costs(bind):
+    item = sa.table("inv_item_master", sa.column("id"), sa.column("average_cost"), sa.column("standard_cost"))
+    onhand = sa.table("inv_item_onhand", sa.column("item_id"), sa.column("qty"), sa.column("value"))
+    cost = sa.table(
+        "inv_item_cost",
+        *(sa.column(c) for c in ("id", "item_id", "method", "currency", "created_at")),
+        sa.column("avg_cost", sa.Numeric(18, 6)),
+        sa.column("std_cost", sa.Numeric(18, 6)),
+        sa.column("meta", sa.JSON()),
+    )
+    now = datetime.utcnow()
+    rows = []
+    for item_id, average, standard, qty, value in bind.execute(
+        sa.select(item.c.id, item.c.average_cost, item.c.standard_cost, onhand.c.qty, onhand.c.value)
+        .select_from(item.outerjoin(onhand, onhand.c.item_id == item.c.id))
+    ):
+        avg = value / qty if qty and qty > 0 else average
+        rows.append({"id": str(uuid.uuid4()), "item_id": item_id, "method": "AVG", "currency": "USD", "created_at": now,
+                     "avg_cost": avg or 0, "std_cost": standard or 0, "meta": {}})
+    for i in range(0, len(rows), 500):
+        bind.execute(cost.insert(), rows[i:i + 500])
+
+
+def downgrade():
+    op.drop_table("inv_item_onhand")
+    op.drop_index("ix_valuation_txn_item_created", table_name="inv_valuation_txn")
+    op.drop_index("ix_inv_valuation_txn_correlation_id", table_name="inv_valuation_txn")
+    op.drop_index("ix_inv_valuation_txn_item_id", table_name="inv_valuation_txn")
+    op.drop_table("inv_valuation_txn")
+    op.drop_table("inv_item_cost")
@@ -0,0 +1,63 @@
+"""FIFO cost layers with partial open-layer indexes + archive table.
+
+Revision ID: 0014_fifo_layers
+Revises: 0013_item_costing
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0014_fifo_layers"
+down_revision = "0013_item_costing"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "inv_fifo_layer",
+        sa.Column("id", sa.String(length=36), primary_key=True),
+        sa.Column("item_id", sa.String(length=36), sa.ForeignKey("inv_item_master.id"), nullable=False),
+        sa.Column("location_id", sa.String(length=36), sa.ForeignKey("wms_location.id"), nullable=True),
+        sa.Column("qty_received", sa.Numeric(18, 6), nullable=False),
+        sa.Column("qty_remaining", sa.Numeric(18, 6), nullable=False),
+        sa.Column("unit_cost", sa.Numeric(18, 6), nullable=False),
+        sa.Column("correlation_id", sa.String(length=64), nullable=True),
+        sa.Column("exhausted_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("meta", sa.JSON(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    open_layer = sa.text("qty_remaining > 0")
+    op.create_index("ix_fifo_layer_open_loc", "inv_fifo_layer", ["item_id", "location_id", "created_at", "id"],
+                    postgresql_where=open_layer, sqlite_where=open_layer)
+    op.create_index("ix_fifo_layer_open_item", "inv_fifo_layer", ["item_id", "created_at", "id"],
+                    postgresql_where=open_layer, sqlite_where=open_layer)
+    exhausted = sa.text("exhausted_at IS NOT NULL")
+    op.create_index("ix_fifo_layer_exhausted", "inv_fifo_layer", ["exhausted_at"],
+                    postgresql_where=exhausted, sqlite_where=exhausted)
+
+    op.create_table(
+        "inv_fifo_layer_archive",
+        sa.Column("id", sa.String(length=36), primary_key=True),
+        sa.Column("item_id", sa.String(length=36), nullable=False),
+        sa.Column("location_id", sa.String(length=36), nullable=True),
+        sa.Column("qty_received", sa.Numeric(18, 6), nullable=False),
+        sa.Column("unit_cost", sa.Numeric(18, 6), nullable=False),
+        sa.Column("correlation_id", sa.String(length=64), nullable=True),
+        sa.Column("meta", sa.JSON(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("exhausted_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("archived_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index("ix_inv_fifo_layer_archive_item_id", "inv_fifo_layer_archive", ["item_id"])
+
+
+def downgrade():
+    op.drop_index("ix_inv_fifo_layer_archive_item_id", table_name="inv_fifo_layer_archive")
+    op.drop_table("inv_fifo_layer_archive")
+    op.drop_index("ix_fifo_layer_exhausted", table_name="inv_fifo_layer")
+    op.drop_index("ix_fifo_layer_open_item", table_name="inv_fifo_layer")
+    op.drop_index("ix_fifo_layer_open_loc", table_name="inv_fifo_layer")
+    op.drop_table("inv_fifo_layer")
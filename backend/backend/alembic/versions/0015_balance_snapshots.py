@@ -0,0 +1,46 @@
+"""Balance snapshots for as-of inventory queries + txn time indexes.
+
+Revision ID: 0015_balance_snapshots
+Revises: 0014_fifo_layers
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0015_balance_snapshots"
+down_revision = "0014_fifo_layers"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("inv_valuation_snapshot", sa.Column("as_of", sa.DateTime(timezone=True), nullable=True))
+    op.create_index("ix_inv_valuation_snapshot_as_of", "inv_valuation_snapshot", ["as_of"])
+
+    op.create_table(
+        "inv_balance_snapshot_line",
+        sa.Column("id", sa.String(length=36), primary_key=True),
+        sa.Column("valuation_id", sa.String(length=36),
+                  sa.ForeignKey("inv_valuation_snapshot.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("item_id", sa.String(length=36), nullable=False),
+        sa.Column("location_id", sa.String(length=36), nullable=False),
+        sa.Column("lot_id", sa.String(length=36), nullable=True),
+        sa.Column("handling_unit_id", sa.String(length=36), nullable=True),
+        sa.Column("state", sa.String(length=24), nullable=False),
+        sa.Column("qty", sa.Numeric(18, 6), nullable=False),
+    )
+    op.create_index("ix_balance_snapshot_line_item", "inv_balance_snapshot_line", ["valuation_id", "item_id"])
+
+    op.create_index("ix_txn_created", "wms_inventory_txn", ["created_at"])
+    op.create_index("ix_txn_item_created", "wms_inventory_txn", ["item_id", "created_at"])
+
+
+def downgrade():
+    op.drop_index("ix_txn_item_created", table_name="wms_inventory_txn")
+    op.drop_index("ix_txn_created", table_name="wms_inventory_txn")
+    op.drop_index("ix_balance_snapshot_line_item", table_name="inv_balance_snapshot_line")
+    op.drop_table("inv_balance_snapshot_line")
+    op.drop_index("ix_inv_valuation_snapshot_as_of", table_name="inv_valuation_snapshot")
+    op.drop_column("inv_valuation_snapshot", "as_of")
@@ -0,0 +1,42 @@
+"""Last-movement index + outbox consumer cursor for slow-moving analysis.
+
+Revision ID: 0016_item_activity_index
+Revises: 0015_balance_snapshots
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0016_item_activity_index"
+down_revision = "0015_balance_snapshots"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "inv_item_location_activity",
+        sa.Column("item_id", sa.String(length=36), primary_key=True),
+        sa.Column("location_id", sa.String(length=36), primary_key=True),
+        sa.Column("last_receipt_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("last_issue_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("last_movement_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_table(
+        "outbox_cursor",
+        sa.Column("consumer", sa.String(length=64), primary_key=True),
+        sa.Column("last_created_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    op.add_column("inv_slow_moving_item", sa.Column("location_id", sa.String(length=64), nullable=True))
+    op.create_index("ix_inv_slow_moving_item_location_id", "inv_slow_moving_item", ["location_id"])
+
+
+def downgrade():
+    op.drop_index("ix_inv_slow_moving_item_location_id", table_name="inv_slow_moving_item")
+    op.drop_column("inv_slow_moving_item", "location_id")
+    op.drop_table("outbox_cursor")
+    op.drop_table("inv_item_location_activity")
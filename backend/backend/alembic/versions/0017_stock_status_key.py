@@ -0,0 +1,89 @@
+"""One inv_stock_status row per item and site.
+
+Revision ID: 0017_stock_status_key
+Revises: 0016_item_activity_index
+Create Date: 2026-10-18
+
+Nothing maintained the table before this revision, so existing rows are dropped rather than
+merged and one row per item and site is written from the grouped balances (the same figures
+POST /erp/inventory/stock-status/rebuild computes).
+"""
+
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0017_stock_status_key"
+down_revision = "0016_item_activity_index"
+branch_labels = None
+depends_on = None
+
+_BUCKETS = {"AVAILABLE": "available_qty", "RESERVED": "reserved_qty", "QUARANTINE": "quarantine_qty", "HOLD": "hold_qty"}
+_QTY_COLUMNS = ("on_hand_qty", *_BUCKETS.values(), "on_order_qty", "in_transit_qty")
+_WRITE_ROWS = 500
+
+
+def upgrade():
+    op.execute("DELETE FROM inv_stock_status")
+    op.create_index(
+        "ux_stock_status_item_site",
+        "inv_stock_status",
+        ["item_id", sa.text("coalesce(site_id, '')")],
+        unique=True,
+    )
+    _backfill(op.get_bind())
+
+
+def _backfill(bind):
+    bal = sa.table("wms_inventory_balance", sa.column("item_id"), sa.column("location_id"), sa.column("state"),
+                   sa.column("qty"))
+    loc = sa.table("wms_location", sa.column("id"), sa.column("site_id"))
+    item = sa.table("inv_item_master", sa.column("id"), sa.column("safety_stock_qty"), sa.column("reorder_point"),
+                    sa.column("maximum_quantity"))
+    status = sa.table(
+        "inv_stock_status",
+        *(sa.column(c) for c in ("id", "created_at", "item_id", "site_id", "location_id", "last_updated")),
+        *(sa.column(c, sa.Numeric(18, 6)) for c in (*_QTY_COLUMNS, "safety_stock", "reorder_point")),
+        *(sa.column(c, sa.Boolean()) for c in ("is_below_safety_stock", "is_below_reorder_point", "is_overstock")),
+    )
+
+    grouped = bind.execute(
+        sa.select(bal.c.item_id, loc.c.site_id, bal.c.state, sa.func.sum(bal.c.qty),
+                  item.c.safety_stock_qty, item.c.reorder_point, item.c.maximum_quantity)
+        .select_from(bal.join(loc, loc.c.id == bal.c.location_id).join(item, item.c.id == bal.c.item_id))
+        .group_by(bal.c.item_id, loc.c.site_id, bal.c.state,
+                  item.c.safety_stock_qty, item.c.reorder_point, item.c.maximum_quantity)
+    )
+    now = datetime.utcnow()
+    rows: dict[tuple, dict] = {}
+    for item_id, site_id, state, qty, safety, reorder, maximum in grouped:
+        row = rows.get((item_id, site_id))
+        if row is None:
+            row = rows[(item_id, site_id)] = {
+                "id": str(uuid.uuid4()), "created_at": now, "item_id": item_id, "site_id": site_id, "location_id": None,
+                **{c: Decimal("0") for c in _QTY_COLUMNS},
+                "safety_stock": Decimal(safety or 0), "reorder_point": Decimal(reorder or 0),
+                "_maximum": Decimal(maximum or 0), "last_updated": now,
+            }
+        row["on_hand_qty"] += Decimal(qty or 0)
+        if state in _BUCKETS:
+            row[_BUCKETS[state]] += Decimal(qty or 0)
+
+    values = []
+    for row in rows.values():
+        maximum = row.pop("_maximum")
+        safety, reorder, available = row["safety_stock"], row["reorder_point"], row["available_qty"]
+        row["is_below_safety_stock"] = safety > 0 and available < safety
+        row["is_below_reorder_point"] = reorder > 0 and available <= reorder
+        row["is_overstock"] = maximum > 0 and row["on_hand_qty"] > maximum
+        values.append(row)
+    for i in range(0, len(values), _WRITE_ROWS):
+        bind.execute(status.insert(), values[i:i + _WRITE_ROWS])
+
+
+def downgrade():
+    op.drop_index("ux_stock_status_item_site", table_name="inv_stock_status")
@@ -0,0 +1,173 @@
+"""Reservation ledger (wms_inventory_reservation) and per-balance reserved counter.
+
+Revision ID: 0018_reservation_ledger
+Revises: 0017_stock_status_key
+Create Date: 2026-10-18
+
+Reservations stop being RESERVED balance rows. Existing RESERVED balances are folded back
+into their AVAILABLE row, and each fold is written to wms_inventory_txn as a RESERVED ->
+AVAILABLE txn so ledger replay and as-of queries agree with the folded balances. They carry
+no demand line, so open orders are re-reserved by re-running allocation
+(POST /waves/{id}/release or allocate_order) after upgrading. inv_stock_status is recomputed
+from the folded balances (the ledger starts empty, so nothing is reserved), as 0017 wrote it.
+"""
+
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0018_reservation_ledger"
+down_revision = "0017_stock_status_key"
+branch_labels = None
+depends_on = None
+
+_BUCKETS = {"AVAILABLE": "available_qty", "RESERVED": "reserved_qty", "QUARANTINE": "quarantine_qty", "HOLD": "hold_qty"}
+_QTY_COLUMNS = ("on_hand_qty", *_BUCKETS.values(), "on_order_qty", "in_transit_qty")
+_WRITE_ROWS = 500
+_SIBLING = (
+    "FROM wms_inventory_balance r WHERE r.state = 'RESERVED' "
+    "AND r.item_id = wms_inventory_balance.item_id AND r.location_id = wms_inventory_balance.location_id "
+    "AND coalesce(r.lot_id, '') = coalesce(wms_inventory_balance.lot_id, '') "
+    "AND coalesce(r.handling_unit_id, '') = coalesce(wms_inventory_balance.handling_unit_id, '')"
+)
+
+
+def upgrade():
+    op.create_table(
+        "wms_inventory_reservation",
+        sa.Column("id", sa.String(length=36), primary_key=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("demand_id", sa.String(length=64), nullable=True),
+        sa.Column("demand_line_id", sa.String(length=64), nullable=False),
+        sa.Column("balance_id", sa.String(length=36), sa.ForeignKey("wms_inventory_balance.id"), nullable=False),
+        sa.Column("item_id", sa.String(length=36), sa.ForeignKey("inv_item_master.id"), nullable=False),
+        sa.Column("location_id", sa.String(length=36), sa.ForeignKey("wms_location.id"), nullable=False),
+        sa.Column("qty", sa.Numeric(18, 6), nullable=False),
+        sa.Column("correlation_id", sa.String(length=64), nullable=True),
+        sa.Column("actor", sa.String(length=128), nullable=False),
+        sa.Column("reason", sa.String(length=256), nullable=True),
+    )
+    for col in ("demand_id", "demand_line_id", "balance_id", "item_id", "location_id"):
+        op.create_index(f"ix_wms_inventory_reservation_{col}", "wms_inventory_reservation", [col])
+    op.create_index("ux_reservation_line_balance", "wms_inventory_reservation",
+                    ["demand_line_id", "balance_id"], unique=True)
+    op.create_table(
+        "wms_balance_reserved",
+        sa.Column("balance_id", sa.String(length=36), sa.ForeignKey("wms_inventory_balance.id"), primary_key=True),
+        sa.Column("qty", sa.Numeric(18, 6), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+    )
+
+    _record_fold(op.get_bind())
+    # RESERVED -> AVAILABLE: add into an existing AVAILABLE row, else relabel the row.
+    op.execute(
+        f"UPDATE wms_inventory_balance SET qty = qty + (SELECT r.qty {_SIBLING}) "
+        f"WHERE state = 'AVAILABLE' AND EXISTS (SELECT 1 {_SIBLING})"
+    )
+    op.execute(
+        "DELETE FROM wms_inventory_balance WHERE state = 'RESERVED' AND EXISTS ("
+        "SELECT 1 FROM wms_inventory_balance a WHERE a.state = 'AVAILABLE' "
+        "AND a.item_id = wms_inventory_balance.item_id AND a.location_id = wms_inventory_balance.location_id "
+        "AND coalesce(a.lot_id, '') = coalesce(wms_inventory_balance.lot_id, '') "
+        "AND coalesce(a.handling_unit_id, '') = coalesce(wms_inventory_balance.handling_unit_id, ''))"
+    )
+    op.execute("UPDATE wms_inventory_balance SET state = 'AVAILABLE' WHERE state = 'RESERVED'")
+    _rebuild_stock_status(op.get_bind())
+
+
+def _record_fold(bind):
+    """One RESERVED -> AVAILABLE txn per RESERVED balance, in place (same location)."""
+    bal = sa.table("wms_inventory_balance", sa.column("item_id"), sa.column("location_id"), sa.column("lot_id"),
+                   sa.column("handling_unit_id"), sa.column("state"), sa.column("qty"))
+    txn = sa.table(
+        "wms_inventory_txn",
+        *(sa.column(c) for c in ("id", "created_at", "correlation_id", "txn_type", "item_id", "lot_id", "from_location_id",
+                                 "to_location_id", "handling_unit_id", "state", "uom", "actor", "reason")),
+        sa.column("qty", sa.Numeric(18, 6)),
+        sa.column("meta", sa.JSON()),
+    )
+    now = datetime.utcnow()
+    rows = [{
+        "id": str(uuid.uuid4()), "created_at": now, "correlation_id": revision, "txn_type": "MOVE",
+        "item_id": item_id, "lot_id": lot_id, "from_location_id": location_id, "to_location_id": location_id,
+        "handling_unit_id": hu_id, "state": "RESERVED", "qty": qty, "uom": "EA", "actor": "migration",
+        "reason": "Reservations moved to wms_inventory_reservation", "meta": {"to_state": "AVAILABLE"},
+    } for item_id, location_id, lot_id, hu_id, qty in bind.execute(
+        sa.select(bal.c.item_id, bal.c.location_id, bal.c.lot_id, bal.c.handling_unit_id, bal.c.qty)
+        .where(bal.c.state == "RESERVED", bal.c.qty != 0)
+    )]
+    for i in range(0, len(rows), _WRITE_ROWS):
+        bind.execute(txn.insert(), rows[i:i + _WRITE_ROWS])
+
+
+def _rebuild_stock_status(bind):
+    """Same recompute as 0017's backfill, over the folded balances. on_order / in_transit are
+    not balance states: they are carried over, and a row with no balances that holds them is kept."""
+    bal = sa.table("wms_inventory_balance", sa.column("item_id"), sa.column("location_id"), sa.column("state"),
+                   sa.column("qty"))
+    loc = sa.table("wms_location", sa.column("id"), sa.column("site_id"))
+    item = sa.table("inv_item_master", sa.column("id"), sa.column("safety_stock_qty"), sa.column("reorder_point"),
+                    sa.column("maximum_quantity"))
+    status = sa.table(
+        "inv_stock_status",
+        *(sa.column(c) for c in ("id", "created_at", "item_id", "site_id", "location_id", "last_updated")),
+        *(sa.column(c, sa.Numeric(18, 6)) for c in (*_QTY_COLUMNS, "safety_stock", "reorder_point")),
+        *(sa.column(c, sa.Boolean()) for c in ("is_below_safety_stock", "is_below_reorder_point", "is_overstock")),
+    )
+
+    kept = {(item_id, site_id): (on_order, in_transit) for item_id, site_id, on_order, in_transit in bind.execute(
+        sa.select(status.c.item_id, status.c.site_id, status.c.on_order_qty, status.c.in_transit_qty)
+        .where(sa.or_(status.c.on_order_qty != 0, status.c.in_transit_qty != 0))
+    )}
+    grouped = bind.execute(
+        sa.select(bal.c.item_id, loc.c.site_id, bal.c.state, sa.func.sum(bal.c.qty),
+                  item.c.safety_stock_qty, item.c.reorder_point, item.c.maximum_quantity)
+        .select_from(bal.join(loc, loc.c.id == bal.c.location_id).join(item, item.c.id == bal.c.item_id))
+        .group_by(bal.c.item_id, loc.c.site_id, bal.c.state,
+                  item.c.safety_stock_qty, item.c.reorder_point, item.c.maximum_quantity)
+    )
+    now = datetime.utcnow()
+    rows: dict[tuple, dict] = {}
+    for item_id, site_id, state, qty, safety, reorder, maximum in grouped:
+        row = rows.get((item_id, site_id))
+        if row is None:
+            on_order, in_transit = kept.get((item_id, site_id), (0, 0))
+            row = rows[(item_id, site_id)] = {
+                "id": str(uuid.uuid4()), "created_at": now, "item_id": item_id, "site_id": site_id, "location_id": None,
+                **{c: Decimal("0") for c in _QTY_COLUMNS},
+                "on_order_qty": Decimal(on_order or 0), "in_transit_qty": Decimal(in_transit or 0),
+                "safety_stock": Decimal(safety or 0), "reorder_point": Decimal(reorder or 0),
+                "_maximum": Decimal(maximum or 0), "last_updated": now,
+            }
+        row["on_hand_qty"] += Decimal(qty or 0)
+        if state in _BUCKETS:
+            row[_BUCKETS[state]] += Decimal(qty or 0)
+
+    values = []
+    for row in rows.values():
+        maximum = row.pop("_maximum")
+        safety, reorder, available = row["safety_stock"], row["reorder_point"], row["available_qty"]
+        row["is_below_safety_stock"] = safety > 0 and available < safety
+        row["is_below_reorder_point"] = reorder > 0 and available <= reorder
+        row["is_overstock"] = maximum > 0 and row["on_hand_qty"] > maximum
+        values.append(row)
+    bind.execute(status.delete().where(status.c.on_order_qty == 0, status.c.in_transit_qty == 0))
+    for item_id, site_id in kept.keys() & rows.keys():
+        bind.execute(status.delete().where(
+            status.c.item_id == item_id,
+            status.c.site_id.is_(None) if site_id is None else status.c.site_id == site_id,
+        ))
+    for i in range(0, len(values), _WRITE_ROWS):
+        bind.execute(status.insert(), values[i:i + _WRITE_ROWS])
+
+
+def downgrade():
+    op.drop_table("wms_balance_reserved")
+    op.drop_index("ux_reservation_line_balance", table_name="wms_inventory_reservation")
+    for col in ("location_id", "item_id", "balance_id", "demand_line_id", "demand_id"):
+        op.drop_index(f"ix_wms_inventory_reservation_{col}", table_name="wms_inventory_reservation")
+    op.drop_table("wms_inventory_reservation")
@@ -0,0 +1,47 @@
+"""Lot expiry on balances, (item, state, expiry) index and the allocation candidate view.
+
+Revision ID: 0019_allocation_candidates
+Revises: 0018_reservation_ledger
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0019_allocation_candidates"
+down_revision = "0018_reservation_ledger"
+branch_labels = None
+depends_on = None
+
+# Same definition as app.db.models.inventory_exec.ALLOCATION_CANDIDATE_SQL at this revision.
+_VIEW = """
+SELECT b.id AS balance_id, b.item_id, b.location_id, b.lot_id, b.handling_unit_id, b.expiry_date,
+       b.created_at,
+       coalesce((SELECT min(f.created_at) FROM inv_fifo_layer f
+                 WHERE f.item_id = b.item_id AND f.location_id = b.location_id AND f.qty_remaining > 0),
+                b.created_at) AS received_at,
+       b.qty - coalesce(r.qty, 0) AS available_qty
+FROM wms_inventory_balance b
+JOIN wms_location l ON l.id = b.location_id AND l.type = 'BIN'
+LEFT JOIN wms_balance_reserved r ON r.balance_id = b.id
+WHERE b.state = 'AVAILABLE' AND b.qty - coalesce(r.qty, 0) > 0
+"""
+
+
+def upgrade():
+    op.add_column("wms_inventory_balance", sa.Column("expiry_date", sa.Date(), nullable=True))
+    op.execute(
+        "UPDATE wms_inventory_balance SET expiry_date = "
+        "(SELECT l.expiry_date FROM wms_lot l WHERE l.id = wms_inventory_balance.lot_id) "
+        "WHERE lot_id IS NOT NULL"
+    )
+    op.create_index("ix_balance_item_state_expiry", "wms_inventory_balance", ["item_id", "state", "expiry_date"])
+    op.execute("DROP VIEW IF EXISTS wms_allocation_candidate")
+    op.execute(f"CREATE VIEW wms_allocation_candidate AS {_VIEW}")
+
+
+def downgrade():
+    op.execute("DROP VIEW IF EXISTS wms_allocation_candidate")
+    op.drop_index("ix_balance_item_state_expiry", table_name="wms_inventory_balance")
+    op.drop_column("wms_inventory_balance", "expiry_date")
@@ -0,0 +1,38 @@
+"""Per-location occupancy (wms_location_occupancy) for putaway scoring.
+
+Revision ID: 0020_location_occupancy
+Revises: 0019_allocation_candidates
+Create Date: 2026-10-18
+
+Filled from the current balances here; afterwards every balance delta keeps it in step.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0020_location_occupancy"
+down_revision = "0019_allocation_candidates"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "wms_location_occupancy",
+        sa.Column("location_id", sa.String(length=36), sa.ForeignKey("wms_location.id"), primary_key=True),
+        sa.Column("units", sa.Numeric(18, 6), nullable=False),
+        sa.Column("volume", sa.Numeric(18, 6), nullable=False),
+        sa.Column("weight", sa.Numeric(18, 6), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    op.execute(
+        "INSERT INTO wms_location_occupancy (location_id, units, volume, weight, updated_at) "
+        "SELECT b.location_id, sum(b.qty), sum(b.qty * coalesce(i.volume, 0)), sum(b.qty * coalesce(i.weight, 0)), "
+        "CURRENT_TIMESTAMP "
+        "FROM wms_inventory_balance b JOIN inv_item_master i ON i.id = b.item_id GROUP BY b.location_id"
+    )
+
+
+def downgrade():
+    op.drop_table("wms_location_occupancy")
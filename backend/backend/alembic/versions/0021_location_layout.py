@@ -0,0 +1,70 @@
+"""Layout columns on wms_location (zone, aisle, bay, level, pos, x, y).
+
+Revision ID: 0021_location_layout
+Revises: 0020_location_occupancy
+Create Date: 2026-10-18
+
+Existing locations are backfilled by parsing their codes, as set_layout() does for new ones.
+"""
+
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0021_location_layout"
+down_revision = "0020_location_occupancy"
+branch_labels = None
+depends_on = None
+
+_INT_COLUMNS = ("aisle", "bay", "level", "pos")
+
+
+# Same parsing as services.wms.inventory_ops.layout.parse_code at this revision.
+def _parse_code(code: str) -> dict:
+    code = code or ""
+    m = re.search(r"\bZ(\d+)\b", code, re.IGNORECASE)
+    zone = f"Z{int(m.group(1))}" if m else (code.split("-")[0].strip() or "Z0")
+    dims = {}
+    for col, pattern in (("aisle", r"(?:\bA(?:ISLE)?[- ]?)(\d+)"), ("bay", r"(?:\bB|\bBAY[- ]?)(\d+)"),
+                         ("level", r"(?:\bL|\bLVL[- ]?)(\d+)"), ("pos", r"(?:\bP|\bPOS[- ]?)(\d+)")):
+        m = re.search(pattern, code, re.IGNORECASE)
+        dims[col] = int(m.group(1)) if m else 0
+    nums = [int(p) for p in re.split(r"[-_ ]+", code) if p and p.isdigit()]
+    if nums:
+        if dims["aisle"] == 0:
+            dims["aisle"] = nums[-4] if len(nums) >= 4 else nums[0]
+        if dims["bay"] == 0 and len(nums) >= 2:
+            dims["bay"] = nums[-3] if len(nums) >= 3 else nums[1]
+        if dims["level"] == 0 and len(nums) >= 3:
+            dims["level"] = nums[-2]
+        if dims["pos"] == 0 and len(nums) >= 4:
+            dims["pos"] = nums[-1]
+    return {"zone": zone, **dims}
+
+
+def upgrade():
+    op.add_column("wms_location", sa.Column("zone", sa.String(length=32), nullable=True))
+    for col in _INT_COLUMNS:
+        op.add_column("wms_location", sa.Column(col, sa.Integer(), nullable=True))
+    op.add_column("wms_location", sa.Column("x", sa.Float(), nullable=True))
+    op.add_column("wms_location", sa.Column("y", sa.Float(), nullable=True))
+    op.create_index("ix_wms_location_zone", "wms_location", ["zone"])
+
+    bind = op.get_bind()
+    loc = sa.table("wms_location", sa.column("id"), sa.column("code"), sa.column("zone"),
+                   *(sa.column(c) for c in _INT_COLUMNS))
+    rows = [{"_id": i, **_parse_code(code)} for i, code in bind.execute(sa.select(loc.c.id, loc.c.code))]
+    if rows:
+        bind.execute(
+            loc.update().where(loc.c.id == sa.bindparam("_id"))
+            .values(**{c: sa.bindparam(c) for c in ("zone", *_INT_COLUMNS)}),
+            rows,
+        )
+
+
+def downgrade():
+    op.drop_index("ix_wms_location_zone", table_name="wms_location")
+    for col in ("y", "x", *reversed(_INT_COLUMNS), "zone"):
+        op.drop_column("wms_location", col)
@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from jose import JWTError, jwt
+
+from app.core.security import IAM_AUDIENCE, IAM_ISSUER, JWT_ALG, JWT_SECRET
+from app.core.tenant import get_tenant_id
+from app.db.session import SessionLocal
+from app.db.models.idempotency import IdempotencyRecord
+
+# Idempotency-Key support for mutating endpoints.
+#
+# RF scanners and integrations retry POSTs on flaky networks. A request carrying an
+# `Idempotency-Key` header runs once per (tenant, caller, method, path, key); retries get the
+# first response replayed (with `Idempotent-Replayed: true`) instead of repeating the work.
+# The caller is the bearer token's subject (so a refreshed token still replays), or a hash of
+# the Authorization header when it is not a valid token; two users never share a key.
+#
+# - Fast path: per-worker LRU of completed responses (no DB round trip on replay).
+# - Shared store: sys_idempotency_key, whose unique key_hash also acts as the cross-worker
+#   claim while the first request is still running.
+# - Concurrent duplicates in one worker queue on a per-key asyncio.Lock; duplicates in other
+#   workers poll the claim for up to IDEMPOTENCY_WAIT_SECONDS, then get 409.
+# - Only 2xx responses are stored for replay. Any other status (a 4xx the client can fix by
+#   correcting auth or payload, a 5xx) and unhandled errors release the claim so a retry runs.
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_LEASE_SECONDS = float(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "120"))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_MAX_BODY_BYTES = int(os.getenv("IDEMPOTENCY_MAX_BODY_BYTES", str(1024 * 1024)))
+
+MUTATING_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+_CLAIMED = "CLAIMED"
+_IN_PROGRESS = "IN_PROGRESS"
+_COMPLETED = "COMPLETED"
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    request_hash: str
+    status_code: int
+    headers: Tuple[Tuple[str, str], ...]
+    body: bytes
+    expires_at: datetime
+
+
+class _ResponseCache:
+    """Bounded LRU of completed responses; only touched from the event loop."""
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._items: "OrderedDict[str, StoredResponse]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[StoredResponse]:
+        hit = self._items.get(key)
+        if hit is None:
+            return None
+        if hit.expires_at <= datetime.utcnow():
+            self._items.pop(key, None)
+            return None
+        self._items.move_to_end(key)
+        return hit
+
+    def put(self, key: str, value: StoredResponse) -> None:
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+
+_cache = _ResponseCache(IDEMPOTENCY_CACHE_SIZE)
+_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _lock_for(key_hash: str) -> asyncio.Lock:
+    lock = _locks.get(key_hash)
+    if lock is None:
+        lock = asyncio.Lock()
+        _locks[key_hash] = lock
+    return lock
+
+
+def _sha256(*parts: bytes | str) -> str:
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(p.encode() if isinstance(p, str) else p)
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+def _to_stored(row: IdempotencyRecord) -> StoredResponse:
+    return StoredResponse(
+        request_hash=row.request_hash,
+        status_code=int(row.response_status or 200),
+        headers=tuple((k, v) for k, v in (row.response_headers or [])),
+        body=row.response_body or b"",
+        expires_at=row.expires_at.replace(tzinfo=None),
+    )
+
+
+# ---- shared store (sync; called through run_in_threadpool) ------------
+
+def _claim(key_hash: str, *, tenant_id: str, key: str, method: str, path: str,
+           request_hash: str) -> Tuple[str, Optional[str], Optional[StoredResponse]]:
+    """Try to become the request that executes this key.
+
+    Returns (state, stored_request_hash, stored_response).
+    """
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        row = db.query(IdempotencyRecord).filter(IdempotencyRecord.key_hash == key_hash).first()
+        if row is not None and row.expires_at.replace(tzinfo=None) <= now:
+            # Expired result, or a claim left behind by a crashed worker.
+            db.delete(row)
+            db.commit()
+            row = None
+        if row is not None:
+            if row.status == _COMPLETED:
+                return _COMPLETED, row.request_hash, _to_stored(row)
+            return _IN_PROGRESS, row.request_hash, None
+        db.add(IdempotencyRecord(
+            tenant_id=tenant_id,
+            key_hash=key_hash,
+            idempotency_key=key,
+            method=method,
+            path=path[:512],
+            request_hash=request_hash,
+            status=_IN_PROGRESS,
+            expires_at=now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS),
+        ))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker claimed it between our read and insert.
+            db.rollback()
+            return _IN_PROGRESS, None, None
+        return _CLAIMED, request_hash, None
+
+
+def _complete(key_hash: str, stored: StoredResponse) -> None:
+    with SessionLocal() as db:
+        row = db.query(IdempotencyRecord).filter(IdempotencyRecord.key_hash == key_hash).first()
+        if row is None:
+            return
+        row.status = _COMPLETED
+        row.response_status = stored.status_code
+        row.response_headers = [list(h) for h in stored.headers]
+        row.response_body = stored.body
+        row.expires_at = stored.expires_at
+        db.commit()
+
+
+def _release(key_hash: str) -> None:
+    with SessionLocal() as db:
+        db.query(IdempotencyRecord).filter(
+            IdempotencyRecord.key_hash == key_hash,
+            IdempotencyRecord.status == _IN_PROGRESS,
+        ).delete(synchronize_session=False)
+        db.commit()
+
+
+# ---- middleware ---------------------------------------------------------
+
+def _mismatch() -> JSONResponse:
+    return JSONResponse(
+        {"detail": f"{IDEMPOTENCY_HEADER} was already used with a different request payload"},
+        status_code=422,
+    )
+
+
+def _replay(stored: StoredResponse, request_hash: str) -> Response:
+    if stored.request_hash != request_hash:
+        return _mismatch()
+    response = Response(content=stored.body, status_code=stored.status_code)
+    response.raw_headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in stored.headers]
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _caller(request: Request) -> str:
+    """Who sent the request: "sub:<user id>" for a valid bearer token, else a hash of the Authorization header."""
+    auth = request.headers.get("Authorization") or ""
+    scheme, _, token = auth.partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            claims = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG], audience=IAM_AUDIENCE, issuer=IAM_ISSUER)
+        except JWTError:
+            pass
+        else:
+            if claims.get("sub"):
+                return f"sub:{claims['sub']}"
+    return f"auth:{_sha256(auth)}" if auth else ""
+
+
+class IdempotencyMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key or request.method not in MUTATING_METHODS:
+            return await call_next(request)
+        if len(key) > 255:
+            return JSONResponse({"detail": f"{IDEMPOTENCY_HEADER} must be at most 255 characters"}, status_code=400)
+
+        tenant_id = get_tenant_id()
+        path = request.url.path
+        key_hash = _sha256(tenant_id, _caller(request), request.method, path, key)
+        request_hash = _sha256(request.url.query, await request.body())
+
+        hit = _cache.get(key_hash)
+        if hit is not None:
+            return _replay(hit, request_hash)
+
+        async with _lock_for(key_hash):
+            # A duplicate we queued behind may have just finished.
+            hit = _cache.get(key_hash)
+            if hit is not None:
+                return _replay(hit, request_hash)
+
+            deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+            while True:
+                state, stored_hash, stored = await run_in_threadpool(
+                    _claim, key_hash, tenant_id=tenant_id, key=key,
+                    method=request.method, path=path, request_hash=request_hash,
+                )
+                if state == _COMPLETED:
+                    _cache.put(key_hash, stored)
+                    return _replay(stored, request_hash)
+                if state == _CLAIMED:
+                    break
+                if stored_hash is not None and stored_hash != request_hash:
+                    return _mismatch()
+                if time.monotonic() >= deadline:
+                    return JSONResponse(
+                        {"detail": f"A request with this {IDEMPOTENCY_HEADER} is still in progress"},
+                        status_code=409,
+                    )
+                await asyncio.sleep(0.1)
+
+            try:
+                response = await call_next(request)
+            except Exception:
+                await run_in_threadpool(_release, key_hash)
+                raise
+
+            if not 200 <= response.status_code < 300:
+                await run_in_threadpool(_release, key_hash)
+                return response
+
+            body = b"".join([chunk async for chunk in response.body_iterator])
+            replayable = Response(content=body, status_code=response.status_code)
+            replayable.raw_headers = list(response.raw_headers)
+            if len(body) > IDEMPOTENCY_MAX_BODY_BYTES:
+                await run_in_threadpool(_release, key_hash)
+                return replayable
+
+            stored = StoredResponse(
+                request_hash=request_hash,
+                status_code=response.status_code,
+                headers=tuple((k.decode("latin-1"), v.decode("latin-1")) for k, v in response.raw_headers),
+                body=body,
+                expires_at=datetime.utcnow() + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+            )
+            await run_in_threadpool(_complete, key_hash, stored)
+            _cache.put(key_hash, stored)
+            return replayable
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, Tuple
+
+from fastapi import APIRouter, FastAPI
+from fastapi.openapi.utils import get_openapi
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import BaseRoute, Match
+from starlette.types import Receive, Scope, Send
+
+from app.core.module_state import cached_enabled_modules, enabled_modules
+from app.core.tenant import get_tenant_id
+
+# Module-prefix dispatch.
+#
+# Instead of appending every module's routes to the app's flat route list (which Starlette
+# scans linearly per request), all optional modules sit behind ONE route at the front of
+# app.router.routes. It looks up the first path segment in a dict (O(1)), matches only the
+# routes registered under that segment, then checks the tenant's cached module state against
+# the modules that own the matched route (several modules can share a segment, e.g. "docs").
+
+
+def _first_segment(path: str) -> str:
+    return path.lstrip("/").split("/", 1)[0]
+
+
+@dataclass(frozen=True)
+class _Segment:
+    module_keys: Tuple[str, ...]
+    routes: Tuple[BaseRoute, ...]
+
+
+class ModuleDispatchRoute(BaseRoute):
+    def __init__(self, app: FastAPI) -> None:
+        self._app = app
+        # Per-module sub-application: one APIRouter per module key.
+        self._modules: Dict[str, APIRouter] = {}
+        self._segments: Dict[str, set[str]] = {}
+        self._by_segment: Dict[str, _Segment] = {}
+        # Owning module keys per included route; a router shared by several modules is included
+        # once and its routes' owner set grows with share_router().
+        self._router_owners: Dict[int, set[str]] = {}
+        self._route_owners: Dict[int, set[str]] = {}
+
+    # ---- registration -------------------------------------------------
+
+    def add_router(self, module_key: str, router: APIRouter, *, prefix: str = "") -> None:
+        sub = self._modules.get(module_key)
+        if sub is None:
+            sub = APIRouter(dependency_overrides_provider=self._app)
+            self._modules[module_key] = sub
+        owners = self._router_owners.setdefault(id(router), set())
+        owners.add(module_key)
+        before = len(sub.routes)
+        sub.include_router(router, prefix=prefix)
+        for route in sub.routes[before:]:
+            self._route_owners[id(route)] = owners
+        self._segments.setdefault(module_key, set()).update(
+            _first_segment(prefix + getattr(r, "path", "")) for r in router.routes
+        )
+        self._reindex()
+        self._app.openapi_schema = None
+
+    def share_router(self, module_key: str, router: APIRouter) -> None:
+        """Let module_key's state also gate an already included router's routes."""
+        owners = self._router_owners.get(id(router))
+        if owners is not None:
+            owners.add(module_key)
+
+    def _reindex(self) -> None:
+        keys: Dict[str, list[str]] = {}
+        for module_key, segs in self._segments.items():
+            for seg in segs:
+                keys.setdefault(seg, []).append(module_key)
+        # Swap in a new index; in-flight requests keep reading the old one.
+        self._by_segment = {
+            seg: _Segment(tuple(mks), tuple(r for k in mks for r in self._modules[k].routes))
+            for seg, mks in keys.items()
+        }
+
+    def schema_routes(self) -> list[BaseRoute]:
+        return [r for sub in self._modules.values() for r in sub.routes]
+
+    # ---- starlette route protocol ------------------------------------
+
+    def matches(self, scope: Scope) -> Tuple[Match, Scope]:
+        if scope["type"] != "http":
+            return Match.NONE, {}
+        seg = self._by_segment.get(_first_segment(scope["path"]))
+        if seg is None:
+            return Match.NONE, {}
+        partial = None
+        for route in seg.routes:
+            match, child_scope = route.matches(scope)
+            if match == Match.FULL:
+                return Match.FULL, {**child_scope, "module_route": route, "module_keys": self._owners(route)}
+            if match == Match.PARTIAL and partial is None:
+                partial = {**child_scope, "module_route": route, "module_keys": self._owners(route)}
+        if partial is not None:
+            return Match.PARTIAL, partial
+        # Not one of ours (e.g. the OpenAPI UI at /docs): let the app's own routes try.
+        return Match.NONE, {}
+
+    def _owners(self, route: BaseRoute) -> Tuple[str, ...]:
+        return tuple(sorted(self._route_owners.get(id(route), ())))
+
+    async def handle(self, scope: Scope, receive: Receive, send: Send) -> None:
+        module_keys = scope["module_keys"]
+        tenant_id = get_tenant_id()
+        enabled = cached_enabled_modules(tenant_id)
+        if enabled is None:
+            enabled = await run_in_threadpool(enabled_modules, tenant_id)
+        if not any(k in enabled for k in module_keys):
+            # Use 404 so disabled modules "disappear" from API surface
+            response = JSONResponse({"detail": f"Module '{module_keys[0]}' is not enabled"}, status_code=404)
+            await response(scope, receive, send)
+            return
+        route = scope["module_route"]
+        scope["route"] = route
+        await route.handle(scope, receive, send)
+
+
+def get_module_dispatch(app: FastAPI) -> ModuleDispatchRoute:
+    """Return the app's dispatch route, installing it ahead of all other routes on first use."""
+    dispatch = getattr(app.state, "module_dispatch", None)
+    if dispatch is not None:
+        return dispatch
+    dispatch = ModuleDispatchRoute(app)
+    app.router.routes.insert(0, dispatch)
+    app.state.module_dispatch = dispatch
+
+    # Module routes live outside app.routes; add them back for the OpenAPI document.
+    def _openapi() -> dict:
+        if app.openapi_schema is None:
+            app.openapi_schema = get_openapi(
+                title=app.title,
+                version=app.version,
+                openapi_version=app.openapi_version,
+                description=app.description,
+                routes=[*app.routes, *dispatch.schema_routes()],
+            )
+        return app.openapi_schema
+
+    app.openapi = _openapi
+    return dispatch
@@ -5,7 +5,7 @@ from typing import Any, Callable, Dict, Optional, Tuple
 
 from fastapi import FastAPI
 
-from services.admin.module_guard import require_module_enabled
+from app.core.module_dispatch import get_module_dispatch
 
 # Module -> (import_path, router_attr, prefix)
 # Keep this map as the single source of truth for optional modules.
@@ -29,12 +29,39 @@ MODULE_ROUTERS: Dict[str, Tuple[str, str, str]] = {
     "support": ("services.support.api", "router", ""),
 }
 
+# Extra routers that ship with a module and sit behind the same module guard.
+# (main.py used to include these directly under require_module_enabled('wms').)
+MODULE_EXTRA_ROUTERS: Dict[str, list[Tuple[str, str, str]]] = {
+    "wms": [
+        ("services.docs.api", "router", ""),
+        ("services.wms.tasking.api", "router", ""),
+        ("services.wms.inventory_ops.wave_api", "router", ""),
+        ("services.tasking.exceptions_api", "router", ""),
+        ("services.inventory_ops.count_review_api", "router", ""),
+    ],
+}
+
 # Tracks what we already mounted to keep idempotent behavior.
 _mounted: set[str] = set()
+# Router modules already included (a router can be reachable from more than one module key).
+_mounted_routers: set[Tuple[str, str]] = set()
+
+def mark_mounted(module_key: str) -> None:
+    """Record a module whose router the app includes itself (e.g. unguarded core routers)."""
+    _mounted.add(module_key)
+    spec = MODULE_ROUTERS.get(module_key)
+    if spec:
+        _mounted_routers.add((spec[0], spec[1]))
+
+def mounted_modules() -> list[str]:
+    return sorted(_mounted)
 
 def mount_module(app: FastAPI, module_key: str) -> bool:
     """Mount a module router into the running app.
 
+    Routers are registered with the app's module dispatch route (per-module sub-router,
+    gated per tenant from cached module state) rather than the app's flat route list.
+
     Returns True if mounted now, False if already mounted or unknown.
     Safe to call multiple times.
     """
@@ -44,15 +71,17 @@ def mount_module(app: FastAPI, module_key: str) -> bool:
     if not spec:
         return False
 
-    import_path, router_attr, prefix = spec
-    mod = importlib.import_module(import_path)
-    router = getattr(mod, router_attr)
-
-    deps = [require_module_enabled(module_key)]
-    if prefix:
-        app.include_router(router, prefix=prefix, dependencies=deps)
-    else:
-        app.include_router(router, dependencies=deps)
+    dispatch = get_module_dispatch(app)
+    for import_path, router_attr, prefix in [spec, *MODULE_EXTRA_ROUTERS.get(module_key, [])]:
+        # Import lazily: unused modules never pay their import cost.
+        mod = importlib.import_module(import_path)
+        router = getattr(mod, router_attr)
+        if (import_path, router_attr) in _mounted_routers:
+            # Included already for another module: this module's state gates it too.
+            dispatch.share_router(module_key, router)
+            continue
+        dispatch.add_router(module_key, router, prefix=prefix)
+        _mounted_routers.add((import_path, router_attr))
 
     _mounted.add(module_key)
     return True
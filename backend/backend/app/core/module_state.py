@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Optional
+
+from app.db.session import SessionLocal
+from app.db.models.system_modules import SysTenantModule
+
+# Per-tenant enabled-module cache.
+# Module gating used to cost one sys_tenant_module query per request; now it costs one
+# query per tenant per TTL window. Enable/disable calls invalidate() so the local worker
+# sees changes immediately; other workers converge within the TTL.
+MODULE_STATE_TTL_SECONDS = float(os.getenv("MODULE_STATE_TTL_SECONDS", "30"))
+
+_cache: dict[str, tuple[float, frozenset[str]]] = {}
+_lock = threading.Lock()
+
+
+def cached_enabled_modules(tenant_id: str) -> Optional[frozenset[str]]:
+    """Return the cached set if still fresh, else None (never touches the DB)."""
+    hit = _cache.get(tenant_id)
+    if hit and hit[0] > time.monotonic():
+        return hit[1]
+    return None
+
+
+def enabled_modules(tenant_id: str) -> frozenset[str]:
+    hit = cached_enabled_modules(tenant_id)
+    if hit is not None:
+        return hit
+    with _lock:
+        # Another thread may have refreshed while we waited.
+        hit = cached_enabled_modules(tenant_id)
+        if hit is not None:
+            return hit
+        with SessionLocal() as db:
+            rows = (db.query(SysTenantModule.module_key)
+                    .filter(SysTenantModule.tenant_id == tenant_id, SysTenantModule.enabled == True)  # noqa: E712
+                    .all())
+        mods = frozenset(r[0] for r in rows)
+        _cache[tenant_id] = (time.monotonic() + MODULE_STATE_TTL_SECONDS, mods)
+        return mods
+
+
+def is_module_enabled(tenant_id: str, module_key: str) -> bool:
+    return module_key in enabled_modules(tenant_id)
+
+
+def invalidate(tenant_id: str | None = None) -> None:
+    if tenant_id is None:
+        _cache.clear()
+    else:
+        _cache.pop(tenant_id, None)
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.db.models.system_modules import SysTenantModule
+
+# uvicorn configures this logger, so startup reports show up next to its own boot lines.
+log = logging.getLogger("uvicorn.error")
+
+# STARTUP_MODE=dev (default): create_all + eager module routers (current dev behaviour).
+# STARTUP_MODE=production: verify the alembic revision instead of create_all and only
+# import routers for modules that at least one tenant has enabled.
+STARTUP_MODE = os.getenv("STARTUP_MODE", "dev").lower()
+
+ALEMBIC_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "alembic")
+
+
+def is_production() -> bool:
+    return STARTUP_MODE in ("prod", "production")
+
+
+class StartupTimer:
+    """Collects a per-phase timing breakdown of app startup (milliseconds)."""
+
+    def __init__(self) -> None:
+        self.phases: dict[str, float] = {}
+        self._t0 = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round((time.perf_counter() - start) * 1000, 1)
+
+    def report(self) -> dict:
+        return {
+            "mode": STARTUP_MODE,
+            "total_ms": round((time.perf_counter() - self._t0) * 1000, 1),
+            "phases_ms": dict(self.phases),
+        }
+
+    def log(self) -> None:
+        r = self.report()
+        parts = " ".join(f"{k}={v}ms" for k, v in r["phases_ms"].items())
+        log.info("startup mode=%s total=%sms %s", r["mode"], r["total_ms"], parts)
+
+
+def check_schema_revision(engine: Engine) -> str:
+    """Fail fast when the database is not at the alembic head.
+
+    One round trip (SELECT from alembic_version) replaces create_all's per-table
+    catalog inspection on every boot.
+    """
+    from alembic.config import Config
+    from alembic.runtime.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+
+    cfg = Config()
+    cfg.set_main_option("script_location", os.path.abspath(ALEMBIC_DIR))
+    heads = set(ScriptDirectory.from_config(cfg).get_heads())
+    with engine.connect() as conn:
+        current = set(MigrationContext.configure(conn).get_current_heads())
+    if current != heads:
+        raise RuntimeError(
+            f"Database schema revision {sorted(current) or 'none'} != alembic head {sorted(heads)}; "
+            "run `alembic -c alembic.ini upgrade head` before starting in production mode"
+        )
+    return ",".join(sorted(current))
+
+
+def enabled_module_keys(db: Session) -> list[str]:
+    """Modules enabled by at least one tenant (routers are shared across tenants)."""
+    rows = (db.query(SysTenantModule.module_key)
+            .filter(SysTenantModule.enabled == True)  # noqa: E712
+            .distinct()
+            .all())
+    return sorted(r[0] for r in rows)
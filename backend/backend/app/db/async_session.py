@@ -0,0 +1,68 @@
+from __future__ import annotations
+from typing import AsyncGenerator
+import os
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.db.session import DATABASE_URL, DATABASE_READ_URL, RoutingSession, _pool_settings
+
+# Async path for high-concurrency read APIs (storefront catalog etc.).
+# Handlers using get_async_db run on the event loop instead of FastAPI's threadpool,
+# so in-flight requests waiting on Postgres no longer pin a worker thread each.
+#
+# ASYNC_DATABASE_URL / ASYNC_DATABASE_READ_URL override the derived URLs; otherwise the
+# sync URLs are reused with an async driver (psycopg 3 for Postgres, aiosqlite for SQLite).
+_ASYNC_DRIVERS = {
+    "postgresql": "postgresql+psycopg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def _async_url(url: str) -> str:
+    u = make_url(url)
+    driver = _ASYNC_DRIVERS.get(u.get_backend_name())
+    if not driver:
+        return url
+    return u.set(drivername=driver).render_as_string(hide_password=False)
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL)
+ASYNC_DATABASE_READ_URL = os.getenv("ASYNC_DATABASE_READ_URL") or (
+    _async_url(DATABASE_READ_URL) if DATABASE_READ_URL else None
+)
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_pre_ping=True,
+    **_pool_settings("DB_ASYNC"),
+)
+
+async_read_engine = (
+    create_async_engine(
+        ASYNC_DATABASE_READ_URL,
+        pool_pre_ping=True,
+        **_pool_settings("DB_ASYNC_READ"),
+    )
+    if ASYNC_DATABASE_READ_URL
+    else async_engine
+)
+
+
+class AsyncRoutingSession(RoutingSession):
+    """RoutingSession over the async engines (AsyncSession proxies to this)."""
+
+    primary_bind = async_engine.sync_engine
+    replica_bind = async_read_engine.sync_engine
+
+
+# expire_on_commit=False: attribute access after commit would otherwise need implicit IO.
+AsyncSessionLocal = async_sessionmaker(
+    class_=AsyncSession,
+    sync_session_class=AsyncRoutingSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSessionLocal() as db:
+        yield db
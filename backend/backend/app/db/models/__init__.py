@@ -33,3 +33,5 @@ from app.events.subscriptions import *  # noqa
 
 from app.db.models.contacts import *  # noqa: F401,F403
 from app.db.models.support import *  # noqa: F401,F403
+from app.db.models.idempotency import *  # noqa: F401,F403
+from app.db.models.costing import *  # noqa: F401,F403
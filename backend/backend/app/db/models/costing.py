@@ -0,0 +1,105 @@
+"""
+Perpetual costing tables maintained by services.wms.inventory_ops.service
+(moving-average cost, valuation postings, the per-item on-hand aggregate and FIFO cost layers).
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import String, DateTime, Numeric, ForeignKey, JSON, Index
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+from app.db.models.common import HasId, HasCreatedAt
+
+
+class ItemCost(Base, HasId, HasCreatedAt):
+    """
+    Current cost of an item (one row per item)
+    """
+    __tablename__ = "inv_item_cost"
+
+    item_id: Mapped[str] = mapped_column(ForeignKey("inv_item_master.id"), unique=True, nullable=False)
+    method: Mapped[str] = mapped_column(String(16), default="AVG", nullable=False)  # AVG|FIFO|STD
+    currency: Mapped[str] = mapped_column(String(3), default="USD", nullable=False)
+    avg_cost: Mapped[Decimal] = mapped_column(Numeric(18, 6), default=0, nullable=False)
+    std_cost: Mapped[Decimal] = mapped_column(Numeric(18, 6), default=0, nullable=False)
+    meta: Mapped[dict] = mapped_column(JSON, default=dict, nullable=False)
+
+
+class ValuationTxn(Base, HasId, HasCreatedAt):
+    """
+    Value posting for a receipt (IN) or issue (OUT)
+    """
+    __tablename__ = "inv_valuation_txn"
+
+    item_id: Mapped[str] = mapped_column(ForeignKey("inv_item_master.id"), nullable=False, index=True)
+    qty: Mapped[Decimal] = mapped_column(Numeric(18, 6), nullable=False)
+    unit_cost: Mapped[Decimal] = mapped_column(Numeric(18, 6), nullable=False)
+    extended_cost: Mapped[Decimal] = mapped_column(Numeric(18, 6), nullable=False)
+    direction: Mapped[str] = mapped_column(String(8), nullable=False)  # IN|OUT
+    correlation_id: Mapped[str | None] = mapped_column(String(64), nullable=True, index=True)
+    meta: Mapped[dict] = mapped_column(JSON, default=dict, nullable=False)
+
+Index("ix_valuation_txn_item_created", ValuationTxn.item_id, ValuationTxn.created_at)
+
+
+class ItemOnHand(Base):
+    """
+    Per-item on-hand quantity and value across all locations/lots/states.
+    Updated with an upsert in the same transaction as the balance deltas of
+    every receipt and issue (apply_movements); ledger repair resets qty to
+    SUM(wms_inventory_balance.qty) for the items it repairs.
+    """
+    __tablename__ = "inv_item_onhand"
+
+    item_id: Mapped[str] = mapped_column(ForeignKey("inv_item_master.id"), primary_key=True)
+    qty: Mapped[Decimal] = mapped_column(Numeric(18, 6), default=0, nullable=False)
+    value: Mapped[Decimal] = mapped_column(Numeric(18, 6), default=0, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
+
+
+class FifoLayer(Base, HasId, HasCreatedAt):
+    """
+    Open receipt quantity at its receipt cost. Issues consume layers oldest first;
+    exhausted layers (qty_remaining = 0) drop out of the open-layer indexes and are
+    moved to inv_fifo_layer_archive by services.wms.inventory_ops.fifo_layers.compact_exhausted_layers.
+    """
+    __tablename__ = "inv_fifo_layer"
+
+    item_id: Mapped[str] = mapped_column(ForeignKey("inv_item_master.id"), nullable=False)
+    location_id: Mapped[str | None] = mapped_column(ForeignKey("wms_location.id"), nullable=True)
+    qty_received: Mapped[Decimal] = mapped_column(Numeric(18, 6), nullable=False)
+    qty_remaining: Mapped[Decimal] = mapped_column(Numeric(18, 6), nullable=False)
+    unit_cost: Mapped[Decimal] = mapped_column(Numeric(18, 6), nullable=False)
+    correlation_id: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    exhausted_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    meta: Mapped[dict] = mapped_column(JSON, default=dict, nullable=False)
+
+# Partial indexes: only open layers are indexed, so a FIFO lookup reads the few live layers of an
+# item no matter how many receipts it has had.
+Index("ix_fifo_layer_open_loc", FifoLayer.item_id, FifoLayer.location_id, FifoLayer.created_at, FifoLayer.id,
+      postgresql_where=FifoLayer.qty_remaining > 0, sqlite_where=FifoLayer.qty_remaining > 0)
+Index("ix_fifo_layer_open_item", FifoLayer.item_id, FifoLayer.created_at, FifoLayer.id,
+      postgresql_where=FifoLayer.qty_remaining > 0, sqlite_where=FifoLayer.qty_remaining > 0)
+Index("ix_fifo_layer_exhausted", FifoLayer.exhausted_at,
+      postgresql_where=FifoLayer.exhausted_at.isnot(None), sqlite_where=FifoLayer.exhausted_at.isnot(None))
+
+
+class FifoLayerArchive(Base):
+    """
+    Exhausted FIFO layers moved out of inv_fifo_layer (kept for cost audit).
+    """
+    __tablename__ = "inv_fifo_layer_archive"
+
+    id: Mapped[str] = mapped_column(String(36), primary_key=True)
+    item_id: Mapped[str] = mapped_column(String(36), nullable=False, index=True)
+    location_id: Mapped[str | None] = mapped_column(String(36), nullable=True)
+    qty_received: Mapped[Decimal] = mapped_column(Numeric(18, 6), nullable=False)
+    unit_cost: Mapped[Decimal] = mapped_column(Numeric(18, 6), nullable=False)
+    correlation_id: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    meta: Mapped[dict] = mapped_column(JSON, default=dict, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    exhausted_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    archived_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
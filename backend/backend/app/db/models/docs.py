@@ -1,6 +1,6 @@
 from __future__ import annotations
 from sqlalchemy import String, DateTime, JSON, ForeignKey, Numeric, Index
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.orm import Mapped, mapped_column, relationship, synonym
 from datetime import datetime
 from decimal import Decimal
 
@@ -20,6 +20,7 @@ class ReceiptLine(Base, HasId, HasCreatedAt):
     qty: Mapped[Decimal] = mapped_column(Numeric(18,6), nullable=False)
     meta: Mapped[dict] = mapped_column(JSON, default=dict, nullable=False)
 
+    expected_qty = synonym("qty")  # tasking's name for the receipt line qty
     receipt: Mapped[Receipt] = relationship()
     item = relationship("app.db.models.inventory.InventoryItem")
 
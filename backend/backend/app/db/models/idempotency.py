@@ -0,0 +1,27 @@
+from __future__ import annotations
+from datetime import datetime
+from sqlalchemy import String, DateTime, JSON, Integer, LargeBinary, Index
+from sqlalchemy.orm import Mapped, mapped_column
+from app.db.base import Base
+from app.db.models.common import HasId, HasCreatedAt
+
+class IdempotencyRecord(Base, HasId, HasCreatedAt):
+    """First response for an Idempotency-Key (see app.core.idempotency).
+
+    key_hash = sha256(tenant | method | path | Idempotency-Key); the unique index on it
+    is what serializes duplicate requests across workers.
+    """
+    __tablename__ = "sys_idempotency_key"
+    tenant_id: Mapped[str] = mapped_column(String(64), default="default", index=True, nullable=False)
+    key_hash: Mapped[str] = mapped_column(String(64), unique=True, nullable=False)
+    idempotency_key: Mapped[str] = mapped_column(String(255), nullable=False)
+    method: Mapped[str] = mapped_column(String(8), nullable=False)
+    path: Mapped[str] = mapped_column(String(512), nullable=False)
+    request_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    status: Mapped[str] = mapped_column(String(16), default="IN_PROGRESS", nullable=False)  # IN_PROGRESS|COMPLETED
+    response_status: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    response_headers: Mapped[list] = mapped_column(JSON, default=list, nullable=False)  # [[name, value], ...]
+    response_body: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True)
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+Index("ix_idempotency_expires", IdempotencyRecord.expires_at)
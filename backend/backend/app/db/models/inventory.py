@@ -10,8 +10,8 @@ from app.db.base import Base
 from app.db.models.common import HasId, HasCreatedAt
 from datetime import datetime, date
 from decimal import Decimal
-from sqlalchemy import String, DateTime, Date, Integer, Numeric, ForeignKey, JSON, Boolean, Index, Text, CheckConstraint
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import String, DateTime, Date, Integer, Numeric, ForeignKey, JSON, Boolean, Index, Text, CheckConstraint, func, literal_column
+from sqlalchemy.orm import Mapped, mapped_column, relationship, synonym
 
 # ============= ITEM MASTER (Extended) =============
 
@@ -25,6 +25,7 @@ class InventoryItem(Base, HasId, HasCreatedAt):
     # Link to WMS Item
     wms_item_id: Mapped[str] = mapped_column(String(64), unique=True, nullable=False, index=True)
     item_code: Mapped[str] = mapped_column(String(64), unique=True, nullable=False, index=True)
+    sku = synonym("item_code")  # the WMS services' name for the item code
     description: Mapped[str] = mapped_column(String(512), nullable=False)
     
     # Classification
@@ -159,7 +160,9 @@ class InventoryValuation(Base, HasId, HasCreatedAt):
     
     valuation_date: Mapped[date] = mapped_column(Date, nullable=False, index=True)
     snapshot_type: Mapped[str] = mapped_column(String(32), nullable=False)
-    # MONTH_END|QUARTER_END|YEAR_END|PHYSICAL_COUNT|AD_HOC
+    # MONTH_END|QUARTER_END|YEAR_END|PHYSICAL_COUNT|AD_HOC|BALANCE
+    # Exact ledger cut-off: the snapshot includes wms_inventory_txn rows with created_at <= as_of
+    as_of: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True, index=True)
     
     # Scope
     site_id: Mapped[str | None] = mapped_column(String(64), nullable=True, index=True)
@@ -219,6 +222,26 @@ class InventoryValuationLine(Base, HasId, HasCreatedAt):
     item: Mapped[InventoryItem] = relationship()
 
 
+class InventoryBalanceSnapshotLine(Base, HasId):
+    """
+    Compact per-balance-key quantity at InventoryValuation.as_of
+    Base for as-of queries (snapshot + later txn deltas)
+    """
+    __tablename__ = "inv_balance_snapshot_line"
+
+    valuation_id: Mapped[str] = mapped_column(ForeignKey("inv_valuation_snapshot.id", ondelete="CASCADE"), nullable=False)
+    item_id: Mapped[str] = mapped_column(String(36), nullable=False)
+    location_id: Mapped[str] = mapped_column(String(36), nullable=False)
+    lot_id: Mapped[str | None] = mapped_column(String(36), nullable=True)
+    handling_unit_id: Mapped[str | None] = mapped_column(String(36), nullable=True)
+    state: Mapped[str] = mapped_column(String(24), nullable=False)
+    qty: Mapped[Decimal] = mapped_column(Numeric(18, 6), nullable=False)
+
+    __table_args__ = (
+        Index("ix_balance_snapshot_line_item", "valuation_id", "item_id"),
+    )
+
+
 # ============= ABC ANALYSIS =============
 
 class ABCAnalysis(Base, HasId, HasCreatedAt):
@@ -318,6 +341,7 @@ class SlowMovingItem(Base, HasId, HasCreatedAt):
     
     analysis_id: Mapped[str] = mapped_column(ForeignKey("inv_slow_moving_analysis.id"), nullable=False, index=True)
     item_id: Mapped[str] = mapped_column(ForeignKey("inv_item_master.id"), nullable=False, index=True)
+    location_id: Mapped[str | None] = mapped_column(String(64), nullable=True, index=True)
     
     # Current State
     on_hand_qty: Mapped[Decimal] = mapped_column(Numeric(18, 6), nullable=False)
@@ -351,6 +375,21 @@ class SlowMovingItem(Base, HasId, HasCreatedAt):
     item: Mapped[InventoryItem] = relationship()
 
 
+class ItemLocationActivity(Base):
+    """
+    Last receipt / issue / movement per item and location (last-movement index)
+    Rebuilt by the slow-moving full run, kept current from InventoryChanged events in between
+    """
+    __tablename__ = "inv_item_location_activity"
+
+    item_id: Mapped[str] = mapped_column(String(36), primary_key=True)
+    location_id: Mapped[str] = mapped_column(String(36), primary_key=True)
+    last_receipt_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_issue_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_movement_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
+
+
 # ============= INVENTORY ADJUSTMENT =============
 
 class InventoryAdjustment(Base, HasId, HasCreatedAt):
@@ -470,6 +509,14 @@ class StockStatusSummary(Base, HasId, HasCreatedAt):
     
     item: Mapped[InventoryItem] = relationship()
 
+# One row per item and site, maintained from balance deltas by services.inventory.stock_status
+# (site_id coalesced to '' so locations without a site share one row).
+STOCK_STATUS_KEY = (
+    StockStatusSummary.item_id,
+    func.coalesce(StockStatusSummary.site_id, literal_column("''")),
+)
+Index("ux_stock_status_item_site", *STOCK_STATUS_KEY, unique=True)
+
 
 # Add indexes and constraints
 __table_args__ = (
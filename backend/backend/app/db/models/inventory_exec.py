@@ -2,8 +2,9 @@ from __future__ import annotations
 from datetime import datetime, date
 from typing import Optional
 from decimal import Decimal
-from sqlalchemy import String, DateTime, JSON, ForeignKey, Numeric, Index, Date
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import (String, DateTime, JSON, ForeignKey, Numeric, Index, Date, Float, Integer, func, literal_column,
+                        Column, DDL, MetaData, Table, event)
+from sqlalchemy.orm import Mapped, mapped_column, relationship, synonym
 
 from app.db.base import Base
 from app.db.models.common import HasId, HasCreatedAt
@@ -28,6 +29,16 @@ class WMSLocation(Base, HasId, HasCreatedAt):
     site_id: Mapped[str | None] = mapped_column(ForeignKey("inv_site.id"), nullable=True, index=True)
     code: Mapped[str] = mapped_column(String(64), unique=True, nullable=False, index=True)
     type: Mapped[str] = mapped_column(String(32), default="BIN", nullable=False)
+    # Layout, set from the code (or given explicitly) when the location is created or imported;
+    # services.wms.inventory_ops.layout builds the travel-distance matrix from these. x / y are
+    # optional floor coordinates in meters, otherwise derived from zone / aisle / bay.
+    zone: Mapped[str | None] = mapped_column(String(32), nullable=True, index=True)
+    aisle: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    bay: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    level: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    pos: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    x: Mapped[float | None] = mapped_column(Float, nullable=True)
+    y: Mapped[float | None] = mapped_column(Float, nullable=True)
     meta: Mapped[dict] = mapped_column(JSON, default=dict, nullable=False)
 
 class WMSLot(Base, HasId, HasCreatedAt):
@@ -50,6 +61,8 @@ class WMSHandlingUnit(Base, HasId, HasCreatedAt):
     code: Mapped[str] = mapped_column(String(64), unique=True, nullable=False, index=True)
     meta: Mapped[dict] = mapped_column(JSON, default=dict, nullable=False)
 
+    lpn = synonym("code")  # license plate number, as the WMS services call it
+
 class InventoryBalance(Base, HasId, HasCreatedAt):
     __tablename__ = "wms_inventory_balance"
     item_id: Mapped[str] = mapped_column(ForeignKey("inv_item_master.id"), nullable=False, index=True)
@@ -59,13 +72,104 @@ class InventoryBalance(Base, HasId, HasCreatedAt):
     handling_unit_id: Mapped[str | None] = mapped_column(ForeignKey("wms_handling_unit.id"), nullable=True, index=True)
     state: Mapped[str] = mapped_column(String(24), default="AVAILABLE", nullable=False, index=True)
     qty: Mapped[Decimal] = mapped_column(Numeric(18,6), default=0, nullable=False)
+    # Copy of the lot's expiry_date, set when the balance row is created (FEFO without a lot join)
+    expiry_date: Mapped[Optional[date]] = mapped_column(Date, nullable=True)
     meta: Mapped[dict] = mapped_column(JSON, default=dict, nullable=False)
 
 Index("ix_balance_item_loc_state", InventoryBalance.item_id, InventoryBalance.location_id, InventoryBalance.state)
+Index("ix_balance_item_state_expiry", InventoryBalance.item_id, InventoryBalance.state, InventoryBalance.expiry_date)
+
+# One row per balance key. lot/HU are nullable, so they are coalesced to '' for uniqueness
+# (plain NULLs never conflict); the same expressions are the ON CONFLICT target in
+# services.wms.inventory_ops.service._apply_balances.
+BALANCE_KEY = (
+    InventoryBalance.item_id,
+    InventoryBalance.location_id,
+    func.coalesce(InventoryBalance.lot_id, literal_column("''")),
+    func.coalesce(InventoryBalance.handling_unit_id, literal_column("''")),
+    InventoryBalance.state,
+)
+Index("ux_balance_key", *BALANCE_KEY, unique=True)
+
+# Reservations are rows, not balance states (services.wms.inventory_ops.reservation): one per
+# demand line and balance it draws on. wms_balance_reserved keeps the running total per balance,
+# so reserving never writes (or locks) the balance row itself.
+class InventoryReservation(Base, HasId, HasCreatedAt):
+    __tablename__ = "wms_inventory_reservation"
+    demand_id: Mapped[str | None] = mapped_column(String(64), nullable=True, index=True)  # e.g. outbound order id
+    demand_line_id: Mapped[str] = mapped_column(String(64), nullable=False, index=True)
+    balance_id: Mapped[str] = mapped_column(ForeignKey("wms_inventory_balance.id"), nullable=False, index=True)
+    item_id: Mapped[str] = mapped_column(ForeignKey("inv_item_master.id"), nullable=False, index=True)
+    location_id: Mapped[str] = mapped_column(ForeignKey("wms_location.id"), nullable=False, index=True)
+    qty: Mapped[Decimal] = mapped_column(Numeric(18,6), nullable=False)
+    correlation_id: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    actor: Mapped[str] = mapped_column(String(128), nullable=False)
+    reason: Mapped[str | None] = mapped_column(String(256), nullable=True)
+
+Index("ux_reservation_line_balance", InventoryReservation.demand_line_id, InventoryReservation.balance_id, unique=True)
+
+class BalanceReserved(Base):
+    __tablename__ = "wms_balance_reserved"
+    balance_id: Mapped[str] = mapped_column(ForeignKey("wms_inventory_balance.id"), primary_key=True)
+    qty: Mapped[Decimal] = mapped_column(Numeric(18,6), default=0, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
+
+# Unreserved qty of a balance row; select from InventoryBalance outer-joined to BalanceReserved.
+AVAILABLE_QTY = InventoryBalance.qty - func.coalesce(BalanceReserved.qty, 0)
+
+# What a location holds, in any state: units plus cube / weight from the item master dimensions.
+# Maintained from the same balance deltas as inv_stock_status (services.wms.inventory_ops.occupancy),
+# read by putaway instead of summing balances per bin.
+class LocationOccupancy(Base):
+    __tablename__ = "wms_location_occupancy"
+    location_id: Mapped[str] = mapped_column(ForeignKey("wms_location.id"), primary_key=True)
+    units: Mapped[Decimal] = mapped_column(Numeric(18,6), default=0, nullable=False)
+    volume: Mapped[Decimal] = mapped_column(Numeric(18,6), default=0, nullable=False)
+    weight: Mapped[Decimal] = mapped_column(Numeric(18,6), default=0, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
+
+# Allocation candidates (services.wms.inventory_ops.allocation_service): unreserved AVAILABLE stock
+# in BIN locations with everything the strategies sort on, pre-joined. received_at is the oldest
+# open FIFO layer at the location (ix_fifo_layer_open_loc), else when the balance row appeared.
+# A view, not a table: it is declared on its own MetaData so create_all does not build it as a
+# table, and created by the DDL hooks below (and by migration 0019 on migrated databases).
+ALLOCATION_CANDIDATE_SQL = """
+SELECT b.id AS balance_id, b.item_id, b.location_id, b.lot_id, b.handling_unit_id, b.expiry_date,
+       b.created_at,
+       coalesce((SELECT min(f.created_at) FROM inv_fifo_layer f
+                 WHERE f.item_id = b.item_id AND f.location_id = b.location_id AND f.qty_remaining > 0),
+                b.created_at) AS received_at,
+       b.qty - coalesce(r.qty, 0) AS available_qty
+FROM wms_inventory_balance b
+JOIN wms_location l ON l.id = b.location_id AND l.type = 'BIN'
+LEFT JOIN wms_balance_reserved r ON r.balance_id = b.id
+WHERE b.state = 'AVAILABLE' AND b.qty - coalesce(r.qty, 0) > 0
+"""
+
+allocation_candidate = Table(
+    "wms_allocation_candidate", MetaData(),
+    Column("balance_id", String(36), primary_key=True),
+    Column("item_id", String(36)),
+    Column("location_id", String(36)),
+    Column("lot_id", String(36)),
+    Column("handling_unit_id", String(36)),
+    Column("expiry_date", Date),
+    Column("created_at", DateTime(timezone=True)),
+    Column("received_at", DateTime(timezone=True)),
+    Column("available_qty", Numeric(18,6)),
+)
+
+event.listen(Base.metadata, "after_create",
+             DDL(f"CREATE OR REPLACE VIEW wms_allocation_candidate AS {ALLOCATION_CANDIDATE_SQL}").execute_if(dialect="postgresql"))
+event.listen(Base.metadata, "after_create",
+             DDL(f"CREATE VIEW IF NOT EXISTS wms_allocation_candidate AS {ALLOCATION_CANDIDATE_SQL}").execute_if(dialect="sqlite"))
+event.listen(Base.metadata, "before_drop", DDL("DROP VIEW IF EXISTS wms_allocation_candidate"))
 
 class InventoryTxn(Base, HasId, HasCreatedAt):
     __tablename__ = "wms_inventory_txn"
     correlation_id: Mapped[str] = mapped_column(String(64), nullable=False, index=True)
+    # sha256 of the movement identity (see services.wms.inventory_ops.service.movement_key)
+    idempotency_key: Mapped[str | None] = mapped_column(String(64), nullable=True)
     txn_type: Mapped[str] = mapped_column(String(32), default="MOVE", nullable=False, index=True)  # MOVE|RECEIPT|ISSUE_TO_WIP|RECEIPT_FROM_WIP|ADJUST
     item_id: Mapped[str] = mapped_column(ForeignKey("inv_item_master.id"), nullable=False, index=True)
     lot_id: Mapped[str | None] = mapped_column(ForeignKey("wms_lot.id"), nullable=True, index=True)
@@ -83,6 +187,10 @@ class InventoryTxn(Base, HasId, HasCreatedAt):
     meta: Mapped[dict] = mapped_column(JSON, default=dict, nullable=False)
 
 Index("ix_txn_corr_item", InventoryTxn.correlation_id, InventoryTxn.item_id)
+# Time-range scans for as-of queries (services.inventory.asof)
+Index("ix_txn_created", InventoryTxn.created_at)
+Index("ix_txn_item_created", InventoryTxn.item_id, InventoryTxn.created_at)
+Index("ux_txn_idempotency_key", InventoryTxn.idempotency_key, unique=True)
 
 
 class InventorySerial(Base, HasId, HasCreatedAt):
@@ -130,3 +238,9 @@ class WIPTxn(Base, HasId, HasCreatedAt):
     meta: Mapped[dict] = mapped_column(JSON, default=dict, nullable=False)
 
 Index("ix_wip_txn_po_type", WIPTxn.production_order_id, WIPTxn.txn_type)
+
+# Names the WMS services (services/wms/*) use for the execution tables.
+Item = InventoryItem
+Location = WMSLocation
+Lot = WMSLot
+HandlingUnit = WMSHandlingUnit
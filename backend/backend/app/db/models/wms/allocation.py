@@ -10,6 +10,7 @@ class Allocation(Base, HasId, HasCreatedAt):
     order_line_id: Mapped[str] = mapped_column(String(36), nullable=False, index=True)
     item_id: Mapped[str] = mapped_column(ForeignKey("inv_item_master.id"), nullable=False, index=True)
     location_id: Mapped[str] = mapped_column(ForeignKey("wms_location.id"), nullable=False, index=True)
+    lot_id: Mapped[str | None] = mapped_column(ForeignKey("wms_lot.id"), nullable=True, index=True)
     handling_unit_id: Mapped[str | None] = mapped_column(ForeignKey("wms_handling_unit.id"), nullable=True, index=True)
     qty: Mapped[float] = mapped_column(Numeric(18,6), nullable=False)
 
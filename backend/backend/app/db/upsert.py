@@ -0,0 +1,18 @@
+from __future__ import annotations
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql, sqlite
+
+# Dialect-aware INSERT for ON CONFLICT statements (Postgres in production, SQLite in dev/tests;
+# both expose the same on_conflict_do_nothing / on_conflict_do_update API).
+_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+def insert_for(db: Session, model):
+    dialect = db.get_bind().dialect.name
+    try:
+        return _INSERTS[dialect](model)
+    except KeyError:
+        raise NotImplementedError(f"ON CONFLICT inserts are not supported on {dialect}") from None
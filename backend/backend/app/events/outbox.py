@@ -32,3 +32,13 @@ class OutboxEvent(Base, HasId, HasCreatedAt):
 
 Index("ix_outbox_topic_created", OutboxEvent.topic, OutboxEvent.created_at)
 Index("ix_outbox_delivery", OutboxEvent.delivered, OutboxEvent.available_at)
+
+
+class OutboxCursor(Base):
+    """Read position of an in-process consumer of outbox events (e.g. inventory activity index)."""
+
+    __tablename__ = "outbox_cursor"
+
+    consumer: Mapped[str] = mapped_column(String(64), primary_key=True)
+    last_created_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
@@ -14,6 +14,8 @@ from app.core.security import get_principal
 from app.db.models.system_modules import SysModule, SysTenantModule
 from app.core.module_runtime import get_app
 from app.core.module_loader import mount_module
+from app.core.module_state import invalidate as invalidate_module_state
+from app.db.models.site import Site, SITE_TYPE
 
 router = APIRouter(prefix="/admin/modules", tags=["admin_modules"])
 
@@ -174,6 +176,7 @@ def enable_module(module_key: str, payload: dict | None = None, db: Session = De
         tr.enabled_by = principal.username
 
     db.commit()
+    invalidate_module_state(tenant_id)
 
     # Hot-load: mount the module's router into the running app immediately.
     app = get_app()
@@ -201,6 +204,7 @@ def disable_module(module_key: str, payload: dict | None = None, db: Session = D
     tr.enabled_at = datetime.utcnow()
     tr.enabled_by = principal.username
     db.commit()
+    invalidate_module_state(tenant_id)
     return {"ok": True, "module_key": module_key, "enabled": False}
 
 @router.post("/{module_key}/seed/{seed_key}")
@@ -219,6 +223,7 @@ def seed_module(module_key: str, seed_key: str, db: Session = Depends(get_db), p
     # Only implement a safe, deterministic demo seed.
     if module_key == "wms" and seed_key == "default_locations":
         from app.db.models.inventory_exec import WMSLocation
+        from services.wms.inventory_ops.layout import set_layout
         defaults = [
             ("RECV", "RECEIVE"),
             ("STAGE", "STAGING"),
@@ -230,7 +235,7 @@ def seed_module(module_key: str, seed_key: str, db: Session = Depends(get_db), p
         for code, typ in defaults:
             existing = db.query(WMSLocation).filter(WMSLocation.code == code).first()
             if not existing:
-                db.add(WMSLocation(code=code, type=typ, meta={}))
+                db.add(set_layout(WMSLocation(code=code, type=typ, meta={})))
                 created += 1
         db.commit()
         return {"ok": True, "seeded": seed_key, "created": created}
@@ -334,7 +339,6 @@ def upgrade_module(module_key: str, payload: dict | None = None, db: Session = D
         )
     except Exception as e:
         raise HTTPException(500, f"Alembic upgrade failed: {e}")
-from app.db.models.site import Site, SITE_TYPE
 
     mod.installed_version = mod.version
     mod.upgraded_at = datetime.utcnow()
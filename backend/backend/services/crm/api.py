@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from app.db.session import get_db
+from app.db.session import get_db, get_read_db
 from app.core.security import get_principal
 from app.db.models.security_audit import AuditLog
 from app.db.models.crm import CrmAccount, CrmContact, CrmLead, CrmPipeline, CrmStage, CrmOpportunity, CrmTicket, CrmWorkflowRule
@@ -28,7 +28,7 @@ def create_lead(payload: dict, db: Session = Depends(get_db), p=Depends(get_prin
     return {"id": l.id}
 
 @router.get("/leads")
-def list_leads(db: Session = Depends(get_db), p=Depends(get_principal)):
+def list_leads(db: Session = Depends(get_read_db), p=Depends(get_principal)):
     rows = db.query(CrmLead).order_by(CrmLead.created_at.desc()).limit(200).all()
     return [{"id": l.id, "status": l.status, "source": l.source, "score": l.score, "owner": l.owner, "data": l.data} for l in rows]
 
@@ -65,12 +65,12 @@ def create_account(payload: dict, db: Session = Depends(get_db), p=Depends(get_p
     return {"id": a.id, "name": a.name}
 
 @router.get("/accounts")
-def list_accounts(db: Session = Depends(get_db), p=Depends(get_principal)):
+def list_accounts(db: Session = Depends(get_read_db), p=Depends(get_principal)):
     rows = db.query(CrmAccount).order_by(CrmAccount.created_at.desc()).limit(200).all()
     return [{"id": a.id, "name": a.name, "industry": a.industry, "status": a.status, "owner": a.owner} for a in rows]
 
 @router.get("/accounts/{account_id}")
-def get_account(account_id: str, db: Session = Depends(get_db), p=Depends(get_principal)):
+def get_account(account_id: str, db: Session = Depends(get_read_db), p=Depends(get_principal)):
     a = db.query(CrmAccount).filter(CrmAccount.id == account_id).first()
     if not a:
         raise HTTPException(404, "Account not found")
@@ -94,7 +94,7 @@ def create_contact(payload: dict, db: Session = Depends(get_db), p=Depends(get_p
     return {"id": c.id}
 
 @router.get("/contacts")
-def list_contacts(db: Session = Depends(get_db), p=Depends(get_principal)):
+def list_contacts(db: Session = Depends(get_read_db), p=Depends(get_principal)):
     rows = db.query(CrmContact).order_by(CrmContact.created_at.desc()).limit(200).all()
     return [{
         "id": c.id,
@@ -107,12 +107,12 @@ def list_contacts(db: Session = Depends(get_db), p=Depends(get_principal)):
 
 # Pipeline / opportunities
 @router.get("/pipelines")
-def list_pipelines(db: Session = Depends(get_db), p=Depends(get_principal)):
+def list_pipelines(db: Session = Depends(get_read_db), p=Depends(get_principal)):
     pipes = db.query(CrmPipeline).order_by(CrmPipeline.name.asc()).all()
     return [{"id": x.id, "name": x.name} for x in pipes]
 
 @router.get("/pipelines/{pipeline_id}/stages")
-def list_stages(pipeline_id: str, db: Session = Depends(get_db), p=Depends(get_principal)):
+def list_stages(pipeline_id: str, db: Session = Depends(get_read_db), p=Depends(get_principal)):
     st = db.query(CrmStage).filter(CrmStage.pipeline_id == pipeline_id).order_by(CrmStage.order.asc()).all()
     return [{"id": s.id, "name": s.name, "order": s.order} for s in st]
 
@@ -143,7 +143,7 @@ def create_opportunity(payload: dict, db: Session = Depends(get_db), p=Depends(g
     return {"id": o.id}
 
 @router.get("/pipelines/{pipeline_id}/board")
-def pipeline_board(pipeline_id: str, db: Session = Depends(get_db), p=Depends(get_principal)):
+def pipeline_board(pipeline_id: str, db: Session = Depends(get_read_db), p=Depends(get_principal)):
     stages, by_stage = dashboard_pipeline(db, pipeline_id)
     return {
         "stages": [{"id": s.id, "name": s.name, "order": s.order} for s in stages],
@@ -180,7 +180,7 @@ def create_rule(payload: dict, db: Session = Depends(get_db), p=Depends(get_prin
     return {"id": r.id}
 
 @router.get("/workflow-rules")
-def list_rules(db: Session = Depends(get_db), p=Depends(get_principal)):
+def list_rules(db: Session = Depends(get_read_db), p=Depends(get_principal)):
     rows = db.query(CrmWorkflowRule).order_by(CrmWorkflowRule.created_at.desc()).limit(200).all()
     return [{"id": r.id, "name": r.name, "trigger": r.trigger, "is_enabled": bool(r.is_enabled), "condition": r.condition, "action": r.action} for r in rows]
 # Tickets
@@ -202,7 +202,7 @@ def create_ticket(payload: dict, db: Session = Depends(get_db), p=Depends(get_pr
     return {"id": t.id}
 
 @router.get("/tickets")
-def list_tickets(db: Session = Depends(get_db), p=Depends(get_principal)):
+def list_tickets(db: Session = Depends(get_read_db), p=Depends(get_principal)):
     rows = db.query(CrmTicket).order_by(CrmTicket.created_at.desc()).limit(200).all()
     return [{"id": t.id, "subject": t.subject, "status": t.status, "severity": t.severity, "account_id": t.account_id} for t in rows]
 
@@ -233,7 +233,7 @@ def create_activity(payload: dict, db: Session = Depends(get_db), p=Depends(get_
     return {"id": act.id}
 
 @router.get("/activities")
-def get_activities(entity_type: str, entity_id: str, db: Session = Depends(get_db), p=Depends(get_principal)):
+def get_activities(entity_type: str, entity_id: str, db: Session = Depends(get_read_db), p=Depends(get_principal)):
     acts = list_activities(db, entity_type, entity_id)
     return [{
         "id": a.id,
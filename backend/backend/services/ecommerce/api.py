@@ -6,13 +6,15 @@ REST API endpoints for e-commerce functionality.
 
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
+from sqlalchemy import desc, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from decimal import Decimal
 from datetime import datetime, timedelta
 import secrets
 
 from app.db.session import get_db
+from app.db.async_session import get_async_db
 from app.core.security import get_principal
 
 from app.db.models.ecommerce import (
@@ -34,19 +36,19 @@ def health():
 # ============================================================================
 
 @router.get("/categories")
-def list_categories(
+async def list_categories(
     parent_id: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """List product categories"""
-    query = db.query(EcomCategory).filter(EcomCategory.is_active == True)
+    query = select(EcomCategory).where(EcomCategory.is_active == True)
     
     if parent_id:
-        query = query.filter(EcomCategory.parent_id == parent_id)
+        query = query.where(EcomCategory.parent_id == parent_id)
     else:
-        query = query.filter(EcomCategory.parent_id == None)
+        query = query.where(EcomCategory.parent_id == None)
     
-    categories = query.order_by(EcomCategory.sort_order).all()
+    categories = (await db.scalars(query.order_by(EcomCategory.sort_order))).all()
     
     return [{
         "id": c.id,
@@ -59,12 +61,12 @@ def list_categories(
 
 
 @router.get("/categories/{slug}")
-def get_category(slug: str, db: Session = Depends(get_db)):
+async def get_category(slug: str, db: AsyncSession = Depends(get_async_db)):
     """Get category by slug"""
-    category = db.query(EcomCategory).filter(
+    category = await db.scalar(select(EcomCategory).where(
         EcomCategory.slug == slug,
         EcomCategory.is_active == True
-    ).first()
+    ).limit(1))
     
     if not category:
         raise HTTPException(404, "Category not found")
@@ -81,7 +83,7 @@ def get_category(slug: str, db: Session = Depends(get_db)):
 
 
 @router.get("/products")
-def list_products(
+async def list_products(
     category_id: Optional[str] = None,
     search: Optional[str] = None,
     min_price: Optional[float] = None,
@@ -90,31 +92,34 @@ def list_products(
     sort: str = "newest",  # newest, price_asc, price_desc, popular
     page: int = Query(1, ge=1),
     page_size: int = Query(24, ge=1, le=100),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """List products with filtering and pagination"""
-    query = db.query(EcomProduct).filter(EcomProduct.is_active == True)
+    query = select(EcomProduct).where(EcomProduct.is_active == True)
     
     # Filters
     if category_id:
-        query = query.filter(EcomProduct.category_id == category_id)
+        query = query.where(EcomProduct.category_id == category_id)
     
     if search:
         search_term = f"%{search}%"
-        query = query.filter(
+        query = query.where(
             (EcomProduct.name.ilike(search_term)) |
             (EcomProduct.short_description.ilike(search_term)) |
             (EcomProduct.sku.ilike(search_term))
         )
     
     if min_price:
-        query = query.filter(EcomProduct.price >= min_price)
+        query = query.where(EcomProduct.price >= min_price)
     
     if max_price:
-        query = query.filter(EcomProduct.price <= max_price)
+        query = query.where(EcomProduct.price <= max_price)
     
     if featured is not None:
-        query = query.filter(EcomProduct.is_featured == featured)
+        query = query.where(EcomProduct.is_featured == featured)
+    
+    # Total count
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
     
     # Sorting
     if sort == "price_asc":
@@ -126,12 +131,9 @@ def list_products(
     else:  # newest
         query = query.order_by(EcomProduct.created_at.desc())
     
-    # Total count
-    total = query.count()
-    
     # Pagination
     offset = (page - 1) * page_size
-    products = query.offset(offset).limit(page_size).all()
+    products = (await db.scalars(query.offset(offset).limit(page_size))).all()
     
     return {
         "products": [{
@@ -155,37 +157,42 @@ def list_products(
 
 
 @router.get("/products/{slug}")
-def get_product(slug: str, db: Session = Depends(get_db)):
+async def get_product(slug: str, db: AsyncSession = Depends(get_async_db)):
     """Get product details by slug"""
-    product = db.query(EcomProduct).filter(
+    product = await db.scalar(select(EcomProduct).where(
         EcomProduct.slug == slug,
         EcomProduct.is_active == True
-    ).first()
+    ).limit(1))
     
     if not product:
         raise HTTPException(404, "Product not found")
     
-    # Increment view count
-    product.view_count += 1
-    db.commit()
-    
     # Get variants
-    variants = db.query(EcomProductVariant).filter(
+    variants = (await db.scalars(select(EcomProductVariant).where(
         EcomProductVariant.product_id == product.id,
         EcomProductVariant.is_active == True
-    ).order_by(EcomProductVariant.sort_order).all()
+    ).order_by(EcomProductVariant.sort_order))).all()
     
     # Get reviews
-    reviews = db.query(EcomProductReview).filter(
+    reviews = (await db.scalars(select(EcomProductReview).where(
         EcomProductReview.product_id == product.id,
         EcomProductReview.is_approved == True
-    ).order_by(desc(EcomProductReview.created_at)).limit(10).all()
+    ).order_by(desc(EcomProductReview.created_at)).limit(10))).all()
     
     # Average rating
-    avg_rating = db.query(func.avg(EcomProductReview.rating)).filter(
+    avg_rating = await db.scalar(select(func.avg(EcomProductReview.rating)).where(
         EcomProductReview.product_id == product.id,
         EcomProductReview.is_approved == True
-    ).scalar() or 0
+    )) or 0
+    
+    # Increment view count in-database (no read-modify-write race between concurrent views)
+    view_count = await db.scalar(
+        update(EcomProduct)
+        .where(EcomProduct.id == product.id)
+        .values(view_count=EcomProduct.view_count + 1)
+        .returning(EcomProduct.view_count)
+    )
+    await db.commit()
     
     return {
         "id": product.id,
@@ -226,7 +233,7 @@ def get_product(slug: str, db: Session = Depends(get_db)):
                 "helpful_count": r.helpful_count
             } for r in reviews]
         },
-        "view_count": product.view_count,
+        "view_count": view_count,
         "sales_count": product.sales_count
     }
 
@@ -0,0 +1,130 @@
+from __future__ import annotations
+import calendar
+from datetime import date, datetime
+from decimal import Decimal
+import numpy as np
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.orm import Session
+from app.db.models.common import uuid4_str
+from app.db.models.costing import ItemCost
+from app.db.models.inventory import ABCAnalysis, ABCAnalysisLine, InventoryItem
+from app.db.models.inventory_exec import InventoryTxn
+
+# ABC classification over issue history (inv_abc_analysis / inv_abc_analysis_line).
+#
+# Usage per item (qty and value of txns that leave stock) is aggregated in the database and
+# streamed back one row per item; ranking, cumulative Pareto percentages and the A/B/C cut are
+# NumPy array operations. An item is A while the share of value ranked before it is below
+# a_threshold_percentage (so the item that crosses the threshold is still A), B likewise up to
+# b_threshold_percentage, C after that. Items without usage in the window are C.
+CRITERIA = ("VALUE", "USAGE")
+_FETCH_ROWS = 10_000
+_WRITE_ROWS = 1000
+
+def months_ago(d: date, months: int) -> date:
+    y, m = divmod(d.year * 12 + d.month - 1 - months, 12)
+    return date(y, m + 1, min(d.day, calendar.monthrange(y, m + 1)[1]))
+
+def _usage_columns(db: Session, start: date, end: date):
+    T = InventoryTxn
+    # Value: the txn's own extended cost, else qty at the item's current average cost
+    unit = func.coalesce(ItemCost.avg_cost, InventoryItem.average_cost, 0)
+    usage = (select(T.item_id,
+                    func.sum(T.qty).label("qty"),
+                    func.sum(func.coalesce(T.ext_cost, T.qty * unit)).label("value"))
+             .join(InventoryItem, InventoryItem.id == T.item_id)
+             .outerjoin(ItemCost, ItemCost.item_id == T.item_id)
+             .where(T.from_location_id.isnot(None), T.to_location_id.is_(None),
+                    T.created_at >= start, T.created_at < end)
+             .group_by(T.item_id)
+             .subquery())
+    result = db.execute(
+        select(InventoryItem.id, InventoryItem.abc_class,
+               func.coalesce(usage.c.qty, 0), func.coalesce(usage.c.value, 0))
+        .outerjoin(usage, usage.c.item_id == InventoryItem.id)
+        .where(InventoryItem.is_active == True)  # noqa: E712
+        .execution_options(stream_results=True)
+    )
+    ids, prev, qty, value = [], [], [], []
+    for chunk in result.partitions(_FETCH_ROWS):
+        for item_id, abc, q, v in chunk:
+            ids.append(item_id)
+            prev.append(abc)
+            qty.append(float(q))
+            value.append(float(v))
+    return ids, prev, np.array(qty, dtype=np.float64), np.array(value, dtype=np.float64)
+
+def classify(metric: np.ndarray, a_threshold: float, b_threshold: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns (order, cumulative %, class) with order = indexes by metric desc."""
+    order = np.argsort(-metric, kind="stable")
+    ranked = metric[order]
+    total = ranked.sum()
+    cum = np.cumsum(ranked)
+    cum_pct = cum / total * 100 if total > 0 else np.full(len(ranked), 100.0)
+    before = (cum - ranked) / total * 100 if total > 0 else np.full(len(ranked), 100.0)
+    cls = np.where(ranked <= 0, "C", np.where(before < a_threshold, "A", np.where(before < b_threshold, "B", "C")))
+    return order, np.minimum(np.round(cum_pct, 2), 100.0), cls
+
+def run_abc_analysis(db: Session, *, criteria: str = "VALUE", period_months: int = 12,
+                     a_threshold: float = 80, b_threshold: float = 95, apply: bool = False,
+                     actor: str = "system", analysis_date: date | None = None) -> ABCAnalysis:
+    if criteria not in CRITERIA:
+        raise ValueError(f"criteria must be one of {', '.join(CRITERIA)}")
+    if not 0 < a_threshold < b_threshold <= 100:
+        raise ValueError("thresholds must satisfy 0 < a < b <= 100")
+    analysis_date = analysis_date or date.today()
+    end = datetime.combine(analysis_date, datetime.max.time())
+    start = months_ago(analysis_date, period_months)
+
+    ids, prev, qty, value = _usage_columns(db, start, end)
+    order, cum_pct, cls = classify(value if criteria == "VALUE" else qty, a_threshold, b_threshold)
+    counts = {c: int((cls == c).sum()) for c in "ABC"}
+
+    analysis = ABCAnalysis(
+        analysis_date=analysis_date,
+        analysis_period_months=period_months,
+        criteria=criteria,
+        a_threshold_percentage=Decimal(str(a_threshold)),
+        b_threshold_percentage=Decimal(str(b_threshold)),
+        total_items_analyzed=len(ids),
+        a_items_count=counts["A"],
+        b_items_count=counts["B"],
+        c_items_count=counts["C"],
+        performed_by=actor,
+        meta={"window_start": start.isoformat()},
+    )
+    db.add(analysis)
+    db.flush()
+
+    now = datetime.utcnow()
+    rows = [{
+        "id": uuid4_str(), "created_at": now, "analysis_id": analysis.id, "item_id": ids[i],
+        "total_value": round(v, 2), "total_quantity": q, "rank": rank, "cumulative_percentage": p,
+        "abc_class": c, "previous_abc_class": prev[i],
+    } for rank, (i, v, q, p, c) in enumerate(zip(order.tolist(), value[order].tolist(), qty[order].tolist(),
+                                                 cum_pct.tolist(), cls.tolist()), start=1)]
+    for i in range(0, len(rows), _WRITE_ROWS):
+        db.execute(insert(ABCAnalysisLine), rows[i:i + _WRITE_ROWS])
+    if apply:
+        apply_abc_classes(db, analysis, commit=False)
+    db.commit()
+    return analysis
+
+def apply_abc_classes(db: Session, analysis: ABCAnalysis, *, commit: bool = True) -> int:
+    """Copy the analysis classes onto inv_item_master.abc_class in one UPDATE; returns rows changed."""
+    line_class = (select(ABCAnalysisLine.abc_class)
+                  .where(ABCAnalysisLine.analysis_id == analysis.id, ABCAnalysisLine.item_id == InventoryItem.id)
+                  .scalar_subquery())
+    changed = (select(ABCAnalysisLine.item_id)
+               .where(ABCAnalysisLine.analysis_id == analysis.id,
+                      (ABCAnalysisLine.previous_abc_class.is_(None)) | (ABCAnalysisLine.previous_abc_class != ABCAnalysisLine.abc_class)))
+    result = db.execute(
+        update(InventoryItem)
+        .where(InventoryItem.id.in_(changed))
+        .values(abc_class=line_class)
+        .execution_options(synchronize_session=False)
+    )
+    analysis.applied_to_items = True
+    if commit:
+        db.commit()
+    return result.rowcount
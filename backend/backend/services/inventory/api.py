@@ -5,6 +5,14 @@ from app.db.session import get_db
 from app.db.models.inventory import InventoryItem
 from app.db.models.inventory_exec import InventoryTxn
 import uuid
+from datetime import datetime, date, time
+from services.inventory.asof import balances_as_of, take_balance_snapshot
+from services.inventory.valuation import run_valuation
+from services.inventory.abc import run_abc_analysis
+from services.inventory.slow_moving import refresh_activity_index, run_slow_moving_analysis
+from services.inventory.stock_status import rebuild_stock_status, stock_status
+from services.inventory.atp import ATP
+from services.inventory.expiry import expiry_risk, sweep_expired
 
 router = APIRouter(prefix="/inventory", tags=["inventory"])
 
@@ -34,6 +42,162 @@ def get_item(item_id: str, db: Session = Depends(get_db)):
         raise HTTPException(404, "Item not found")
     return {"id": i.id, "sku": i.sku, "item_name": i.item_name, "meta": i.meta}
 
+def _parse_at(at: str) -> datetime:
+    """ISO datetime, or a date meaning end of that day (e.g. month end)."""
+    try:
+        if len(at) == 10:
+            return datetime.combine(date.fromisoformat(at), time.max)
+        return datetime.fromisoformat(at)
+    except ValueError:
+        raise HTTPException(400, "at must be an ISO date or datetime")
+
+@router.post("/snapshots")
+def create_balance_snapshot(payload: dict | None = None, db: Session = Depends(get_db)):
+    payload = payload or {}
+    as_of = _parse_at(payload["as_of"]) if payload.get("as_of") else None
+    snap = take_balance_snapshot(db, as_of=as_of, actor=payload.get("actor"), notes=payload.get("notes"))
+    return {"id": snap.id, "as_of": snap.as_of.isoformat(), "lines": snap.meta.get("lines"), "total_quantity": float(snap.total_quantity)}
+
+@router.get("/as-of")
+def inventory_as_of(at: str, item_id: str | None = None, location_id: str | None = None, group_by: str = "key",
+                    db: Session = Depends(get_db)):
+    """On-hand at a point in time: closest earlier balance snapshot + txn deltas after it."""
+    if group_by not in ("key", "item"):
+        raise HTTPException(400, "group_by must be key or item")
+    snap, balances = balances_as_of(db, _parse_at(at), item_id=item_id, location_id=location_id)
+    if group_by == "item":
+        per_item: dict[str, float] = {}
+        for k, q in balances.items():
+            per_item[k[0]] = per_item.get(k[0], 0.0) + float(q)
+        rows = [{"item_id": i, "qty": q} for i, q in sorted(per_item.items())]
+    else:
+        rows = [{"item_id": k[0], "location_id": k[1], "lot_id": k[2], "handling_unit_id": k[3], "state": k[4], "qty": float(q)}
+                for k, q in sorted(balances.items(), key=lambda kv: tuple(x or "" for x in kv[0]))]
+    return {"at": at, "snapshot_id": snap.id if snap else None, "snapshot_as_of": snap.as_of.isoformat() if snap else None, "rows": rows}
+
+@router.post("/valuations")
+def create_valuation(payload: dict | None = None, db: Session = Depends(get_db)):
+    """Value on-hand per site (FIFO|AVG|STD) into inv_valuation_snapshot / inv_valuation_line."""
+    payload = payload or {}
+    try:
+        snaps = run_valuation(
+            db,
+            method=payload.get("method") or "AVG",
+            site_ids=payload.get("site_ids"),
+            valuation_date=date.fromisoformat(payload["valuation_date"]) if payload.get("valuation_date") else None,
+            snapshot_type=payload.get("snapshot_type") or "AD_HOC",
+            actor=payload.get("actor"),
+            workers=int(payload.get("workers") or 4),
+        )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return [{"id": s.id, "site_id": s.site_id, "valuation_method": s.valuation_method, "lines": s.meta.get("lines"),
+             "total_quantity": float(s.total_quantity), "total_value": float(s.total_value)} for s in snaps]
+
+@router.post("/abc-analyses")
+def create_abc_analysis(payload: dict | None = None, db: Session = Depends(get_db)):
+    """Classify items A/B/C from issue history; apply=true also updates inv_item_master.abc_class."""
+    payload = payload or {}
+    try:
+        a = run_abc_analysis(
+            db,
+            criteria=payload.get("criteria") or "VALUE",
+            period_months=int(payload.get("period_months") or 12),
+            a_threshold=float(payload.get("a_threshold_percentage") or 80),
+            b_threshold=float(payload.get("b_threshold_percentage") or 95),
+            apply=bool(payload.get("apply", False)),
+            actor=payload.get("actor") or "system",
+        )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return {"id": a.id, "total_items_analyzed": a.total_items_analyzed, "a_items_count": a.a_items_count,
+            "b_items_count": a.b_items_count, "c_items_count": a.c_items_count, "applied_to_items": a.applied_to_items}
+
+@router.post("/slow-moving-analyses")
+def create_slow_moving_analysis(payload: dict | None = None, db: Session = Depends(get_db)):
+    """Flag slow-moving / obsolete stock per item and location; rebuild=true recomputes the activity index."""
+    payload = payload or {}
+    a = run_slow_moving_analysis(
+        db,
+        lookback_months=int(payload.get("lookback_months") or 12),
+        no_movement_months=int(payload.get("no_movement_months") or 6),
+        slow_moving_threshold=float(payload.get("slow_moving_threshold") or 1),
+        rebuild=bool(payload.get("rebuild", False)),
+        actor=payload.get("actor") or "system",
+    )
+    return {"id": a.id, "total_items_analyzed": a.total_items_analyzed, "no_movement_items": a.no_movement_items,
+            "slow_moving_items": a.slow_moving_items, "total_value_at_risk": float(a.total_value_at_risk), "counts": a.meta.get("counts")}
+
+@router.post("/activity/refresh")
+def refresh_inventory_activity(db: Session = Depends(get_db)):
+    return {"events": refresh_activity_index(db)}
+
+@router.get("/stock-status")
+def get_stock_status(item_id: str, site_id: str | None = None, db: Session = Depends(get_db)):
+    """On-hand / reserved / available / quarantine / hold for one item at one site (one row, no aggregation)."""
+    s = stock_status(db, item_id=item_id, site_id=site_id)
+    if not s:
+        raise HTTPException(404, "No stock status for item/site")
+    return {
+        "item_id": s.item_id, "site_id": s.site_id, "on_hand_qty": float(s.on_hand_qty), "reserved_qty": float(s.reserved_qty),
+        "available_qty": float(s.available_qty), "quarantine_qty": float(s.quarantine_qty), "hold_qty": float(s.hold_qty),
+        "on_order_qty": float(s.on_order_qty), "in_transit_qty": float(s.in_transit_qty),
+        "safety_stock": float(s.safety_stock), "reorder_point": float(s.reorder_point),
+        "is_below_safety_stock": s.is_below_safety_stock, "is_below_reorder_point": s.is_below_reorder_point,
+        "is_overstock": s.is_overstock, "last_updated": s.last_updated.isoformat(),
+    }
+
+@router.post("/stock-status/rebuild")
+def rebuild_inventory_stock_status(db: Session = Depends(get_db)):
+    """Recompute inv_stock_status from wms_inventory_balance (recovery)."""
+    return {"rows": rebuild_stock_status(db)}
+
+def _atp(db: Session):
+    if ATP.seeded_at is None:
+        ATP.seed(db)
+    return ATP
+
+def _parse_day(value: str | None, field: str = "by") -> date | None:
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        raise HTTPException(400, f"{field} must be an ISO date")
+
+@router.get("/atp")
+def get_atp(item_id: str, site_id: str | None = None, by: str | None = None, db: Session = Depends(get_db)):
+    """Available-to-promise for one item by a date (default today); no site = all sites."""
+    return {"item_id": item_id, "site_id": site_id, "by": by, "atp": _atp(db).atp(item_id, site_id=site_id, by=_parse_day(by))}
+
+@router.post("/atp/check")
+def check_atp(payload: dict, db: Session = Depends(get_db)):
+    """Batch ATP for a cart / order: lines [{item_id, qty, site_id?, by?}]."""
+    lines = payload.get("lines") or []
+    if any(not ln.get("item_id") for ln in lines):
+        raise HTTPException(400, "item_id required on every line")
+    results = _atp(db).check([{**ln, "by": _parse_day(ln.get("by"))} for ln in lines])
+    return {"ok": all(r["ok"] for r in results),
+            "lines": [{**r, "by": r["by"].isoformat() if r["by"] else None} for r in results]}
+
+@router.post("/atp/seed")
+def seed_inventory_atp(db: Session = Depends(get_db)):
+    """Reload the in-memory ATP from the database."""
+    return {"positions": ATP.seed(db)}
+
+@router.post("/expiry/sweep")
+def sweep_inventory_expiry(payload: dict | None = None, db: Session = Depends(get_db)):
+    """Put AVAILABLE stock of expired lots / serials on HOLD (optionally hold_days_before_expiry early)."""
+    payload = payload or {}
+    return sweep_expired(db, as_of=_parse_day(payload.get("as_of"), "as_of"),
+                         hold_days_before_expiry=int(payload.get("hold_days_before_expiry") or 0),
+                         actor=payload.get("actor") or "system")
+
+@router.get("/expiry/risk")
+def get_expiry_risk(horizon_days: int = 90, site_id: str | None = None, db: Session = Depends(get_db)):
+    """AVAILABLE stock in lots expiring within horizon_days, by lot and by days-to-expiry bucket."""
+    if horizon_days < 0:
+        raise HTTPException(400, "horizon_days must not be negative")
+    return expiry_risk(db, horizon_days=horizon_days, site_id=site_id)
+
 @router.get("/health")
 def health():
     return {"ok": True}
@@ -0,0 +1,120 @@
+from __future__ import annotations
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
+from app.db.models.common import uuid4_str
+from app.db.models.inventory import InventoryValuation, InventoryBalanceSnapshotLine
+from app.db.models.inventory_exec import InventoryTxn
+from app.db.session import SessionLocal
+
+# Point-in-time inventory: qty at T = closest BALANCE snapshot at or before T
+#                                     + wms_inventory_txn deltas in (snapshot.as_of, T].
+# Snapshots are built the same way from the previous snapshot, so they come from the ledger
+# (not from wms_inventory_balance) and an as-of answer never reads more than one period of txns.
+SNAPSHOT_TYPE = "BALANCE"
+# Txns are stamped before they commit; snapshots stop this far behind "now" so a late commit
+# doesn't land before a cut-off that has already been taken.
+SNAPSHOT_LAG = timedelta(seconds=int(os.getenv("BALANCE_SNAPSHOT_LAG_SECONDS", "300")))
+BALANCE_SNAPSHOT_INTERVAL_HOURS = float(os.getenv("BALANCE_SNAPSHOT_INTERVAL_HOURS", "0"))  # 0 = no periodic snapshots
+_WRITE_ROWS = 1000
+log = logging.getLogger(__name__)
+
+BalanceKey = tuple  # (item_id, location_id, lot_id, handling_unit_id, state)
+
+def latest_snapshot(db: Session, at: datetime) -> InventoryValuation | None:
+    return (db.query(InventoryValuation)
+              .filter(InventoryValuation.snapshot_type == SNAPSHOT_TYPE, InventoryValuation.as_of <= at)
+              .order_by(InventoryValuation.as_of.desc())
+              .first())
+
+def _snapshot_lines(db: Session, snap: InventoryValuation, *, item_id: str | None, location_id: str | None) -> dict[BalanceKey, Decimal]:
+    L = InventoryBalanceSnapshotLine
+    q = select(L.item_id, L.location_id, L.lot_id, L.handling_unit_id, L.state, L.qty).where(L.valuation_id == snap.id)
+    if item_id:
+        q = q.where(L.item_id == item_id)
+    if location_id:
+        q = q.where(L.location_id == location_id)
+    return {tuple(r[:5]): Decimal(r[5]) for r in db.execute(q)}
+
+def _txn_deltas(db: Session, after: datetime | None, upto: datetime, *, item_id: str | None,
+                location_id: str | None) -> dict[BalanceKey, Decimal]:
+    """Net qty per balance key from txns with after < created_at <= upto (two GROUP BYs)."""
+    T = InventoryTxn
+    window = [T.created_at <= upto]
+    if after is not None:
+        window.append(T.created_at > after)
+    if item_id:
+        window.append(T.item_id == item_id)
+    to_state = func.coalesce(T.meta["to_state"].as_string(), T.state)
+    sides = (
+        (T.from_location_id, T.state, -1),
+        (T.to_location_id, to_state, 1),
+    )
+    deltas: dict[BalanceKey, Decimal] = {}
+    for loc_col, state_col, sign in sides:
+        where = window + [loc_col.isnot(None)]
+        if location_id:
+            where.append(loc_col == location_id)
+        q = (select(T.item_id, loc_col, T.lot_id, T.handling_unit_id, state_col, func.sum(T.qty))
+             .where(*where)
+             .group_by(T.item_id, loc_col, T.lot_id, T.handling_unit_id, state_col))
+        for r in db.execute(q):
+            key = tuple(r[:5])
+            deltas[key] = deltas.get(key, Decimal("0")) + sign * Decimal(r[5])
+    return deltas
+
+def balances_as_of(db: Session, at: datetime, *, item_id: str | None = None,
+                   location_id: str | None = None) -> tuple[InventoryValuation | None, dict[BalanceKey, Decimal]]:
+    """Non-zero qty per balance key at `at`; returns (snapshot used, balances)."""
+    snap = latest_snapshot(db, at)
+    balances = _snapshot_lines(db, snap, item_id=item_id, location_id=location_id) if snap else {}
+    for key, d in _txn_deltas(db, snap.as_of if snap else None, at, item_id=item_id, location_id=location_id).items():
+        balances[key] = balances.get(key, Decimal("0")) + d
+    return snap, {k: q for k, q in balances.items() if q != 0}
+
+def take_balance_snapshot(db: Session, *, as_of: datetime | None = None, actor: str | None = None,
+                          notes: str | None = None) -> InventoryValuation:
+    """Persist the warehouse-wide balances at as_of (default: now - SNAPSHOT_LAG)."""
+    as_of = as_of or (datetime.utcnow() - SNAPSHOT_LAG)
+    base, balances = balances_as_of(db, as_of)
+    snap = InventoryValuation(
+        valuation_date=as_of.date(),
+        snapshot_type=SNAPSHOT_TYPE,
+        as_of=as_of,
+        total_quantity=sum(balances.values(), Decimal("0")),
+        total_value=Decimal("0"),
+        valuation_method="NONE",
+        posted_by=actor,
+        notes=notes,
+        meta={"base_snapshot_id": base.id if base else None, "lines": len(balances)},
+    )
+    db.add(snap)
+    db.flush()
+    rows = [{
+        "id": uuid4_str(), "valuation_id": snap.id, "item_id": k[0], "location_id": k[1], "lot_id": k[2],
+        "handling_unit_id": k[3], "state": k[4], "qty": q,
+    } for k, q in balances.items()]
+    for i in range(0, len(rows), _WRITE_ROWS):
+        db.execute(insert(InventoryBalanceSnapshotLine), rows[i:i + _WRITE_ROWS])
+    db.commit()
+    return snap
+
+async def run_balance_snapshots_forever(*, interval_hours: float) -> None:
+    """Take a BALANCE snapshot whenever the latest one is older than interval_hours."""
+    def _tick() -> None:
+        with SessionLocal() as db:
+            last = latest_snapshot(db, datetime.utcnow())
+            if last is None or last.as_of.replace(tzinfo=None) <= datetime.utcnow() - SNAPSHOT_LAG - timedelta(hours=interval_hours):
+                take_balance_snapshot(db, actor="system")
+
+    while True:
+        try:
+            await asyncio.to_thread(_tick)
+        except Exception:
+            # A failed snapshot only makes as-of queries replay a longer window
+            log.exception("balance snapshot failed")
+        await asyncio.sleep(min(interval_hours * 3600, 600))
@@ -0,0 +1,274 @@
+from __future__ import annotations
+import asyncio
+import logging
+import os
+import threading
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+from sqlalchemy import func, null, select
+from sqlalchemy.orm import Session
+from app.db.models.inventory import StockStatusSummary
+from app.db.models.inventory_exec import InventoryReservation, WMSLocation
+from app.db.models.planning import Backorder, PlannedOrder
+from app.db.models.purchasing import PurchaseOrder, PurchaseOrderLine
+from app.db.models.sales import SalesOrder, SalesOrderLine
+from app.db.models.wms.allocation import Allocation
+from app.db.session import SessionLocal
+from app.events.outbox import OutboxEvent
+
+# Available-to-promise, in memory, per item and site plus a network-wide position per item.
+#
+# A position is on-hand (AVAILABLE + RESERVED stock, from inv_stock_status) plus time-phased
+# document quantities by date: open PO lines and planned orders add, allocations, open
+# backorders and open sales order lines take away. Allocations count only while unpicked, as
+# their wms_inventory_reservation rows (picks release those; wms_allocation rows are kept).
+# Past-due documents count today. ATP by date X is the lowest projected balance from X
+# onward, so promising it never uncovers demand that is already booked later; each position
+# caches its dates and that suffix minimum, so a query is one bisect.
+#
+# seed_atp() loads everything with a handful of grouped queries. The poller then reads
+# outbox events: InventoryChanged adjusts on-hand by the event qty and, since a pick releases
+# reservations as it moves stock, reloads the documents of its item; OrderAllocated and any
+# event that names item_id / item_ids reloads the documents of those items. Documents
+# without a site (planned orders, sales orders) only count in the network position.
+ON_HAND_STATES = frozenset({"AVAILABLE", "RESERVED"})
+ATP_POLL_SECONDS = float(os.getenv("ATP_POLL_SECONDS", "2"))  # 0 = no in-process ATP
+_OVERLAP = timedelta(minutes=5)
+_CLOSED_PO = ("DRAFT", "CANCELLED", "CLOSED", "RECEIVED")
+_OPEN_PO_LINE = ("OPEN", "PARTIALLY_RECEIVED")
+_CLOSED_SO = ("SHIPPED", "DELIVERED", "CANCELLED")
+_CLOSED_SO_LINE = ("SHIPPED", "CANCELLED")
+_PLANNED = ("PLANNED", "FIRM")
+_FETCH_ROWS = 10_000
+log = logging.getLogger(__name__)
+NETWORK = object()  # site key of the network-wide position
+
+def _phase(docs: dict[int, float]) -> tuple[list[int], list[float]]:
+    """Sorted dates and, per position in them, the lowest projected document balance from there on."""
+    dates = sorted(docs)
+    floor = [0.0, *accumulate(docs[d] for d in dates)]
+    for i in range(len(floor) - 2, -1, -1):
+        floor[i] = min(floor[i], floor[i + 1])
+    return dates, floor
+
+class _Position:
+    __slots__ = ("on_hand", "docs", "_cache")
+
+    def __init__(self) -> None:
+        self.on_hand = 0.0
+        self.docs: dict[int, float] = {}  # date ordinal -> net qty (supply +, demand -)
+        self._cache: tuple | None = None  # (docs it was built from, dates, floor)
+
+    def add_doc(self, day: int, qty: float) -> None:
+        """Only while loading; live positions get a whole new docs dict instead."""
+        self.docs[day] = self.docs.get(day, 0.0) + qty
+        self._cache = None
+
+    def atp(self, day: int) -> float:
+        docs, cache = self.docs, self._cache
+        if cache is None or cache[0] is not docs:
+            cache = self._cache = (docs, *_phase(docs))
+        return self.on_hand + cache[2][bisect_right(cache[1], day)]
+
+class AtpLedger:
+    def __init__(self) -> None:
+        self._positions: dict[str, dict] = {}  # item_id -> {site_id | NETWORK: _Position}
+        self._sites: dict[str, str | None] = {}  # location_id -> site_id
+        self._lock = threading.Lock()
+        self._cursor: datetime | None = None
+        self._seen: dict[str, datetime] = {}  # event ids already applied inside the overlap window
+        self.seeded_at: datetime | None = None
+
+    # -- queries ---------------------------------------------------------------------------
+    def atp(self, item_id: str, *, site_id: str | None = None, by: date | None = None) -> float:
+        """Qty of item_id that can be promised for `by` (default today); site_id None = network."""
+        p = self._positions.get(item_id, {}).get(NETWORK if site_id is None else site_id)
+        if p is None:
+            return 0.0
+        return max(0.0, p.atp((by or date.today()).toordinal()))
+
+    def check(self, lines: list[dict]) -> list[dict]:
+        """Whole cart / order: lines {item_id, qty, site_id?, by?}; repeated items draw on one ATP."""
+        taken: dict[tuple, float] = {}
+        out = []
+        for ln in lines:
+            key = (ln["item_id"], ln.get("site_id"))
+            avail = self.atp(ln["item_id"], site_id=ln.get("site_id"), by=ln.get("by")) - taken.get(key, 0.0)
+            qty = float(ln.get("qty") or 0)
+            taken[key] = taken.get(key, 0.0) + qty
+            out.append({**ln, "available": max(0.0, avail), "ok": qty <= avail + 1e-9})
+        return out
+
+    # -- loading ---------------------------------------------------------------------------
+    def _position(self, positions: dict, item_id: str, site_id) -> _Position:
+        sites = positions.get(item_id)
+        if sites is None:
+            sites = positions[item_id] = {}
+        p = sites.get(site_id)
+        if p is None:
+            p = sites[site_id] = _Position()
+        return p
+
+    def _add_doc(self, positions: dict, item_id: str, site_id: str | None, day: date | None, qty: float, today: int) -> None:
+        d = max(day.toordinal(), today) if day else today
+        self._position(positions, item_id, NETWORK).add_doc(d, qty)
+        if site_id is not None:
+            self._position(positions, item_id, site_id).add_doc(d, qty)
+
+    def _load_docs(self, db: Session, positions: dict, item_ids: set[str] | None) -> None:
+        today = date.today().toordinal()
+        for item_id, site_id, day, qty in _document_rows(db, item_ids):
+            if qty:
+                self._add_doc(positions, item_id, site_id, day, float(qty), today)
+
+    def seed(self, db: Session) -> int:
+        """Rebuild every position from the database; returns positions loaded."""
+        if db.get_bind().dialect.name == "postgresql":
+            db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        since = datetime.utcnow() - _OVERLAP
+        # Events visible now are already in the stock status rows read below (same snapshot)
+        seen = {r[0]: r[1] for r in db.execute(select(OutboxEvent.id, OutboxEvent.created_at).where(OutboxEvent.created_at > since))}
+        cursor = db.execute(select(func.max(OutboxEvent.created_at))).scalar()
+        sites = dict(db.execute(select(WMSLocation.id, WMSLocation.site_id)).all())
+        positions: dict[str, dict] = {}
+        S = StockStatusSummary
+        for item_id, site_id, qty in db.execute(select(S.item_id, S.site_id, S.available_qty + S.reserved_qty)):
+            if qty:
+                self._position(positions, item_id, NETWORK).on_hand += float(qty)
+                if site_id is not None:
+                    self._position(positions, item_id, site_id).on_hand += float(qty)
+        self._load_docs(db, positions, None)
+        db.rollback()
+        with self._lock:
+            self._positions, self._sites, self._seen, self._cursor = positions, sites, seen, cursor
+            self.seeded_at = datetime.utcnow()
+        return sum(len(v) for v in positions.values())
+
+    def refresh_items(self, db: Session, item_ids: set[str]) -> None:
+        """Reload the document side (PO lines, planned orders, allocations, backorders, sales lines) of items."""
+        if not item_ids:
+            return
+        fresh: dict[str, dict] = {}
+        self._load_docs(db, fresh, item_ids)
+        with self._lock:
+            for item_id in item_ids:
+                loaded = fresh.get(item_id, {})
+                for site_id, p in self._positions.get(item_id, {}).items():
+                    if site_id not in loaded:
+                        p.docs = {}
+                for site_id, p in loaded.items():
+                    self._position(self._positions, item_id, site_id).docs = p.docs
+
+    # -- events ----------------------------------------------------------------------------
+    def _site(self, db: Session, location_id: str) -> str | None:
+        if location_id not in self._sites:
+            self._sites[location_id] = db.execute(select(WMSLocation.site_id).where(WMSLocation.id == location_id)).scalar()
+        return self._sites[location_id]
+
+    def _on_hand(self, db: Session, item_id: str, location_id: str, qty: float) -> None:
+        self._position(self._positions, item_id, NETWORK).on_hand += qty
+        site_id = self._site(db, location_id)
+        if site_id is not None:
+            self._position(self._positions, item_id, site_id).on_hand += qty
+
+    def poll(self, db: Session) -> int:
+        """Apply outbox events created since the last poll; returns events applied."""
+        q = select(OutboxEvent.id, OutboxEvent.created_at, OutboxEvent.topic, OutboxEvent.payload)
+        if self._cursor is not None:
+            q = q.where(OutboxEvent.created_at > self._cursor - _OVERLAP)
+        refresh: set[str] = set()
+        orders: set[str] = set()
+        applied = 0
+        with self._lock:
+            for chunk in db.execute(q.order_by(OutboxEvent.created_at).execution_options(stream_results=True)).partitions(_FETCH_ROWS):
+                for event_id, created_at, topic, p in chunk:
+                    if event_id in self._seen:
+                        continue
+                    self._seen[event_id] = created_at
+                    self._cursor = created_at if self._cursor is None or created_at > self._cursor else self._cursor
+                    applied += 1
+                    p = p or {}
+                    if topic == "InventoryChanged":
+                        qty = float(p.get("qty") or 0)
+                        if p.get("from_location_id") and p.get("state") in ON_HAND_STATES:
+                            self._on_hand(db, p["item_id"], p["from_location_id"], -qty)
+                        if p.get("to_location_id") and (p.get("to_state") or p.get("state")) in ON_HAND_STATES:
+                            self._on_hand(db, p["item_id"], p["to_location_id"], qty)
+                        refresh.add(p["item_id"])
+                    elif topic == "OrderAllocated" and p.get("order_id"):
+                        orders.add(p["order_id"])
+                    else:
+                        refresh.update(i for i in [p.get("item_id"), *(p.get("item_ids") or [])] if isinstance(i, str))
+            if self._cursor is not None:
+                horizon = self._cursor - _OVERLAP
+                self._seen = {k: v for k, v in self._seen.items() if v > horizon}
+        if orders:
+            refresh.update(r[0] for r in db.execute(select(Allocation.item_id).where(Allocation.order_id.in_(orders))))
+            refresh.update(r[0] for r in db.execute(select(Backorder.item_id).where(Backorder.order_id.in_(orders))))
+        self.refresh_items(db, refresh)
+        db.rollback()
+        return applied
+
+def _document_rows(db: Session, item_ids: set[str] | None):
+    """(item_id, site_id, date, signed qty) for every open supply / demand document, grouped per day."""
+    def scoped(q, col):
+        return q.where(col.in_(item_ids)) if item_ids is not None else q
+
+    today = date.today()
+    L, PO, R = PurchaseOrderLine, PurchaseOrder, InventoryReservation
+    po_day = func.coalesce(L.promised_date, L.need_by_date, PO.promised_delivery_date, PO.expected_delivery_date)
+    po_open = L.quantity_ordered - L.quantity_received - L.quantity_cancelled
+    so_day = func.coalesce(SalesOrderLine.promised_date, SalesOrderLine.requested_date, SalesOrder.promised_ship_date,
+                           SalesOrder.requested_ship_date)
+    so_open = (SalesOrderLine.quantity_ordered - SalesOrderLine.quantity_allocated - SalesOrderLine.quantity_shipped
+               - SalesOrderLine.quantity_cancelled - SalesOrderLine.quantity_backordered)
+    queries = [
+        (1, scoped(select(L.item_id, PO.ship_to_site_id, po_day, func.sum(po_open)).join(PO, PO.id == L.po_id)
+                   .where(L.line_status.in_(_OPEN_PO_LINE), PO.status.notin_(_CLOSED_PO), po_open > 0)
+                   .group_by(L.item_id, PO.ship_to_site_id, po_day), L.item_id)),
+        (1, scoped(select(PlannedOrder.item_id, null(), PlannedOrder.due_date, func.sum(PlannedOrder.qty))
+                   .where(PlannedOrder.status.in_(_PLANNED))
+                   .group_by(PlannedOrder.item_id, PlannedOrder.due_date), PlannedOrder.item_id)),
+        (-1, scoped(select(R.item_id, WMSLocation.site_id, null(), func.sum(R.qty))
+                    .join(WMSLocation, WMSLocation.id == R.location_id)
+                    .group_by(R.item_id, WMSLocation.site_id), R.item_id)),
+        (-1, scoped(select(Backorder.item_id, null(), null(), func.sum(Backorder.qty))
+                    .where(Backorder.status == "OPEN")
+                    .group_by(Backorder.item_id), Backorder.item_id)),
+        (-1, scoped(select(SalesOrderLine.item_id, null(), so_day, func.sum(so_open))
+                    .join(SalesOrder, SalesOrder.id == SalesOrderLine.order_id)
+                    .where(SalesOrder.status.notin_(_CLOSED_SO), SalesOrderLine.line_status.notin_(_CLOSED_SO_LINE), so_open > 0)
+                    .group_by(SalesOrderLine.item_id, so_day), SalesOrderLine.item_id)),
+    ]
+    for sign, q in queries:
+        for chunk in db.execute(q.execution_options(stream_results=True)).partitions(_FETCH_ROWS):
+            for item_id, site_id, day, qty in chunk:
+                yield item_id, site_id, day or today, sign * (qty or 0)
+
+ATP = AtpLedger()
+
+def seed_atp() -> int:
+    with SessionLocal() as db:
+        return ATP.seed(db)
+
+async def run_atp_forever(*, poll_interval_seconds: float) -> None:
+    """Seed the in-memory ATP once, then keep it current from outbox events."""
+    while ATP.seeded_at is None:
+        try:
+            await asyncio.to_thread(seed_atp)
+        except Exception:
+            log.exception("ATP seed failed, retrying")
+            await asyncio.sleep(max(poll_interval_seconds, 30))
+
+    def _tick() -> None:
+        with SessionLocal() as db:
+            ATP.poll(db)
+
+    while True:
+        try:
+            await asyncio.to_thread(_tick)
+        except Exception:
+            # Missed events stay after the cursor and are picked up by the next poll
+            log.exception("ATP poll failed")
+        await asyncio.sleep(poll_interval_seconds)
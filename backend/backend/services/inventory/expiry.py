@@ -0,0 +1,196 @@
+from __future__ import annotations
+import asyncio
+import logging
+import os
+from uuid import uuid4
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from sqlalchemy import func, select, tuple_, update
+from sqlalchemy.orm import Session
+from app.db.models.costing import ItemCost
+from app.db.models.inventory import InventoryItem
+from app.db.models.inventory_exec import (InventoryBalance, InventoryReservation, InventorySerial, WMSLocation, WMSLot,
+                                          BalanceReserved)
+from app.db.session import SessionLocal
+from app.events.outbox import OutboxEvent
+from services.wms.inventory_ops.reservation import release
+from services.wms.inventory_ops.service import Movement, apply_movements
+
+# Expiry sweeper: AVAILABLE stock of expired lots and serials goes to HOLD.
+#
+# Candidates come through the expiry indexes (wms_lot.expiry_date, inv_serial.expiry_date) and are
+# processed in keyset-ordered chunks of _CHUNK balances / serials. Each chunk is its own short
+# transaction: release the reservations on the chunk's balances, then one apply_movements batch
+# (AVAILABLE -> HOLD in place), so no run holds locks on wms_inventory_balance for longer than a
+# chunk. A run then writes a single aggregated InventoryExpiryHeld outbox event. Re-running is
+# harmless: held stock is no longer AVAILABLE. Correlation ids carry a per-run id (and, for
+# serials, the chunk), so equal movements from different serial chunks or runs are not deduplicated.
+EXPIRY_SWEEP_INTERVAL_HOURS = float(os.getenv("EXPIRY_SWEEP_INTERVAL_HOURS", "0"))  # 0 = no periodic sweeps
+HOLD_STATE = "HOLD"
+RISK_BUCKETS = (7, 30, 90)  # days to expiry, upper bounds
+_CHUNK = 500
+log = logging.getLogger(__name__)
+
+def _refs(db: Session, model, ids) -> dict:
+    ids = {i for i in ids if i}
+    return {o.id: o for o in db.query(model).filter(model.id.in_(ids))} if ids else {}
+
+def _hold(db: Session, picks: list[tuple], *, correlation_id: str, actor: str, acc: dict) -> None:
+    """Move (balance_id, item_id, location_id, lot_id, hu_id, qty) to HOLD and commit; folds totals into acc."""
+    balance_ids = [p[0] for p in picks]
+    acc["demand_ids"].update(d for d in db.execute(
+        select(InventoryReservation.demand_id).where(InventoryReservation.balance_id.in_(balance_ids)).distinct()
+    ).scalars() if d)
+    acc["released_qty"] += release(db, InventoryReservation.balance_id.in_(balance_ids))
+    items = _refs(db, InventoryItem, (p[1] for p in picks))
+    locations = _refs(db, WMSLocation, (p[2] for p in picks))
+    lots = _refs(db, WMSLot, (p[3] for p in picks))
+    apply_movements(db, [
+        Movement(correlation_id=correlation_id, item=items[item_id], qty=float(qty), from_location=locations[loc_id],
+                 to_location=locations[loc_id], state="AVAILABLE", to_state=HOLD_STATE, lot=lots.get(lot_id),
+                 handling_unit_id=hu_id, actor=actor, reason="expired")
+        for _, item_id, loc_id, lot_id, hu_id, qty in picks
+    ], commit=True)
+    acc["balances"] += len(picks)
+    for _, item_id, _loc, lot_id, _hu, qty in picks:
+        acc["qty"] += Decimal(qty)
+        acc["by_item_lot"][(item_id, lot_id)] += Decimal(qty)
+
+def _sweep_lots(db: Session, cutoff: date, correlation_id: str, actor: str, acc: dict) -> None:
+    B = InventoryBalance
+    after = ""
+    while True:
+        picks = db.execute(
+            select(B.id, B.item_id, B.location_id, B.lot_id, B.handling_unit_id, B.qty)
+            .join(WMSLot, WMSLot.id == B.lot_id)
+            .where(WMSLot.expiry_date < cutoff, B.state == "AVAILABLE", B.qty > 0, B.id > after)
+            .order_by(B.id)
+            .limit(_CHUNK)
+        ).all()
+        if not picks:
+            return
+        after = picks[-1][0]
+        _hold(db, [tuple(p) for p in picks], correlation_id=correlation_id, actor=actor, acc=acc)
+
+def _sweep_serials(db: Session, cutoff: date, correlation_id: str, actor: str, acc: dict) -> None:
+    """One unit per expired serial, from the AVAILABLE balances at the serial's item/location/lot."""
+    S, B = InventorySerial, InventoryBalance
+    after = ""
+    while True:
+        serials = db.execute(
+            select(S.id, S.item_id, S.location_id, S.lot_id)
+            .where(S.expiry_date < cutoff, S.status == "AVAILABLE", S.location_id.isnot(None), S.id > after)
+            .order_by(S.id)
+            .limit(_CHUNK)
+        ).all()
+        if not serials:
+            return
+        after = serials[-1][0]
+        need: dict[tuple, Decimal] = defaultdict(Decimal)
+        for _, item_id, loc_id, lot_id in serials:
+            need[(item_id, loc_id, lot_id or "")] += 1
+        balances = db.execute(
+            select(B.id, B.item_id, B.location_id, B.lot_id, B.handling_unit_id, B.qty)
+            .where(tuple_(B.item_id, B.location_id, func.coalesce(B.lot_id, "")).in_(sorted(need)),
+                   B.state == "AVAILABLE", B.qty > 0)
+            .order_by(B.id)
+        ).all()
+        picks = []
+        for b in balances:
+            key = (b.item_id, b.location_id, b.lot_id or "")
+            take = min(need[key], Decimal(b.qty))
+            if take > 0:
+                need[key] -= take
+                picks.append((*b[:5], take))
+        db.execute(update(S).where(S.id.in_([s[0] for s in serials])).values(status=HOLD_STATE))
+        if picks:
+            _hold(db, picks, correlation_id=f"{correlation_id}:{after}", actor=actor, acc=acc)
+        else:
+            db.commit()
+        acc["serials"] += len(serials)
+
+def sweep_expired(db: Session, *, as_of: date | None = None, hold_days_before_expiry: int = 0,
+                  actor: str = "system") -> dict:
+    """Put AVAILABLE stock of lots / serials expiring before as_of + hold_days_before_expiry on HOLD.
+
+    Reservations on held balances are released (their demand ids are listed in the result and
+    in the InventoryExpiryHeld event, for reallocation).
+    """
+    today = as_of or date.today()
+    cutoff = today + timedelta(days=max(hold_days_before_expiry, 0))
+    correlation_id = f"expiry:{uuid4().hex[:12]}"
+    acc = {"balances": 0, "serials": 0, "qty": Decimal("0"), "released_qty": Decimal("0"),
+           "demand_ids": set(), "by_item_lot": defaultdict(Decimal)}
+    _sweep_lots(db, cutoff, correlation_id, actor, acc)
+    _sweep_serials(db, cutoff, correlation_id, actor, acc)
+
+    result = {
+        "as_of": today.isoformat(), "cutoff": cutoff.isoformat(), "balances": acc["balances"], "serials": acc["serials"],
+        "qty": float(acc["qty"]), "released_qty": float(acc["released_qty"]), "demand_ids": sorted(acc["demand_ids"]),
+        "held": [{"item_id": i, "lot_id": l, "qty": float(q)}
+                 for (i, l), q in sorted(acc["by_item_lot"].items(), key=lambda kv: (kv[0][0], kv[0][1] or ""))],
+    }
+    if acc["balances"] or acc["serials"]:
+        db.add(OutboxEvent(topic="InventoryExpiryHeld", payload=result))
+        db.commit()
+    return result
+
+def _bucket(days_left: int) -> str:
+    for limit in RISK_BUCKETS:
+        if days_left <= limit:
+            return f"<={limit}"
+    return f">{RISK_BUCKETS[-1]}"
+
+def expiry_risk(db: Session, *, horizon_days: int = 90, as_of: date | None = None, site_id: str | None = None) -> dict:
+    """AVAILABLE stock in lots expiring within horizon_days, per lot, with value and reserved qty, plus serial counts."""
+    today = as_of or date.today()
+    end = today + timedelta(days=horizon_days)
+    B = InventoryBalance
+    unit_cost = func.coalesce(func.nullif(ItemCost.avg_cost, 0), InventoryItem.average_cost, InventoryItem.standard_cost, 0)
+    q = (select(B.item_id, InventoryItem.item_code, B.lot_id, WMSLot.lot_number, WMSLot.expiry_date,
+                func.sum(B.qty), func.sum(func.coalesce(BalanceReserved.qty, 0)), func.max(unit_cost))
+         .join(WMSLot, WMSLot.id == B.lot_id)
+         .join(InventoryItem, InventoryItem.id == B.item_id)
+         .outerjoin(ItemCost, ItemCost.item_id == B.item_id)
+         .outerjoin(BalanceReserved, BalanceReserved.balance_id == B.id)
+         .where(WMSLot.expiry_date >= today, WMSLot.expiry_date < end, B.state == "AVAILABLE", B.qty > 0)
+         .group_by(B.item_id, InventoryItem.item_code, B.lot_id, WMSLot.lot_number, WMSLot.expiry_date)
+         .order_by(WMSLot.expiry_date, B.item_id))
+    if site_id is not None:
+        q = q.join(WMSLocation, WMSLocation.id == B.location_id).where(WMSLocation.site_id == site_id)
+
+    lots, buckets = [], {}
+    for item_id, sku, lot_id, lot_number, expiry, qty, reserved, cost in db.execute(q):
+        days_left = (expiry - today).days
+        value = (Decimal(qty) * Decimal(cost or 0)).quantize(Decimal("0.01"))
+        lots.append({"item_id": item_id, "sku": sku, "lot_id": lot_id, "lot_number": lot_number,
+                     "expiry_date": expiry.isoformat(), "days_left": days_left, "qty": float(qty),
+                     "reserved_qty": float(reserved), "value": float(value)})
+        b = buckets.setdefault(_bucket(days_left), {"lots": 0, "qty": 0.0, "value": 0.0})
+        b["lots"] += 1
+        b["qty"] += float(qty)
+        b["value"] += float(value)
+
+    S = InventorySerial
+    serials = dict(db.execute(
+        select(S.item_id, func.count())
+        .where(S.expiry_date >= today, S.expiry_date < end, S.status == "AVAILABLE")
+        .group_by(S.item_id)
+    ).all())
+    return {"as_of": today.isoformat(), "horizon_days": horizon_days, "site_id": site_id, "buckets": buckets,
+            "lots": lots, "serials": [{"item_id": i, "expiring": n} for i, n in sorted(serials.items())]}
+
+async def run_expiry_sweeper_forever(*, interval_hours: float) -> None:
+    """sweep_expired() every interval_hours."""
+    def _tick() -> None:
+        with SessionLocal() as db:
+            sweep_expired(db)
+
+    while True:
+        try:
+            await asyncio.to_thread(_tick)
+        except Exception:
+            # Whatever was not held yet is picked up by the next sweep
+            log.exception("expiry sweep failed")
+        await asyncio.sleep(interval_hours * 3600)
@@ -1,8 +1,180 @@
 from __future__ import annotations
+from dataclasses import dataclass
+from datetime import datetime
 from decimal import Decimal
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from app.core.tenant import get_tenant_id
-from app.db.models.inventory_exec import InventoryBalance, InventoryTxn
+from app.db.models.common import uuid4_str
+from app.db.models.inventory import InventoryItem
+from app.db.models.inventory_exec import AVAILABLE_QTY, BalanceReserved, InventoryBalance, InventoryTxn, WMSLocation
+from app.events.outbox import OutboxEvent
+from services.inventory.stock_status import apply_stock_status
+from services.wms.inventory_ops.occupancy import apply_occupancy
+from services.wms.inventory_ops.service import Movement, apply_costing
+
+@dataclass
+class IssueLine:
+    item_id: str
+    qty: Decimal
+    location_id: str | None = None
+    lot_id: str | None = None
+    state: str = "AVAILABLE"
+    unit_cost: Decimal | None = None  # values qty the FIFO layers don't cover (see apply_costing)
+    reason: str | None = None
+    meta: dict | None = None
+
+@dataclass(frozen=True)
+class IssuedTxn:
+    """What fifo_issue_lines wrote for one balance it drew from (the InventoryTxn is not reloaded)."""
+    id: str
+    line: int
+    item_id: str
+    location_id: str
+    lot_id: str | None
+    handling_unit_id: str | None
+    qty: Decimal
+    unit_cost: Decimal
+    ext_cost: Decimal
+
+def _line_order(indexed: tuple[int, IssueLine]):
+    # Deterministic lock order; within an item, lines pinned to a location/lot go before open
+    # ones so an unpinned line doesn't use up the stock a pinned line needs.
+    _, l = indexed
+    return (l.item_id, l.location_id is None, l.location_id or "", l.lot_id is None, l.lot_id or "", l.state)
+
+def fifo_issue_lines(
+    db: Session,
+    *,
+    correlation_id: str,
+    lines: list[IssueLine],
+    actor: str,
+    reason: str,
+    txn_type: str = "ISSUE_TO_WIP",
+    meta: dict | None = None,
+    commit: bool = True,
+) -> list[IssuedTxn]:
+    """Issue several materials FIFO (oldest balance first) in one transaction.
+
+    Candidate balances are locked with FOR UPDATE SKIP LOCKED, lines taken in item order (see
+    _line_order) so concurrent issues lock rows in the same order. Rows another issue is
+    holding are skipped rather than waited on, so two operators drawing the same component take
+    different stock; only the unreserved qty of a balance (AVAILABLE_QTY) is drawn. A line that
+    can't be filled from the unlocked rows raises ValueError and the whole request rolls back.
+    Issues are costed like any other (apply_costing: FIFO layers, ItemCost, inv_item_onhand).
+    Txns and outbox events are bulk-inserted and returned as IssuedTxn (no refresh). With
+    commit=False the caller owns the commit.
+    """
+    for l in lines:
+        if not l.item_id or Decimal(l.qty) <= 0:
+            raise ValueError("item_id and qty>0 required")
+
+    tenant_id = get_tenant_id()
+    now = datetime.utcnow()
+    draws: list[tuple[int, IssueLine, InventoryBalance, Decimal]] = []
+    taken: dict[str, Decimal] = {}  # balance id -> qty drawn by earlier lines of this request
+
+    for idx, l in sorted(enumerate(lines), key=_line_order):
+        remaining = Decimal(l.qty)
+        q = (db.query(InventoryBalance, AVAILABLE_QTY)
+             .outerjoin(BalanceReserved, BalanceReserved.balance_id == InventoryBalance.id)
+             .filter(
+                 InventoryBalance.item_id == l.item_id,
+                 InventoryBalance.state == l.state,
+                 AVAILABLE_QTY > 0,
+             ))
+        if l.location_id:
+            q = q.filter(InventoryBalance.location_id == l.location_id)
+        if l.lot_id:
+            q = q.filter(InventoryBalance.lot_id == l.lot_id)
+        # FIFO by created_at (id as tie-breaker). Rows this transaction already locked for an
+        # earlier line are returned again (SKIP LOCKED only skips other transactions' locks);
+        # what earlier lines took from them is in `taken`.
+        q = (q.order_by(InventoryBalance.created_at.asc(), InventoryBalance.id.asc())
+             .with_for_update(skip_locked=True, of=InventoryBalance))
+
+        for b, available in q.all():
+            if remaining <= 0:
+                break
+            available = Decimal(available) - taken.get(b.id, Decimal("0"))
+            if available <= 0:
+                continue
+            take = available if available <= remaining else remaining
+            taken[b.id] = taken.get(b.id, Decimal("0")) + take
+            b.qty = b.qty - take
+            remaining -= take
+            draws.append((idx, l, b, take))
+
+        if remaining > 0:
+            raise ValueError(f"Insufficient inventory for FIFO issue of {l.item_id}: short {remaining}")
+
+    issued: list[IssuedTxn] = []
+    if draws:
+        items = {i.id: i for i in db.query(InventoryItem).filter(InventoryItem.id.in_({b.item_id for _, _, b, _ in draws}))}
+        locations = {loc.id: loc for loc in db.query(WMSLocation).filter(WMSLocation.id.in_({b.location_id for _, _, b, _ in draws}))}
+        costs = apply_costing(db, [
+            Movement(correlation_id=correlation_id, item=items[b.item_id], qty=take, from_location=locations[b.location_id],
+                     to_location=None, actor=actor, state=b.state, handling_unit_id=b.handling_unit_id,
+                     meta={"unit_cost": float(l.unit_cost)} if l.unit_cost is not None else None)
+            for _, l, b, take in draws
+        ])
+
+        txn_rows: list[dict] = []
+        for (idx, l, b, take), ext_cost in zip(draws, costs):
+            unit_cost = ext_cost / take
+            row = {
+                "id": uuid4_str(),
+                "created_at": now,
+                "correlation_id": correlation_id,
+                "txn_type": txn_type,
+                "item_id": l.item_id,
+                "from_location_id": b.location_id,
+                "to_location_id": None,
+                "lot_id": b.lot_id,
+                "handling_unit_id": b.handling_unit_id,
+                "state": b.state,
+                "qty": take,
+                "unit_cost": unit_cost,
+                "ext_cost": ext_cost,
+                "uom": "EA",
+                "actor": actor,
+                "reason": l.reason or reason,
+                "meta": {**(meta or {}), **(l.meta or {}), "tenant_id": tenant_id},
+            }
+            txn_rows.append(row)
+            issued.append(IssuedTxn(
+                id=row["id"], line=idx, item_id=l.item_id, location_id=b.location_id, lot_id=b.lot_id,
+                handling_unit_id=b.handling_unit_id, qty=take, unit_cost=unit_cost, ext_cost=ext_cost,
+            ))
+
+        db.execute(insert(InventoryTxn), txn_rows)
+        db.execute(insert(OutboxEvent), [{"topic": "InventoryChanged", "payload": {
+            "correlation_id": correlation_id,
+            "item_id": r["item_id"],
+            "from_location_id": r["from_location_id"],
+            "to_location_id": None,
+            "lot_id": r["lot_id"],
+            "handling_unit_id": r["handling_unit_id"],
+            "state": r["state"],
+            "to_state": r["state"],
+            "qty": float(r["qty"]),
+            "uom": r["uom"],
+            "actor": actor,
+            "reason": r["reason"],
+        }} for r in txn_rows])
+        deltas: dict[tuple, Decimal] = {}
+        for r in txn_rows:
+            bk = (r["item_id"], r["from_location_id"], r["lot_id"], r["handling_unit_id"], r["state"])
+            deltas[bk] = deltas.get(bk, Decimal("0")) - r["qty"]
+        apply_stock_status(db, deltas)
+        apply_occupancy(db, deltas)
+
+    if commit:
+        db.commit()
+    else:
+        db.flush()
+    issued.sort(key=lambda t: t.line)
+    return issued
 
 def fifo_issue(
     db: Session,
@@ -17,56 +189,15 @@ def fifo_issue(
     state: str = "AVAILABLE",
     unit_cost: Decimal | None = None,
     meta: dict | None = None,
-) -> list[InventoryTxn]:
+) -> list[IssuedTxn]:
     """Consume inventory balances FIFO (oldest first) and emit ISSUE_TO_WIP txns.
-    Returns list of created txns. Updates balances in-place.
+    Single-line wrapper around fifo_issue_lines.
     """
-    remaining = Decimal(qty)
-    created: list[InventoryTxn] = []
-    q = db.query(InventoryBalance).filter(
-        InventoryBalance.item_id == item_id,
-        InventoryBalance.state == state,
-        InventoryBalance.qty > 0,
+    return fifo_issue_lines(
+        db,
+        correlation_id=correlation_id,
+        lines=[IssueLine(item_id=item_id, qty=qty, location_id=location_id, lot_id=lot_id, state=state, unit_cost=unit_cost)],
+        actor=actor,
+        reason=reason,
+        meta=meta,
     )
-    if location_id:
-        q = q.filter(InventoryBalance.location_id == location_id)
-    if lot_id:
-        q = q.filter(InventoryBalance.lot_id == lot_id)
-
-    # FIFO by created_at (or id as tie-breaker)
-    balances = q.order_by(InventoryBalance.created_at.asc(), InventoryBalance.id.asc()).all()
-
-    for b in balances:
-        if remaining <= 0:
-            break
-        take = b.qty if b.qty <= remaining else remaining
-        b.qty = b.qty - take
-        remaining -= take
-
-        tx = InventoryTxn(
-            correlation_id=correlation_id,
-            txn_type="ISSUE_TO_WIP",
-            item_id=item_id,
-            from_location_id=b.location_id,
-            to_location_id=None,
-            lot_id=b.lot_id,
-            handling_unit_id=b.handling_unit_id,
-            state=b.state,
-            qty=take,
-            unit_cost=unit_cost,
-            ext_cost=(unit_cost * take) if unit_cost is not None else None,
-            uom="EA",
-            actor=actor,
-            reason=reason,
-            meta={**(meta or {}), "tenant_id": get_tenant_id()},
-        )
-        db.add(tx)
-        created.append(tx)
-
-    if remaining > 0:
-        raise ValueError(f"Insufficient inventory for FIFO issue: short {remaining}")
-
-    db.commit()
-    for tx in created:
-        db.refresh(tx)
-    return created
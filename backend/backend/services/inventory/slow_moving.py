@@ -0,0 +1,219 @@
+from __future__ import annotations
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import case, func, insert, select
+from sqlalchemy.orm import Session
+from app.db.models.common import uuid4_str
+from app.db.models.costing import ItemCost
+from app.db.models.inventory import InventoryItem, ItemLocationActivity, SlowMovingAnalysis, SlowMovingItem
+from app.db.models.inventory_exec import InventoryBalance, InventoryTxn
+from app.db.upsert import insert_for
+from app.events.outbox import OutboxCursor, OutboxEvent
+from services.inventory.abc import months_ago
+
+# Slow-moving / obsolete stock (inv_slow_moving_analysis / inv_slow_moving_item).
+#
+# Days since last movement come from inv_item_location_activity (the last-movement index), never
+# from per-item ledger queries:
+# - rebuild_activity_index(): one grouped pass over wms_inventory_txn (from side + to side).
+# - refresh_activity_index(): folds InventoryChanged outbox events since the last refresh into
+#   the index with "keep the later timestamp" upserts. Re-reading an event is harmless, so each
+#   refresh re-reads a short overlap window instead of trusting commit order.
+# Usage over the lookback window is one more grouped query; the analysis itself is a single
+# pass over stocked (item, location) pairs with bulk-inserted results.
+CURSOR = "inventory.activity"
+_OVERLAP = timedelta(minutes=5)
+_FETCH_ROWS = 10_000
+_WRITE_ROWS = 1000
+_DAYS_PER_MONTH = 30
+
+def _later(col, new):
+    """SQL: the later of the stored timestamp and the incoming one (NULL-safe, any dialect)."""
+    return case((col.is_(None), new), (new.is_(None), col), (new > col, new), else_=col)
+
+def _upsert_activity(db: Session, rows: list[dict]) -> None:
+    A = ItemLocationActivity
+    for i in range(0, len(rows), _WRITE_ROWS):
+        stmt = insert_for(db, A).values(rows[i:i + _WRITE_ROWS])
+        x = stmt.excluded
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[A.item_id, A.location_id],
+            set_={"last_receipt_at": _later(A.last_receipt_at, x.last_receipt_at),
+                  "last_issue_at": _later(A.last_issue_at, x.last_issue_at),
+                  "last_movement_at": _later(A.last_movement_at, x.last_movement_at),
+                  "updated_at": x.updated_at},
+        ))
+
+def _merge(acc: dict, key: tuple, receipt=None, issue=None, movement=None) -> None:
+    cur = acc.setdefault(key, [None, None, None])
+    for i, ts in enumerate((receipt, issue, movement)):
+        if ts is not None and (cur[i] is None or ts > cur[i]):
+            cur[i] = ts
+
+def _activity_rows(acc: dict) -> list[dict]:
+    now = datetime.utcnow()
+    return [{"item_id": k[0], "location_id": k[1], "last_receipt_at": r, "last_issue_at": i,
+             "last_movement_at": m, "updated_at": now}
+            for k, (r, i, m) in sorted(acc.items())]
+
+def _set_cursor(db: Session, at: datetime | None) -> None:
+    stmt = insert_for(db, OutboxCursor).values(consumer=CURSOR, last_created_at=at, updated_at=datetime.utcnow())
+    db.execute(stmt.on_conflict_do_update(index_elements=[OutboxCursor.consumer],
+                                          set_={"last_created_at": stmt.excluded.last_created_at,
+                                                "updated_at": stmt.excluded.updated_at}))
+
+def rebuild_activity_index(db: Session) -> int:
+    """Recompute the whole index from the ledger; returns (item, location) pairs written."""
+    T = InventoryTxn
+    # Events up to here are covered by this pass; refreshes continue from this point.
+    cursor_at = db.execute(select(func.max(OutboxEvent.created_at)).where(OutboxEvent.topic == "InventoryChanged")).scalar()
+    moved = (T.from_location_id.is_(None)) | (T.to_location_id.is_(None)) | (T.from_location_id != T.to_location_id)
+    acc: dict[tuple, list] = {}
+    from_side = db.execute(
+        select(T.item_id, T.from_location_id,
+               func.max(case((T.to_location_id.is_(None), T.created_at))),
+               func.max(case((moved, T.created_at))))
+        .where(T.from_location_id.isnot(None))
+        .group_by(T.item_id, T.from_location_id)
+        .execution_options(stream_results=True)
+    )
+    for chunk in from_side.partitions(_FETCH_ROWS):
+        for item_id, loc, issue, movement in chunk:
+            _merge(acc, (item_id, loc), issue=issue, movement=movement)
+    to_side = db.execute(
+        select(T.item_id, T.to_location_id,
+               func.max(case((T.from_location_id.is_(None), T.created_at))),
+               func.max(case((moved, T.created_at))))
+        .where(T.to_location_id.isnot(None))
+        .group_by(T.item_id, T.to_location_id)
+        .execution_options(stream_results=True)
+    )
+    for chunk in to_side.partitions(_FETCH_ROWS):
+        for item_id, loc, receipt, movement in chunk:
+            _merge(acc, (item_id, loc), receipt=receipt, movement=movement)
+
+    db.query(ItemLocationActivity).delete(synchronize_session=False)
+    if acc:
+        db.execute(insert(ItemLocationActivity), _activity_rows(acc))
+    _set_cursor(db, cursor_at)
+    db.commit()
+    return len(acc)
+
+def refresh_activity_index(db: Session) -> int:
+    """Fold InventoryChanged events since the last refresh into the index; returns events read."""
+    last = db.get(OutboxCursor, CURSOR)
+    q = select(OutboxEvent.created_at, OutboxEvent.payload).where(OutboxEvent.topic == "InventoryChanged")
+    if last is not None and last.last_created_at is not None:
+        q = q.where(OutboxEvent.created_at > last.last_created_at - _OVERLAP)
+    acc: dict[tuple, list] = {}
+    seen = 0
+    newest = last.last_created_at if last is not None else None
+    for chunk in db.execute(q.order_by(OutboxEvent.created_at).execution_options(stream_results=True)).partitions(_FETCH_ROWS):
+        for created_at, p in chunk:
+            seen += 1
+            newest = created_at if newest is None or created_at > newest else newest
+            src, dst = p.get("from_location_id"), p.get("to_location_id")
+            if src and dst and src == dst:
+                continue  # state change in place (e.g. reservation), not a movement
+            if src:
+                _merge(acc, (p["item_id"], src), issue=created_at if not dst else None, movement=created_at)
+            if dst:
+                _merge(acc, (p["item_id"], dst), receipt=created_at if not src else None, movement=created_at)
+    if acc:
+        _upsert_activity(db, _activity_rows(acc))
+    _set_cursor(db, newest)
+    db.commit()
+    return seen
+
+def _days_since(ts: datetime | None, today: date) -> int | None:
+    return None if ts is None else (today - ts.date()).days
+
+def run_slow_moving_analysis(db: Session, *, lookback_months: int = 12, no_movement_months: int = 6,
+                             slow_moving_threshold: float = 1.0, rebuild: bool = False, actor: str = "system",
+                             analysis_date: date | None = None) -> SlowMovingAnalysis:
+    """Classify stocked (item, location) pairs; rebuild=True recomputes the last-movement index first.
+
+    slow_moving_threshold is units per month: below it (but moving) is SLOW_MOVING.
+    """
+    today = analysis_date or date.today()
+    if rebuild or db.get(OutboxCursor, CURSOR) is None:
+        rebuild_activity_index(db)
+    else:
+        refresh_activity_index(db)
+
+    start = months_ago(today, lookback_months)
+    T = InventoryTxn
+    usage = dict(((r[0], r[1]), float(r[2])) for r in db.execute(
+        select(T.item_id, T.from_location_id, func.sum(T.qty))
+        .where(T.from_location_id.isnot(None), T.to_location_id.is_(None), T.created_at >= start)
+        .group_by(T.item_id, T.from_location_id)
+    ))
+    activity = {(a.item_id, a.location_id): a for a in db.query(ItemLocationActivity)}
+
+    B = InventoryBalance
+    unit_cost = func.coalesce(func.nullif(ItemCost.avg_cost, 0), InventoryItem.average_cost, InventoryItem.standard_cost, 0)
+    stocked = db.execute(
+        select(B.item_id, B.location_id, func.sum(B.qty), func.min(B.created_at), func.max(unit_cost),
+               func.max(InventoryItem.lifecycle_status))
+        .join(InventoryItem, InventoryItem.id == B.item_id)
+        .outerjoin(ItemCost, ItemCost.item_id == B.item_id)
+        .group_by(B.item_id, B.location_id)
+        .having(func.sum(B.qty) > 0)
+    ).all()
+
+    no_move_days = no_movement_months * _DAYS_PER_MONTH
+    now = datetime.utcnow()
+    rows: list[dict] = []
+    counts = {"NO_MOVEMENT": 0, "SLOW_MOVING": 0, "EXCESS": 0, "OBSOLETE": 0}
+    at_risk = Decimal("0")
+    for item_id, location_id, on_hand, first_seen, cost, lifecycle in stocked:
+        a = activity.get((item_id, location_id))
+        last_move = a.last_movement_at if a else None
+        days = _days_since(last_move or first_seen, today) or 0
+        used = usage.get((item_id, location_id), 0.0)
+        per_month = used / lookback_months
+        months_of_supply = float(on_hand) / per_month if per_month > 0 else None
+
+        if lifecycle == "OBSOLETE" or days >= 2 * no_move_days:
+            cls, rec = "OBSOLETE", "SCRAP"
+        elif days >= no_move_days:
+            cls, rec = "NO_MOVEMENT", "DISCOUNT_SALE"
+        elif per_month < slow_moving_threshold:
+            cls, rec = "SLOW_MOVING", "DISCOUNT_SALE"
+        elif months_of_supply is not None and months_of_supply > lookback_months:
+            cls, rec = "EXCESS", "RETURN_TO_VENDOR"
+        else:
+            continue
+        value = (Decimal(on_hand) * Decimal(cost or 0)).quantize(Decimal("0.01"))
+        counts[cls] += 1
+        at_risk += value
+        rows.append({
+            "id": uuid4_str(), "created_at": now, "item_id": item_id, "location_id": location_id,
+            "on_hand_qty": on_hand, "on_hand_value": value,
+            "last_receipt_date": a.last_receipt_at.date() if a and a.last_receipt_at else None,
+            "last_issue_date": a.last_issue_at.date() if a and a.last_issue_at else None,
+            "days_since_last_movement": days, "usage_last_12_months": Decimal(str(used)),
+            "months_of_supply": round(months_of_supply, 2) if months_of_supply is not None and months_of_supply < 1e8 else None,
+            "classification": cls, "recommendation": rec, "disposition_status": "PENDING",
+        })
+
+    analysis = SlowMovingAnalysis(
+        analysis_date=today,
+        lookback_months=lookback_months,
+        no_movement_months=no_movement_months,
+        slow_moving_threshold=Decimal(str(slow_moving_threshold)),
+        total_items_analyzed=len(stocked),
+        no_movement_items=counts["NO_MOVEMENT"] + counts["OBSOLETE"],
+        slow_moving_items=counts["SLOW_MOVING"],
+        total_value_at_risk=at_risk,
+        performed_by=actor,
+        meta={"counts": counts, "unit": "item_location"},
+    )
+    db.add(analysis)
+    db.flush()
+    for r in rows:
+        r["analysis_id"] = analysis.id
+    for i in range(0, len(rows), _WRITE_ROWS):
+        db.execute(insert(SlowMovingItem), rows[i:i + _WRITE_ROWS])
+    db.commit()
+    return analysis
@@ -0,0 +1,128 @@
+from __future__ import annotations
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import func, literal_column, select
+from sqlalchemy.orm import Session
+from app.db.models.common import uuid4_str
+from app.db.models.inventory import InventoryItem, StockStatusSummary, STOCK_STATUS_KEY
+from app.db.models.inventory_exec import InventoryBalance, InventoryReservation, WMSLocation
+from app.db.upsert import insert_for
+
+# Stock status per item and site (inv_stock_status), kept in step with wms_inventory_balance.
+#
+# Whatever changes balances passes the same per-balance-key deltas to apply_stock_status() in the
+# same transaction. Deltas are summed per (item, site) into on-hand plus one bucket per state and
+# upserted with SET qty = qty + delta, so concurrent movements serialize on the summary row the
+# same way they do on balance rows; the safety-stock / reorder-point / overstock flags are
+# recomputed in that statement from the new quantities. Reservations are not a balance state
+# (wms_inventory_reservation): apply_reservations() moves their qty from available to reserved,
+# leaving on-hand alone. rebuild_stock_status() recomputes every row from the balances and the
+# reservation ledger (recovery, or after planning parameters change on the item master).
+# on_order_qty / in_transit_qty are not balance states and are left to their owners.
+BUCKETS = {"AVAILABLE": "available_qty", "RESERVED": "reserved_qty", "QUARANTINE": "quarantine_qty", "HOLD": "hold_qty"}
+_QTY_COLS = ("on_hand_qty", *BUCKETS.values())
+_FETCH_ROWS = 10_000
+_WRITE_ROWS = 500
+
+StatusKey = tuple  # (item_id, site_id)
+
+def _flags(on_hand, available, safety, reorder, maximum) -> dict:
+    """Status flags; works on Decimals and on SQL expressions alike."""
+    return {
+        "is_below_safety_stock": (safety > 0) & (available < safety),
+        "is_below_reorder_point": (reorder > 0) & (available <= reorder),
+        "is_overstock": (maximum > 0) & (on_hand > maximum),
+    }
+
+def _add(buckets: dict[StatusKey, list[Decimal]], key: StatusKey, state: str, qty: Decimal) -> None:
+    acc = buckets.setdefault(key, [Decimal("0")] * len(_QTY_COLS))
+    acc[0] += qty
+    col = BUCKETS.get(state)
+    if col is not None:
+        acc[_QTY_COLS.index(col)] += qty
+
+def _upsert(db: Session, buckets: dict[StatusKey, list[Decimal]]) -> None:
+    if not buckets:
+        return
+    S = StockStatusSummary
+    planning = {r[0]: r[1:] for r in db.execute(
+        select(InventoryItem.id, InventoryItem.safety_stock_qty, InventoryItem.reorder_point, InventoryItem.maximum_quantity)
+        .where(InventoryItem.id.in_({k[0] for k in buckets}))
+    )}
+    now = datetime.utcnow()
+    rows = []
+    for key, qtys in sorted(buckets.items(), key=lambda kv: (kv[0][0], kv[0][1] or "")):
+        safety, reorder, maximum = (Decimal(v or 0) for v in planning.get(key[0], (0, 0, 0)))
+        row = {"id": uuid4_str(), "created_at": now, "item_id": key[0], "site_id": key[1],
+               "safety_stock": safety, "reorder_point": reorder, "last_updated": now, **dict(zip(_QTY_COLS, qtys))}
+        rows.append({**row, **_flags(row["on_hand_qty"], row["available_qty"], safety, reorder, maximum)})
+
+    # Correlated by name: an INSERT is not a SELECT, so SQLAlchemy would not correlate S.item_id.
+    maximum = (select(func.coalesce(InventoryItem.maximum_quantity, 0))
+               .where(InventoryItem.id == literal_column(f"{S.__tablename__}.item_id")).scalar_subquery())
+    for i in range(0, len(rows), _WRITE_ROWS):
+        stmt = insert_for(db, S).values(rows[i:i + _WRITE_ROWS])
+        x = stmt.excluded
+        new = {c: getattr(S, c) + getattr(x, c) for c in _QTY_COLS}
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=list(STOCK_STATUS_KEY),
+            set_={**new, "safety_stock": x.safety_stock, "reorder_point": x.reorder_point, "last_updated": x.last_updated,
+                  **_flags(new["on_hand_qty"], new["available_qty"], x.safety_stock, x.reorder_point, maximum)},
+        ))
+
+def apply_stock_status(db: Session, deltas: dict[tuple, Decimal]) -> None:
+    """Fold balance deltas keyed by (item, location, lot, HU, state) into the item/site rows."""
+    locations = {k[1] for k in deltas}
+    sites = dict(db.execute(select(WMSLocation.id, WMSLocation.site_id).where(WMSLocation.id.in_(locations))).all()) if locations else {}
+    buckets: dict[StatusKey, list[Decimal]] = {}
+    for (item_id, location_id, _lot, _hu, state), qty in deltas.items():
+        if qty:
+            _add(buckets, (item_id, sites.get(location_id)), state, Decimal(qty))
+    _upsert(db, buckets)
+
+def apply_reservations(db: Session, deltas: dict[tuple, Decimal]) -> None:
+    """Fold reservation deltas keyed by (item, location) into the item/site rows (available -> reserved)."""
+    locations = {k[1] for k in deltas}
+    sites = dict(db.execute(select(WMSLocation.id, WMSLocation.site_id).where(WMSLocation.id.in_(locations))).all()) if locations else {}
+    buckets: dict[StatusKey, list[Decimal]] = {}
+    for (item_id, location_id), qty in deltas.items():
+        if qty:
+            _add_reserved(buckets, (item_id, sites.get(location_id)), Decimal(qty))
+    _upsert(db, buckets)
+
+def _add_reserved(buckets: dict[StatusKey, list[Decimal]], key: StatusKey, qty: Decimal) -> None:
+    _add(buckets, key, "RESERVED", qty)
+    _add(buckets, key, "AVAILABLE", -qty)
+
+def rebuild_stock_status(db: Session, *, commit: bool = True) -> int:
+    """Recompute every item/site row from balances and reservations; returns rows written."""
+    B = InventoryBalance
+    grouped = db.execute(
+        select(B.item_id, WMSLocation.site_id, B.state, func.sum(B.qty))
+        .join(WMSLocation, WMSLocation.id == B.location_id)
+        .group_by(B.item_id, WMSLocation.site_id, B.state)
+        .execution_options(stream_results=True)
+    )
+    buckets: dict[StatusKey, list[Decimal]] = {}
+    for chunk in grouped.partitions(_FETCH_ROWS):
+        for item_id, site_id, state, qty in chunk:
+            _add(buckets, (item_id, site_id), state, Decimal(qty or 0))
+    R = InventoryReservation
+    for item_id, site_id, qty in db.execute(
+        select(R.item_id, WMSLocation.site_id, func.sum(R.qty))
+        .join(WMSLocation, WMSLocation.id == R.location_id)
+        .group_by(R.item_id, WMSLocation.site_id)
+    ):
+        _add_reserved(buckets, (item_id, site_id), Decimal(qty or 0))
+    db.query(StockStatusSummary).delete(synchronize_session=False)
+    _upsert(db, buckets)
+    if commit:
+        db.commit()
+    return len(buckets)
+
+def stock_status(db: Session, *, item_id: str, site_id: str | None = None) -> StockStatusSummary | None:
+    """Single-row read of the item's status at a site (site_id None: locations without a site)."""
+    return db.execute(
+        select(StockStatusSummary).where(StockStatusSummary.item_id == item_id,
+                                         STOCK_STATUS_KEY[1] == (site_id or ""))
+    ).scalar_one_or_none()
@@ -0,0 +1,148 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+import numpy as np
+from sqlalchemy import case, func, insert, select
+from sqlalchemy.orm import Session
+from app.db.models.accounting import ProductCost
+from app.db.models.common import uuid4_str
+from app.db.models.costing import FifoLayer, ItemCost
+from app.db.models.inventory import InventoryItem, InventoryValuation, InventoryValuationLine
+from app.db.models.inventory_exec import InventoryBalance, BalanceReserved, AVAILABLE_QTY, WMSLocation
+from app.db.session import SessionLocal
+
+# Inventory valuation snapshots (inv_valuation_snapshot / inv_valuation_line).
+#
+# Per site: one grouped balance query (qty by item/location/lot, with reserved and available
+# split out by state) and one query per cost source, all loaded as columns. Unit costs are
+# resolved per distinct item with NumPy (np.unique + fancy indexing), extended values are a
+# vector multiply, and lines are written with bulk INSERTs. Sites run in parallel, each on its
+# own session.
+METHODS = {"FIFO": "FIFO", "AVG": "AVERAGE", "STD": "STANDARD"}
+_WRITE_ROWS = 1000
+
+def _site_filter(site_id: str | None):
+    return WMSLocation.site_id == site_id if site_id is not None else WMSLocation.site_id.is_(None)
+
+def _site_items(site_id: str | None):
+    """Item ids stocked at the site, as a subquery (avoids 500k-element IN lists)."""
+    return (select(InventoryBalance.item_id).join(WMSLocation, WMSLocation.id == InventoryBalance.location_id)
+            .where(_site_filter(site_id)).distinct())
+
+def _balance_columns(db: Session, site_id: str | None):
+    B = InventoryBalance
+    reserved = func.coalesce(BalanceReserved.qty, 0)  # reservation ledger counter, AVAILABLE rows only
+    rows = db.execute(
+        select(B.item_id, B.location_id, B.lot_id, func.sum(B.qty),
+               func.sum(case((B.state == "RESERVED", B.qty), else_=reserved)),
+               func.sum(case((B.state == "AVAILABLE", AVAILABLE_QTY), else_=0)))
+        .join(WMSLocation, WMSLocation.id == B.location_id)
+        .outerjoin(BalanceReserved, BalanceReserved.balance_id == B.id)
+        .where(_site_filter(site_id))
+        .group_by(B.item_id, B.location_id, B.lot_id)
+        .having(func.sum(B.qty) != 0)
+    ).all()
+    if not rows:
+        return None
+    item_ids, location_ids, lot_ids, on_hand, reserved, available = zip(*rows)
+    return (np.array(item_ids, dtype=object), location_ids, lot_ids,
+            np.array(on_hand, dtype=np.float64), np.array(reserved, dtype=np.float64), np.array(available, dtype=np.float64))
+
+def _cost_map(db: Session, q) -> dict[str, float]:
+    return {r[0]: float(r[1]) for r in db.execute(q) if r[1] is not None}
+
+def _lookup(items: np.ndarray, costs: dict[str, float]) -> np.ndarray:
+    """Cost per item as an array aligned with `items` (NaN where missing)."""
+    return np.array([costs.get(i, np.nan) for i in items], dtype=np.float64)
+
+def _latest_product_cost(db: Session, items, cost_types: tuple[str, ...], as_of: date) -> dict[str, float]:
+    latest = (select(ProductCost.item_id, func.max(ProductCost.effective_date).label("d"))
+              .where(ProductCost.item_id.in_(items), ProductCost.cost_type.in_(cost_types), ProductCost.effective_date <= as_of)
+              .group_by(ProductCost.item_id).subquery())
+    return _cost_map(db, select(ProductCost.item_id, ProductCost.total_cost)
+                     .join(latest, (latest.c.item_id == ProductCost.item_id) & (latest.c.d == ProductCost.effective_date))
+                     .where(ProductCost.cost_type.in_(cost_types)))
+
+def _coalesce(*arrays: np.ndarray) -> np.ndarray:
+    out = arrays[0].copy()
+    for a in arrays[1:]:
+        out = np.where(np.isnan(out) | (out <= 0), a, out)
+    return np.nan_to_num(out, nan=0.0)
+
+def _unit_costs(db: Session, method: str, items: np.ndarray, ids, as_of: date) -> np.ndarray:
+    """Unit cost per distinct item, in the order of `items` (ids: the same items as a subquery)."""
+    ic_avg = _lookup(items, _cost_map(db, select(ItemCost.item_id, ItemCost.avg_cost).where(ItemCost.item_id.in_(ids))))
+    master = db.execute(select(InventoryItem.id, InventoryItem.average_cost, InventoryItem.standard_cost)
+                        .where(InventoryItem.id.in_(ids))).all()
+    m_avg = _lookup(items, {r[0]: float(r[1]) for r in master if r[1] is not None})
+    m_std = _lookup(items, {r[0]: float(r[2]) for r in master if r[2] is not None})
+    pc_avg = _lookup(items, _latest_product_cost(db, ids, ("AVERAGE", "ACTUAL"), as_of))
+    avg = _coalesce(ic_avg, m_avg, pc_avg)
+    if method == "AVG":
+        return avg
+    if method == "STD":
+        ic_std = _lookup(items, _cost_map(db, select(ItemCost.item_id, ItemCost.std_cost).where(ItemCost.item_id.in_(ids))))
+        pc_std = _lookup(items, _latest_product_cost(db, ids, ("STANDARD",), as_of))
+        return _coalesce(ic_std, pc_std, m_std)
+    # FIFO: on-hand is what remains in the open layers, so value it at their weighted cost;
+    # items without layers fall back to average cost.
+    layers = db.execute(
+        select(FifoLayer.item_id, func.sum(FifoLayer.qty_remaining * FifoLayer.unit_cost), func.sum(FifoLayer.qty_remaining))
+        .where(FifoLayer.item_id.in_(ids), FifoLayer.qty_remaining > 0)
+        .group_by(FifoLayer.item_id)
+    ).all()
+    fifo = _lookup(items, {r[0]: float(r[1]) / float(r[2]) for r in layers if r[2]})
+    return _coalesce(fifo, avg)
+
+def value_site(db: Session, *, method: str, site_id: str | None, valuation_date: date,
+               snapshot_type: str = "AD_HOC", actor: str | None = None) -> InventoryValuation:
+    cols = _balance_columns(db, site_id)
+    snap = InventoryValuation(
+        valuation_date=valuation_date,
+        snapshot_type=snapshot_type,
+        as_of=datetime.utcnow(),
+        site_id=site_id,
+        total_quantity=Decimal("0"),
+        total_value=Decimal("0"),
+        valuation_method=METHODS[method],
+        posted_by=actor,
+        meta={"lines": 0},
+    )
+    db.add(snap)
+    db.flush()
+    if cols is not None:
+        item_ids, location_ids, lot_ids, on_hand, reserved, available = cols
+        items, inverse = np.unique(item_ids, return_inverse=True)
+        unit = np.round(_unit_costs(db, method, items, _site_items(site_id), valuation_date)[inverse], 6)
+        extended = np.round(on_hand * unit, 2)
+        rows = [{
+            "id": uuid4_str(), "created_at": snap.as_of, "valuation_id": snap.id, "item_id": i, "location_id": loc,
+            "lot_id": lot, "on_hand_qty": q, "reserved_qty": r, "available_qty": a, "unit_cost": u, "extended_value": v,
+        } for i, loc, lot, q, r, a, u, v in zip(item_ids.tolist(), location_ids, lot_ids, on_hand.tolist(),
+                                                reserved.tolist(), available.tolist(), unit.tolist(), extended.tolist())]
+        for i in range(0, len(rows), _WRITE_ROWS):
+            db.execute(insert(InventoryValuationLine), rows[i:i + _WRITE_ROWS])
+        snap.total_quantity = Decimal(str(round(float(on_hand.sum()), 6)))
+        snap.total_value = Decimal(str(round(float(extended.sum()), 2)))
+        snap.meta = {"lines": len(rows)}
+    db.commit()
+    return snap
+
+def _value_site_in_session(method: str, site_id: str | None, valuation_date: date, snapshot_type: str, actor: str | None) -> str:
+    with SessionLocal() as db:
+        return value_site(db, method=method, site_id=site_id, valuation_date=valuation_date,
+                          snapshot_type=snapshot_type, actor=actor).id
+
+def run_valuation(db: Session, *, method: str = "AVG", site_ids: list[str | None] | None = None,
+                  valuation_date: date | None = None, snapshot_type: str = "AD_HOC", actor: str | None = None,
+                  workers: int = 4) -> list[InventoryValuation]:
+    """One valuation snapshot per site (all sites with locations by default), sites in parallel."""
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {', '.join(METHODS)}")
+    valuation_date = valuation_date or date.today()
+    if site_ids is None:
+        site_ids = [r[0] for r in db.execute(select(WMSLocation.site_id).distinct())]
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(site_ids) or 1))) as pool:
+        ids = list(pool.map(lambda s: _value_site_in_session(method, s, valuation_date, snapshot_type, actor), site_ids))
+    return db.query(InventoryValuation).filter(InventoryValuation.id.in_(ids)).all()
@@ -1,10 +1,18 @@
 from __future__ import annotations
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from app.db.session import get_db
+from app.core.security import Principal, get_principal
+from app.db.session import ReadSessionLocal, get_db, get_read_db
 from app.db.models.inventory import InventoryItem
-from app.db.models.inventory_exec import WMSLocation, InventoryBalance
+from app.db.models.inventory_exec import WMSLocation
 import uuid
+from datetime import timedelta
+from services.wms.inventory_ops.fifo_layers import compact_exhausted_layers
+from services.wms.inventory_ops.ledger_replay import queue_replay_job, replay_job, run_replay_job
+from services.wms.inventory_ops.occupancy import rebuild_occupancy
+from services.wms.inventory_ops.layout import LAYOUT_FIELDS, set_layout
+from services.wms.inventory_ops.balance_listing import EXPORT_FORMATS, BalanceFilter, balance_page, export_lines
 
 router = APIRouter(prefix="/inventory", tags=["inventory_wms"])
 
@@ -31,18 +39,111 @@ def create_item(payload: dict, db: Session = Depends(get_db)):
 @router.get("/locations")
 def list_locations(db: Session = Depends(get_db), limit: int = 200):
     locs = db.query(WMSLocation).order_by(WMSLocation.created_at.desc()).limit(limit).all()
-    return [{"id": l.id, "code": l.code, "type": l.type} for l in locs]
+    return [{"id": l.id, "code": l.code, "type": l.type, **{f: getattr(l, f) for f in LAYOUT_FIELDS}} for l in locs]
 
 @router.post("/locations")
 def create_location(payload: dict, db: Session = Depends(get_db)):
     code = payload.get("code")
     if not code:
         raise HTTPException(400, "code required")
-    loc = WMSLocation(code=code, type=payload.get("type") or "BIN", meta=payload.get("meta") or {})
+    loc = WMSLocation(code=code, type=payload.get("type") or "BIN", site_id=payload.get("site_id"), meta=payload.get("meta") or {})
+    set_layout(loc, payload)
     db.add(loc); db.commit(); db.refresh(loc)
     return {"id": loc.id, "code": loc.code}
 
+@router.post("/locations/import")
+def import_locations(payload: dict, db: Session = Depends(get_db)):
+    """Create or update locations by code; layout fields not given are kept, or parsed from the code if unset."""
+    rows = payload.get("locations") or []
+    if any(not r.get("code") for r in rows):
+        raise HTTPException(400, "code required")
+    existing = {l.code: l for l in db.query(WMSLocation).filter(WMSLocation.code.in_([r["code"] for r in rows]))}
+    created = 0
+    for r in rows:
+        loc = existing.get(r["code"])
+        if loc is None:
+            loc = existing[r["code"]] = WMSLocation(code=r["code"], meta={})
+            db.add(loc)
+            created += 1
+        loc.type = r.get("type") or loc.type or "BIN"
+        if "site_id" in r:
+            loc.site_id = r["site_id"]
+        if r.get("meta") is not None:
+            loc.meta = r["meta"]
+        set_layout(loc, r)
+    db.commit()
+    return {"created": created, "updated": len(existing) - created}
+
 @router.get("/balances")
-def list_balances(db: Session = Depends(get_db), limit: int = 200):
-    bs = db.query(InventoryBalance).limit(limit).all()
-    return [{"id": b.id, "item_id": b.item_id, "location_id": b.location_id, "qty": float(b.qty), "state": b.state} for b in bs]
+def list_balances(response: Response, f: BalanceFilter = Depends(), after: str | None = None, limit: int = 200,
+                  db: Session = Depends(get_read_db)):
+    """One page of balances (id order); the X-Next-After header is the `after` of the next page."""
+    rows, next_after = balance_page(db, f, after=after, limit=limit)
+    if next_after:
+        response.headers["X-Next-After"] = next_after
+    return rows
+
+@router.get("/balances/export")
+def export_balances(f: BalanceFilter = Depends(), format: str = "ndjson"):
+    """Every matching balance as streamed NDJSON or CSV (constant memory)."""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(400, "format must be ndjson or csv")
+
+    def body():
+        # Own session: the stream outlives the request's dependencies
+        with ReadSessionLocal() as db:
+            yield from export_lines(db, f, format)
+
+    return StreamingResponse(body(), media_type=EXPORT_FORMATS[format],
+                             headers={"Content-Disposition": f'attachment; filename="balances.{format}"'})
+
+@router.post("/fifo-layers/compact")
+def compact_fifo_layers(payload: dict | None = None, db: Session = Depends(get_db)):
+    payload = payload or {}
+    moved = compact_exhausted_layers(
+        db,
+        older_than=timedelta(days=int(payload.get("older_than_days", 30))),
+        batch_size=int(payload.get("batch_size", 1000)),
+    )
+    return {"archived": moved}
+
+@router.post("/ledger/replay", status_code=202)
+def replay_inventory_ledger(background: BackgroundTasks, payload: dict | None = None,
+                            principal: Principal = Depends(get_principal)):
+    """Start a background rebuild of balances from wms_inventory_txn that reports (or, with
+    repair=true, fixes) drift; poll GET /ledger/replay/{job_id} for the report."""
+    if not principal.user_id:
+        raise HTTPException(401, "Not authenticated")
+    payload = payload or {}
+    repair = bool(payload.get("repair", False))
+    if repair and "ADMIN" not in principal.roles:
+        raise HTTPException(403, "ADMIN role required")
+    try:
+        partitions = int(payload.get("partitions", 1))
+        workers = int(payload["workers"]) if payload.get("workers") is not None else None
+    except (TypeError, ValueError):
+        raise HTTPException(400, "partitions and workers must be integers")
+    if partitions < 1 or (workers is not None and workers < 1):
+        raise HTTPException(400, "partitions and workers must be at least 1")
+    job_id = queue_replay_job(repair=repair)
+    background.add_task(
+        run_replay_job, job_id,
+        partitions=partitions,
+        workers=workers,
+        repair=repair,
+    )
+    return {"job_id": job_id, **replay_job(job_id)}
+
+@router.get("/ledger/replay/{job_id}")
+def get_ledger_replay(job_id: str, principal: Principal = Depends(get_principal)):
+    if not principal.user_id:
+        raise HTTPException(401, "Not authenticated")
+    job = replay_job(job_id)
+    if job is None:
+        raise HTTPException(404, "Replay job not found")
+    return {"job_id": job_id, **job}
+
+@router.post("/occupancy/rebuild")
+def rebuild_location_occupancy(db: Session = Depends(get_db)):
+    """Recompute wms_location_occupancy from the balances (recovery, or after item dimensions change)."""
+    return {"rows": rebuild_occupancy(db)}
@@ -1,5 +1,6 @@
 from __future__ import annotations
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from decimal import Decimal
 import uuid
@@ -13,7 +14,7 @@ from app.db.models.mes_exec import WorkCenter, Routing, ProductionOrder, Product
 from app.db.models.inventory import InventoryItem
 from app.db.models.inventory_exec import InventoryTxn, WIPBalance, WIPTxn
 from app.db.models.genealogy import GenealogyLink
-from services.inventory.fifo import fifo_issue
+from services.inventory.fifo import IssueLine, fifo_issue_lines
 from services.accounting.posting import create_auto_journal
 
 router = APIRouter(prefix="/mes", tags=["mes"], dependencies=[Depends(require_module_enabled("mes"))])
@@ -101,58 +102,70 @@ def issue_materials(po_id: str, payload: dict, db: Session = Depends(get_db), pr
     total_cost = Decimal("0")
     created_txn_ids = []
 
+    item_ids = {m.get("item_id") for m in mats if m.get("item_id")}
+    items = {i.id: i for i in db.query(InventoryItem).filter(InventoryItem.id.in_(item_ids))}
+    lines: list[IssueLine] = []
     for m in mats:
         item_id = m.get("item_id")
         qty = Decimal(str(m.get("qty") or 0))
         if not item_id or qty <= 0:
             raise HTTPException(400, "item_id and qty>0 required")
 
-        item = db.query(InventoryItem).filter(InventoryItem.id == item_id).first()
+        item = items.get(item_id)
         if not item:
             raise HTTPException(404, f"item not found: {item_id}")
 
-        unit_cost = m.get("unit_cost")
-        if unit_cost is None:
-            unit_cost = item.average_cost or item.standard_cost or Decimal("0")
-        unit_cost = Decimal(str(unit_cost))
-
-        # FIFO consume balances and create ISSUE_TO_WIP InventoryTxn rows
-        try:
-            txns = fifo_issue(
-                db,
-                correlation_id=corr,
-                item_id=item_id,
-                location_id=m.get("from_location_id"),
-                qty=qty,
-                actor=principal.username,
-                reason=m.get("reason") or "Issue to WIP",
-                lot_id=m.get("lot_id"),
-                state=m.get("state") or "AVAILABLE",
-                unit_cost=unit_cost,
-                meta={"production_order_id": po_id},
-            )
-        except Exception as e:
-            raise HTTPException(409, str(e))
-
-        for tx in txns:
-            created_txn_ids.append(tx.id)
-            ext_cost = Decimal(str(tx.ext_cost or 0))
-            total_cost += ext_cost
-            db.add(WIPTxn(
-                tenant_id=get_tenant_id(),
-                production_order_id=po_id,
-                txn_type="MAT_ISSUE",
-                item_id=item_id,
-                qty=tx.qty,
-                unit_cost=unit_cost,
-                ext_cost=ext_cost,
-                reference=corr,
-                meta={"inv_txn_id": tx.id, "lot_id": tx.lot_id},
-            ))
-
-        pm = db.query(ProductionMaterial).filter(ProductionMaterial.prod_order_id==po_id, ProductionMaterial.item_id==item_id).first()
-        if pm:
-            pm.qty_issued = (pm.qty_issued or Decimal("0")) + qty
+        lines.append(IssueLine(
+            item_id=item_id,
+            qty=qty,
+            location_id=m.get("from_location_id"),
+            lot_id=m.get("lot_id"),
+            state=m.get("state") or "AVAILABLE",
+            unit_cost=Decimal(str(m["unit_cost"])) if m.get("unit_cost") is not None else None,
+            reason=m.get("reason"),
+        ))
+
+    # FIFO consume balances for all materials at once and create ISSUE_TO_WIP InventoryTxn rows
+    try:
+        txns = fifo_issue_lines(
+            db,
+            correlation_id=corr,
+            lines=lines,
+            actor=principal.username,
+            reason="Issue to WIP",
+            meta={"production_order_id": po_id},
+            commit=False,
+        )
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(409, str(e))
+
+    wip_rows = []
+    for tx in txns:
+        created_txn_ids.append(tx.id)
+        ext_cost = tx.ext_cost
+        total_cost += ext_cost
+        wip_rows.append({
+            "id": str(uuid.uuid4()),
+            "tenant_id": get_tenant_id(),
+            "production_order_id": po_id,
+            "txn_type": "MAT_ISSUE",
+            "item_id": tx.item_id,
+            "qty": tx.qty,
+            "unit_cost": tx.unit_cost,
+            "ext_cost": ext_cost,
+            "reference": corr,
+            "meta": {"inv_txn_id": tx.id, "lot_id": tx.lot_id},
+        })
+    if wip_rows:
+        db.execute(insert(WIPTxn), wip_rows)
+
+    issued_qty: dict[str, Decimal] = {}
+    for l in lines:
+        issued_qty[l.item_id] = issued_qty.get(l.item_id, Decimal("0")) + l.qty
+    pms = db.query(ProductionMaterial).filter(ProductionMaterial.prod_order_id==po_id, ProductionMaterial.item_id.in_(issued_qty)).all()
+    for pm in pms:
+        pm.qty_issued = (pm.qty_issued or Decimal("0")) + issued_qty[pm.item_id]
 
     wb.total_cost = (wb.total_cost or Decimal("0")) + total_cost
     po.status = "IN_PROGRESS" if po.status != "DONE" else po.status
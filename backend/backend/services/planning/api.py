@@ -6,7 +6,7 @@ from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 
-from app.db.session import get_db
+from app.db.session import get_db, get_read_db
 from app.core.security import get_principal
 from app.core.tenant import get_tenant_id
 from app.db.models.planning import Forecast, PlannedOrder, MRPNettingRun
@@ -18,7 +18,7 @@ def health():
     return {"ok": True, "service": "planning"}
 
 @router.get("/forecasts")
-def list_forecasts(item_id: Optional[str] = None, db: Session = Depends(get_db), principal=Depends(get_principal)):
+def list_forecasts(item_id: Optional[str] = None, db: Session = Depends(get_read_db), principal=Depends(get_principal)):
     tenant_id = get_tenant_id()
     q = db.query(Forecast).filter(Forecast.tenant_id == tenant_id)
     if item_id:
@@ -75,7 +75,7 @@ def upsert_forecast(payload: dict, db: Session = Depends(get_db), principal=Depe
     return {"ok": True, "id": row.id}
 
 @router.get("/planned-orders")
-def list_planned_orders(status: Optional[str] = None, db: Session = Depends(get_db), principal=Depends(get_principal)):
+def list_planned_orders(status: Optional[str] = None, db: Session = Depends(get_read_db), principal=Depends(get_principal)):
     tenant_id = get_tenant_id()
     q = db.query(PlannedOrder).filter(PlannedOrder.tenant_id == tenant_id)
     if status:
@@ -1,70 +1,144 @@
 from __future__ import annotations
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from datetime import datetime
+from dataclasses import dataclass
+from sqlalchemy import insert, or_, select
+from datetime import date, datetime
+from decimal import Decimal
+from app.db.models.common import uuid4_str
 from app.db.models.docs import OutboundOrder, OutboundOrderLine
-from app.db.models.inventory_exec import InventoryBalance, Location, Item
+from app.db.models.inventory import InventoryItem
+from app.db.models.inventory_exec import InventoryReservation, allocation_candidate
 from app.db.models.wms.allocation import Allocation
 from app.db.models.planning import Backorder
-from services.wms.inventory_ops.reservation import reserve_from_balance, release_reservation
+from services.wms.inventory_ops.reservation import release, reserve
 from app.events.outbox import OutboxEvent
 
-def allocate_order(db: Session, order_id: str, *, create_backorders: bool = True) -> dict:
-    order = db.query(OutboundOrder).filter(OutboundOrder.id == order_id).first()
-    if not order:
-        raise ValueError("Order not found")
+# Allocation is set-based per wave (allocate_order is a wave of one):
+# - one query on the wms_allocation_candidate view (unreserved AVAILABLE BIN stock with lot expiry
+#   and receipt date pre-joined; ix_balance_item_state_expiry) loads the candidates of every SKU
+#   in the wave, skipping expired lots;
+# - lines are filled in memory, in wave order, from the SKU's candidates in strategy order;
+# - allocations, backorders and outbox events are bulk-inserted and every allocation becomes a
+#   reservation ledger row in one reservation.reserve() call. No balance row is locked: if a
+#   concurrent reservation took the stock meanwhile, the counter guard fails and the whole
+#   allocation raises (retry it).
+#
+# A strategy is a sort key over (candidate, qty the line still needs).
+_NO_EXPIRY = date.max
+
+STRATEGIES = {
+    "LARGEST_FIRST": lambda c, need: (-c.qty, c.id),      # fewest picks per line
+    "SMALLEST_FIRST": lambda c, need: (c.qty, c.id),      # empties small bins first
+    "OLDEST_FIRST": lambda c, need: (c.created_at, c.id),
+    # First expired, first out: shortest lot expiry first, stock without expiry last.
+    "FEFO": lambda c, need: (c.expiry_date or _NO_EXPIRY, c.received_at, c.id),
+    "FIFO": lambda c, need: (c.received_at, c.id),
+    # The smallest bin that covers the line on its own, else the largest bins first.
+    "LEAST_LOCATIONS": lambda c, need: (c.qty < need, c.qty if c.qty >= need else -c.qty, c.id),
+    # Bins the line empties completely, smallest first; the remainder from the largest bin.
+    "CLEAR_SMALL_BINS": lambda c, need: (c.qty > need, c.qty if c.qty <= need else -c.qty, c.id),
+}
+DEFAULT_STRATEGY = "LARGEST_FIRST"
 
-    lines = db.query(OutboundOrderLine).filter(OutboundOrderLine.order_id == order_id).all()
+@dataclass
+class _Candidate:
+    id: str
+    item_id: str
+    location_id: str
+    lot_id: str | None
+    handling_unit_id: str | None
+    qty: Decimal
+    created_at: datetime
+    received_at: datetime
+    expiry_date: date | None
 
-    # Clear existing allocations and release any outstanding reservations for this order (idempotent behavior).
-    existing = db.query(Allocation).filter(Allocation.order_id == order_id).all()
-    for a in existing:
-        # release reservation back to AVAILABLE (best effort)
-        release_reservation(db, correlation_id=f"dealloc:{order_id}", item_id=a.item_id, location_id=a.location_id, qty=float(a.qty), actor="system", reason="reallocate")
-    db.query(Allocation).filter(Allocation.order_id == order_id).delete()
+def _release(db: Session, order_ids: list[str], *, create_backorders: bool) -> None:
+    """Drop the orders' allocations, reservations (and open backorders)."""
+    release(db, InventoryReservation.demand_id.in_(order_ids))
+    db.query(Allocation).filter(Allocation.order_id.in_(order_ids)).delete(synchronize_session=False)
     if create_backorders:
-        db.query(Backorder).filter(Backorder.order_id == order_id, Backorder.status == "OPEN").delete()
+        db.query(Backorder).filter(Backorder.order_id.in_(order_ids), Backorder.status == "OPEN").delete(synchronize_session=False)
 
-    allocations = 0
-    short = []
+def _candidates(db: Session, order_ids: list[str]) -> dict[str, list[_Candidate]]:
+    """Unreserved, unexpired AVAILABLE stock in BIN locations for every SKU on the orders."""
+    V = allocation_candidate.c
+    skus = select(OutboundOrderLine.item_id).where(OutboundOrderLine.order_id.in_(order_ids))
+    rows = db.execute(
+        select(V.balance_id, V.item_id, V.location_id, V.lot_id, V.handling_unit_id, V.available_qty, V.created_at,
+               V.received_at, V.expiry_date)
+        .where(V.item_id.in_(skus), or_(V.expiry_date.is_(None), V.expiry_date >= date.today()))
+        .order_by(V.item_id, V.balance_id)
+    ).all()
+    by_item: dict[str, list[_Candidate]] = {}
+    for r in rows:
+        by_item.setdefault(r.item_id, []).append(_Candidate(*r))
+    return by_item
 
-    for ln in lines:
-        item = db.query(Item).filter(Item.id == ln.item_id).first()
-        need = float(ln.qty)
+def allocate_wave(db: Session, order_ids: list[str], *, strategy: str = DEFAULT_STRATEGY,
+                  create_backorders: bool = True, commit: bool = True) -> list[dict]:
+    """Allocate and reserve every line of the orders; earlier orders in `order_ids` are served first.
+
+    Returns one {order_id, allocations, short} per order. Re-running reallocates from scratch.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"strategy must be one of {', '.join(STRATEGIES)}")
+    found = {r[0] for r in db.execute(select(OutboundOrder.id).where(OutboundOrder.id.in_(order_ids)))}
+    if len(found) != len(set(order_ids)):
+        raise ValueError("Order not found")
+
+    rank = {oid: i for i, oid in enumerate(order_ids)}
+    lines = sorted(db.query(OutboundOrderLine).filter(OutboundOrderLine.order_id.in_(order_ids)).all(),
+                   key=lambda ln: (rank[ln.order_id], ln.created_at, ln.id))
+    _release(db, order_ids, create_backorders=create_backorders)
 
-        # Lock balances for this item in BIN locations to enforce hard reservation.
-        rows = (db.query(InventoryBalance)
-                .join(Location, Location.id == InventoryBalance.location_id)
-                .filter(InventoryBalance.item_id == ln.item_id,
-                        InventoryBalance.state == "AVAILABLE",
-                        Location.type == "BIN")
-                .order_by(desc(InventoryBalance.qty))
-                .with_for_update()
-                .all())
+    candidates = _candidates(db, order_ids)
+    order_by = STRATEGIES[strategy]
+    items = {i.id: i for i in db.query(InventoryItem).filter(InventoryItem.id.in_({ln.item_id for ln in lines}))}
 
-        for b in rows:
+    now = datetime.utcnow()
+    alloc_rows: list[dict] = []
+    backorder_rows: list[dict] = []
+    reservations: list[dict] = []
+    results = {oid: {"order_id": oid, "allocations": 0, "short": []} for oid in order_ids}
+    for ln in lines:
+        need = Decimal(ln.qty)
+        for c in sorted(candidates.get(ln.item_id, ()), key=lambda c: order_by(c, need)):
             if need <= 0:
                 break
-            avail = float(b.qty)
-            if avail <= 0:
+            if c.qty <= 0:
                 continue
-            take = min(avail, need)
-
-            # Reserve: AVAILABLE -> RESERVED (enforced by txn + balance updates)
-            reserve_from_balance(db, correlation_id=f"alloc:{order_id}:{ln.id}", item_id=ln.item_id, location_id=b.location_id, qty=take,
-                                 actor="system", reason="allocation")
-
-            a = Allocation(order_id=order_id, order_line_id=ln.id, item_id=ln.item_id, location_id=b.location_id, qty=take)
-            db.add(a)
-            allocations += 1
+            take = min(c.qty, need)
+            c.qty -= take
             need -= take
-
+            alloc_rows.append({"id": uuid4_str(), "created_at": now, "order_id": ln.order_id, "order_line_id": ln.id,
+                               "item_id": ln.item_id, "location_id": c.location_id, "lot_id": c.lot_id,
+                               "handling_unit_id": c.handling_unit_id, "qty": take})
+            reservations.append({"demand_id": ln.order_id, "demand_line_id": ln.id, "balance_id": c.id, "item_id": ln.item_id,
+                                 "location_id": c.location_id, "qty": take, "correlation_id": f"alloc:{ln.order_id}",
+                                 "actor": "system", "reason": "allocation"})
+            results[ln.order_id]["allocations"] += 1
         if need > 0:
-            short.append({"order_line_id": ln.id, "item_id": ln.item_id, "short_qty": need, "sku": item.sku if item else None})
+            item = items.get(ln.item_id)
+            results[ln.order_id]["short"].append({"order_line_id": ln.id, "item_id": ln.item_id, "short_qty": float(need),
+                                                  "sku": item.item_code if item else None})
             if create_backorders:
-                bo = Backorder(order_id=order_id, order_line_id=ln.id, item_id=ln.item_id, qty=need, status="OPEN", meta={"created_at": datetime.utcnow().isoformat()})
-                db.add(bo)
+                backorder_rows.append({"id": uuid4_str(), "created_at": now, "order_id": ln.order_id, "item_id": ln.item_id,
+                                       "qty": need, "reason": "NO_STOCK", "status": "OPEN",
+                                       "meta": {"order_line_id": ln.id, "created_at": now.isoformat()}})
+
+    if alloc_rows:
+        db.execute(insert(Allocation), alloc_rows)
+        reserve(db, reservations)
+    if backorder_rows:
+        db.execute(insert(Backorder), backorder_rows)
+    if results:
+        db.execute(insert(OutboxEvent), [{"topic": "OrderAllocated", "payload": {"order_id": r["order_id"], "short": r["short"]}}
+                                         for r in results.values()])
+    if commit:
+        db.commit()
+    else:
+        db.flush()
+    return list(results.values())
 
-    db.add(OutboxEvent(topic="OrderAllocated", payload={"order_id": order_id, "short": short}))
-    db.commit()
-    return {"order_id": order_id, "allocations": allocations, "short": short}
+def allocate_order(db: Session, order_id: str, *, create_backorders: bool = True, strategy: str = DEFAULT_STRATEGY) -> dict:
+    return allocate_wave(db, [order_id], strategy=strategy, create_backorders=create_backorders)[0]
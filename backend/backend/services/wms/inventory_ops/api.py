@@ -2,22 +2,10 @@ from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 from app.db.session import get_db
 from app.core.security import get_principal
-from app.db.models.inventory_exec import Item, Location, InventoryBalance, HandlingUnit
+from app.db.models.inventory_exec import Item, Location, HandlingUnit
 
 router = APIRouter(prefix="/inventory", tags=["inventory"])
 
-@router.get("/balances")
-def list_balances(db: Session = Depends(get_db), p=Depends(get_principal)):
-    rows = db.query(InventoryBalance).all()
-    return [{
-        "item_id": r.item_id,
-        "sku": r.item.sku,
-        "location_code": r.location.code,
-        "state": r.state,
-        "qty": float(r.qty),
-        "lot_id": r.lot_id,
-    } for r in rows]
-
 @router.post("/items")
 def create_item(payload: dict, db: Session = Depends(get_db), p=Depends(get_principal)):
     item = Item(sku=payload["sku"], description=payload.get("description"), tracking=payload.get("tracking","none"))
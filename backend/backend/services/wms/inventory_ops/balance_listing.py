@@ -0,0 +1,82 @@
+from __future__ import annotations
+import csv
+import io
+import json
+from dataclasses import dataclass
+from typing import Iterator
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.db.models.inventory import InventoryItem
+from app.db.models.inventory_exec import InventoryBalance, WMSLocation
+
+# Balance listing as a projection: one SELECT joining item and location (no ORM objects, no
+# lazy loads), filtered in SQL. Pages are keyset-paginated on the balance id (pass the last
+# id seen as `after`), so page N costs the same as page 1. Exports stream the same query
+# through a server-side cursor in chunks, so a full-warehouse dump runs in constant memory
+# and, being one statement, reads one consistent snapshot.
+COLUMNS = ("id", "item_id", "sku", "location_id", "location_code", "site_id", "lot_id", "handling_unit_id", "state", "qty")
+MAX_PAGE = 1000
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+_FETCH_ROWS = 5000
+
+@dataclass
+class BalanceFilter:
+    item_id: str | None = None
+    sku: str | None = None
+    location_id: str | None = None
+    location_code: str | None = None
+    site_id: str | None = None
+    state: str | None = None
+    lot_id: str | None = None
+    handling_unit_id: str | None = None
+    include_zero: bool = False
+
+def _query(f: BalanceFilter):
+    B = InventoryBalance
+    q = (select(B.id, B.item_id, InventoryItem.item_code, B.location_id, WMSLocation.code, WMSLocation.site_id,
+                B.lot_id, B.handling_unit_id, B.state, B.qty)
+         .join(InventoryItem, InventoryItem.id == B.item_id)
+         .join(WMSLocation, WMSLocation.id == B.location_id))
+    for col, value in ((B.item_id, f.item_id), (InventoryItem.item_code, f.sku), (B.location_id, f.location_id),
+                       (WMSLocation.code, f.location_code), (WMSLocation.site_id, f.site_id), (B.state, f.state),
+                       (B.lot_id, f.lot_id), (B.handling_unit_id, f.handling_unit_id)):
+        if value is not None:
+            q = q.where(col == value)
+    if not f.include_zero:
+        q = q.where(B.qty != 0)
+    return q.order_by(B.id)
+
+def _row(r) -> dict:
+    return {**dict(zip(COLUMNS, r)), "qty": float(r[-1])}
+
+def balance_page(db: Session, f: BalanceFilter, *, after: str | None = None,
+                 limit: int = 200) -> tuple[list[dict], str | None]:
+    """One page of balances ordered by id; returns (rows, `after` for the next page or None)."""
+    limit = max(1, min(limit, MAX_PAGE))
+    q = _query(f)
+    if after:
+        q = q.where(InventoryBalance.id > after)
+    rows = db.execute(q.limit(limit + 1)).all()
+    return [_row(r) for r in rows[:limit]], rows[limit - 1][0] if len(rows) > limit else None
+
+def iter_balances(db: Session, f: BalanceFilter) -> Iterator[list[dict]]:
+    """All matching balances, in chunks of _FETCH_ROWS from a server-side cursor."""
+    result = db.execute(_query(f).execution_options(stream_results=True, max_row_buffer=_FETCH_ROWS))
+    for chunk in result.partitions(_FETCH_ROWS):
+        yield [_row(r) for r in chunk]
+
+def export_lines(db: Session, f: BalanceFilter, fmt: str) -> Iterator[str]:
+    """NDJSON or CSV text, one chunk of rows per yielded string."""
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=COLUMNS, lineterminator="\n")
+        writer.writeheader()
+        yield buf.getvalue()
+        for rows in iter_balances(db, f):
+            buf.seek(0)
+            buf.truncate()
+            writer.writerows(rows)
+            yield buf.getvalue()
+    else:
+        for rows in iter_balances(db, f):
+            yield "".join(json.dumps(r) + "\n" for r in rows)
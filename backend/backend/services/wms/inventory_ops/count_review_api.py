@@ -6,7 +6,7 @@ from app.core.security import get_principal
 from app.core.audit import AuditLog
 from app.db.models.wms.counting import CountSubmission
 from app.db.models.inventory_exec import Item, Location
-from services.wms.inventory_ops.service import apply_movement
+from services.wms.inventory_ops.service import Movement, apply_movements
 from app.events.outbox import OutboxEvent
 
 router = APIRouter(prefix="/counts", tags=["counts-review"])
@@ -41,10 +41,12 @@ def approve(submission_id: str, payload: dict, db: Session = Depends(get_db), p=
     if abs(variance) > 0.000001:
         item = db.query(Item).filter(Item.id == s.item_id).first()
         loc = db.query(Location).filter(Location.id == s.location_id).first()
+        # Same transaction as the status change below: one commit for adjustment + approval.
         if variance > 0:
-            apply_movement(db, correlation_id=f"count-adjust:{s.id}", item=item, qty=variance, from_location=None, to_location=loc, actor=p.username, reason=payload.get("reason"))
+            adj = Movement(correlation_id=f"count-adjust:{s.id}", item=item, qty=variance, from_location=None, to_location=loc, actor=p.username, reason=payload.get("reason"))
         else:
-            apply_movement(db, correlation_id=f"count-adjust:{s.id}", item=item, qty=abs(variance), from_location=loc, to_location=None, actor=p.username, reason=payload.get("reason"))
+            adj = Movement(correlation_id=f"count-adjust:{s.id}", item=item, qty=abs(variance), from_location=loc, to_location=None, actor=p.username, reason=payload.get("reason"))
+        apply_movements(db, [adj], commit=False)
 
     s.status = "APPROVED"
     s.reviewed_by = p.username
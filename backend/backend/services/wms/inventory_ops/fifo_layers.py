@@ -0,0 +1,115 @@
+from __future__ import annotations
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Iterator
+from sqlalchemy import and_, or_, insert, delete, select, literal
+from sqlalchemy.orm import Session
+from app.db.models.costing import FifoLayer, FifoLayerArchive
+
+# FIFO cost layers.
+#
+# - Only open layers (qty_remaining > 0) are indexed (ix_fifo_layer_open_loc / _item), so finding
+#   the oldest layer of an item is an index range scan over its live layers, not its history.
+# - consume_layers() walks the open layers with a keyset cursor and locks them page by page
+#   (FOR UPDATE, page size 1, 2, 4, ...): an issue that is covered by the oldest layer locks that
+#   one row, and rows past the last layer it needs are never read.
+# - compact_exhausted_layers() moves fully consumed layers to inv_fifo_layer_archive in batches,
+#   so inv_fifo_layer stays proportional to stock on hand.
+_MAX_PAGE = 64
+_EPS = Decimal("0.000001")
+
+def _dec(x) -> Decimal:
+    return Decimal(str(x))
+
+def add_layer(db: Session, *, item_id: str, location_id: str | None, qty, unit_cost, correlation_id: str | None,
+              meta: dict | None = None) -> FifoLayer | None:
+    qty = _dec(qty)
+    if qty <= 0:
+        return None
+    layer = FifoLayer(item_id=item_id, location_id=location_id, qty_received=qty, qty_remaining=qty,
+                      unit_cost=_dec(unit_cost), correlation_id=correlation_id, meta=meta or {})
+    db.add(layer)
+    return layer
+
+def _open_layers(db: Session, item_id: str, *, location_id: str | None = None,
+                 exclude_location_id: str | None = None) -> Iterator[FifoLayer]:
+    """Open layers oldest first, locked as they are fetched."""
+    after = None
+    page = 1
+    while True:
+        q = db.query(FifoLayer).filter(FifoLayer.item_id == item_id, FifoLayer.qty_remaining > 0)
+        if location_id is not None:
+            q = q.filter(FifoLayer.location_id == location_id)
+        elif exclude_location_id is not None:
+            q = q.filter(or_(FifoLayer.location_id != exclude_location_id, FifoLayer.location_id.is_(None)))
+        if after is not None:
+            q = q.filter(or_(FifoLayer.created_at > after[0],
+                             and_(FifoLayer.created_at == after[0], FifoLayer.id > after[1])))
+        rows = (q.order_by(FifoLayer.created_at.asc(), FifoLayer.id.asc())
+                 .limit(page)
+                 .with_for_update()
+                 .all())
+        yield from rows
+        if len(rows) < page:
+            return
+        after = (rows[-1].created_at, rows[-1].id)
+        page = min(page * 2, _MAX_PAGE)
+
+def consume_layers(db: Session, *, item_id: str, location_id: str | None, qty) -> tuple[Decimal, Decimal]:
+    """Consume qty from the item's open layers; returns (qty covered by layers, extended cost).
+
+    Layers at the issuing location go first, then the item's other open layers oldest first
+    (stock is often moved after receipt, and layers are not relocated with it). If the layers
+    run out, the covered qty is less than qty and the caller values the rest.
+    """
+    # Sessions don't autoflush: push layers added or consumed earlier in the batch so the
+    # queries below see them.
+    db.flush()
+    remaining = _dec(qty)
+    ext = Decimal("0")
+    now = datetime.utcnow()
+    cursors = [_open_layers(db, item_id, location_id=location_id)] if location_id else []
+    cursors.append(_open_layers(db, item_id, exclude_location_id=location_id))
+    for cursor in cursors:
+        for layer in cursor:
+            take = min(_dec(layer.qty_remaining), remaining)
+            layer.qty_remaining = _dec(layer.qty_remaining) - take
+            if layer.qty_remaining <= 0:
+                layer.exhausted_at = now
+            remaining -= take
+            ext += take * _dec(layer.unit_cost)
+            if remaining <= _EPS:
+                break
+        if remaining <= _EPS:
+            break
+    return _dec(qty) - max(remaining, Decimal("0")), ext
+
+def compact_exhausted_layers(db: Session, *, older_than: timedelta = timedelta(days=30), batch_size: int = 1000) -> int:
+    """Move layers exhausted before now - older_than to inv_fifo_layer_archive; returns rows moved.
+
+    Runs in batches of batch_size, committing each, so it can run against a live system.
+    """
+    cutoff = datetime.utcnow() - older_than
+    moved = 0
+    while True:
+        ids = [r[0] for r in db.execute(
+            select(FifoLayer.id)
+            .where(FifoLayer.exhausted_at.isnot(None), FifoLayer.exhausted_at < cutoff, FifoLayer.qty_remaining <= 0)
+            .order_by(FifoLayer.exhausted_at.asc())
+            .limit(batch_size)
+        )]
+        if not ids:
+            return moved
+        db.execute(insert(FifoLayerArchive).from_select(
+            ["id", "item_id", "location_id", "qty_received", "unit_cost", "correlation_id", "meta",
+             "created_at", "exhausted_at", "archived_at"],
+            select(FifoLayer.id, FifoLayer.item_id, FifoLayer.location_id, FifoLayer.qty_received,
+                   FifoLayer.unit_cost, FifoLayer.correlation_id, FifoLayer.meta, FifoLayer.created_at,
+                   FifoLayer.exhausted_at, literal(datetime.utcnow()))
+            .where(FifoLayer.id.in_(ids)),
+        ))
+        db.execute(delete(FifoLayer).where(FifoLayer.id.in_(ids)).execution_options(synchronize_session=False))
+        db.commit()
+        moved += len(ids)
+        if len(ids) < batch_size:
+            return moved
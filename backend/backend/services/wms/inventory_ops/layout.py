@@ -0,0 +1,234 @@
+from __future__ import annotations
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+import numpy as np
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from app.db.models.inventory_exec import WMSLocation
+
+# Warehouse layout: location coordinates and the shared travel-distance matrix.
+#
+# Coordinates are columns on wms_location (zone, aisle, bay, level, pos, optional x / y), filled by
+# set_layout() when a location is created or imported, so nothing parses location codes per plan.
+#
+# distance_matrix(db, site_id) is the travel distance between every pair of the site's locations
+# over the aisle graph: aisles are the lines of equal x, bays run along them in y, and aisles are
+# joined by a front cross aisle (y = 0) and a back one (one bay beyond the deepest). Within an aisle
+# the distance is |dy|; between aisles it is |dx| plus the shorter way round, via the front or the
+# back cross aisle. Without x / y a location sits at x = aisle * AISLE_PITCH within its zone's band
+# (zones side by side in code order) and y = bay * BAY_PITCH; levels share a floor position.
+#
+# The matrix is the condensed upper triangle (float32, n * (n - 1) / 2 values, as in
+# scipy.spatial.distance.squareform), built once per site and cached in-process. Inserting, deleting
+# or moving a location through the ORM drops the cache; changes made elsewhere (other processes,
+# bulk SQL) are picked up after LAYOUT_CACHE_SECONDS. distances_from() answers a single row (one
+# origin, e.g. a putaway's staging location) without building the matrix when none is cached.
+AISLE_PITCH = 3.0  # meters between aisle centre lines
+BAY_PITCH = 1.0    # meters per bay along an aisle
+LAYOUT_CACHE_SECONDS = float(os.getenv("LAYOUT_CACHE_SECONDS", "300"))
+LAYOUT_FIELDS = ("zone", "aisle", "bay", "level", "pos", "x", "y")
+
+def _to_int(x: str | None, default: int = 0) -> int:
+    try:
+        return int(x) if x is not None else default
+    except Exception:
+        return default
+
+def _to_zone(code: str) -> str:
+    # Examples supported:
+    # Z1-A02-B03-L01-P05
+    # Z1-A02-03-01-05
+    m = re.search(r"\bZ(\d+)\b", code, re.IGNORECASE)
+    if m:
+        return f"Z{_to_int(m.group(1), 0)}"
+    # fallback: first token
+    tok = code.split("-")[0].strip()
+    return tok if tok else "Z0"
+
+def _parse_code_dims(code: str):
+    # We try multiple patterns to extract aisle/bay/level/pos.
+    # If missing, default 0.
+    aisle = bay = level = pos = 0
+    # Aisle like A02 or AISLE-02
+    m = re.search(r"(?:\bA(?:ISLE)?[- ]?)(\d+)", code, re.IGNORECASE)
+    if m:
+        aisle = _to_int(m.group(1), 0)
+    # Bay/Bin like B03
+    m = re.search(r"(?:\bB|\bBAY[- ]?)(\d+)", code, re.IGNORECASE)
+    if m:
+        bay = _to_int(m.group(1), 0)
+    # Level like L01
+    m = re.search(r"(?:\bL|\bLVL[- ]?)(\d+)", code, re.IGNORECASE)
+    if m:
+        level = _to_int(m.group(1), 0)
+    # Position like P05
+    m = re.search(r"(?:\bP|\bPOS[- ]?)(\d+)", code, re.IGNORECASE)
+    if m:
+        pos = _to_int(m.group(1), 0)
+
+    # If still empty, attempt hyphen-separated numeric dims (Z?-A?-B?-L?-P?)
+    parts = [p for p in re.split(r"[-_ ]+", code) if p]
+    # crude: take last 4 numeric tokens as aisle,bay,level,pos if not found
+    nums = [int(p) for p in parts if p.isdigit()]
+    if nums:
+        if aisle == 0 and len(nums) >= 1:
+            aisle = nums[-4] if len(nums) >= 4 else nums[0]
+        if bay == 0 and len(nums) >= 2:
+            bay = nums[-3] if len(nums) >= 3 else nums[1]
+        if level == 0 and len(nums) >= 3:
+            level = nums[-2]
+        if pos == 0 and len(nums) >= 4:
+            pos = nums[-1]
+    return aisle, bay, level, pos
+
+def parse_code(code: str) -> dict:
+    """zone / aisle / bay / level / pos parsed from a location code (missing parts are 0)."""
+    aisle, bay, level, pos = _parse_code_dims(code or "")
+    return {"zone": _to_zone(code or "") or "Z0", "aisle": aisle, "bay": bay, "level": level, "pos": pos}
+
+def set_layout(loc: WMSLocation, given: dict | None = None) -> WMSLocation:
+    """Set the location's layout columns: values in `given` win; columns not given keep their
+    value, and those still NULL are parsed from the code (x / y stay NULL unless given)."""
+    given = {k: v for k, v in (given or {}).items() if k in LAYOUT_FIELDS and v is not None}
+    for k, v in parse_code(loc.code).items():
+        if k not in given and getattr(loc, k) is None:
+            setattr(loc, k, v)
+    for k, v in given.items():
+        setattr(loc, k, float(v) if k in ("x", "y") else v)
+    return loc
+
+@dataclass
+class DistanceMatrix:
+    ids: list[str]                 # location ids, matrix order
+    index: dict[str, int]
+    condensed: np.ndarray          # float32 upper triangle, row by row
+    built_at: float
+
+    def _k(self, i, j):
+        n = len(self.ids)
+        return n * i - i * (i + 1) // 2 + (j - i - 1)
+
+    def distance(self, a: str, b: str) -> float:
+        """Travel distance between two locations; inf if either is not in this layout."""
+        i, j = self.index.get(a), self.index.get(b)
+        if i is None or j is None:
+            return float("inf")
+        if i == j:
+            return 0.0
+        i, j = min(i, j), max(i, j)
+        return float(self.condensed[self._k(i, j)])
+
+    def square(self, rows: list[str], cols: list[str] | None = None) -> np.ndarray:
+        """Dense rows x cols block of the matrix (cols default to rows); unknown locations are inf."""
+        cols = rows if cols is None else cols
+        r = np.array([self.index.get(x, -1) for x in rows], dtype=np.int64)[:, None]
+        c = np.array([self.index.get(x, -1) for x in cols], dtype=np.int64)[None, :]
+        lo, hi = np.broadcast_arrays(np.minimum(r, c), np.maximum(r, c))
+        off = (lo >= 0) & (lo < hi)
+        out = np.zeros(lo.shape, dtype=np.float64)
+        out[off] = self.condensed[self._k(lo[off], hi[off])]
+        out[lo < 0] = np.inf
+        return out
+
+def _coordinates(rows) -> tuple[np.ndarray, np.ndarray]:
+    layout = [(r.zone, r.aisle, r.bay) if r.aisle is not None else tuple(parse_code(r.code)[k] for k in ("zone", "aisle", "bay"))
+              for r in rows]
+    zones = {z: i for i, z in enumerate(sorted({z or "" for z, _, _ in layout}))}
+    band = (max((a or 0 for _, a, _ in layout), default=0) + 2) * AISLE_PITCH
+    x = np.array([r.x if r.x is not None else zones[z or ""] * band + (a or 0) * AISLE_PITCH
+                  for r, (z, a, _) in zip(rows, layout)], dtype=np.float64)
+    y = np.array([r.y if r.y is not None else (b or 0) * BAY_PITCH for r, (_, _, b) in zip(rows, layout)],
+                 dtype=np.float64)
+    return x, y
+
+def _site_rows(db: Session, site_id: str | None):
+    L = WMSLocation
+    return db.execute(
+        select(L.id, L.code, L.zone, L.aisle, L.bay, L.x, L.y)
+        .where(L.site_id.is_(None) if site_id is None else L.site_id == site_id)
+        .order_by(L.id)
+    ).all()
+
+def _travel(x0: float, y0: float, xs: np.ndarray, ys: np.ndarray, front: float, back: float) -> np.ndarray:
+    """Distance from (x0, y0) to each (xs, ys): along the aisle, or across and round a cross aisle."""
+    dx = np.abs(xs - x0)
+    around = np.minimum(y0 + ys - 2 * front, 2 * back - y0 - ys)
+    return np.where(dx == 0, np.abs(ys - y0), dx + around)
+
+def build_distance_matrix(db: Session, site_id: str | None = None) -> DistanceMatrix:
+    """Travel distances between every pair of the site's locations (site_id None: locations without a site)."""
+    rows = _site_rows(db, site_id)
+    n = len(rows)
+    condensed = np.empty(n * (n - 1) // 2, dtype=np.float32)
+    if n:
+        x, y = _coordinates(rows)
+        front, back = min(y.min(), 0.0), y.max() + BAY_PITCH
+        k = 0
+        for i in range(n - 1):
+            condensed[k:k + n - i - 1] = _travel(x[i], y[i], x[i + 1:], y[i + 1:], front, back)
+            k += n - i - 1
+    ids = [r.id for r in rows]
+    return DistanceMatrix(ids=ids, index={lid: i for i, lid in enumerate(ids)}, condensed=condensed,
+                          built_at=time.monotonic())
+
+_cache: dict[str | None, DistanceMatrix] = {}
+_lock = threading.Lock()
+
+def distance_matrix(db: Session, site_id: str | None = None) -> DistanceMatrix:
+    """The site's cached matrix, rebuilt when the layout changed or the entry is older than LAYOUT_CACHE_SECONDS."""
+    m = _cache.get(site_id)
+    if m is not None and time.monotonic() - m.built_at < LAYOUT_CACHE_SECONDS:
+        return m
+    with _lock:
+        m = _cache.get(site_id)
+        if m is None or time.monotonic() - m.built_at >= LAYOUT_CACHE_SECONDS:
+            m = _cache[site_id] = build_distance_matrix(db, site_id)
+    return m
+
+def distances_from(db: Session, origin: str, targets: list[str], site_id: str | None = None) -> np.ndarray:
+    """Travel distance from `origin` to each of `targets` on the site (inf for locations not on it).
+
+    Uses the cached matrix when there is a fresh one; otherwise computes just this row from the
+    site's coordinates (O(n)) instead of building the O(n^2) matrix for one lookup."""
+    m = _cache.get(site_id)
+    if m is not None and time.monotonic() - m.built_at < LAYOUT_CACHE_SECONDS:
+        return m.square([origin], targets)[0]
+    rows = _site_rows(db, site_id)
+    index = {r.id: i for i, r in enumerate(rows)}
+    out = np.full(len(targets), np.inf)
+    if origin not in index:
+        return out
+    x, y = _coordinates(rows)
+    front, back = min(y.min(), 0.0), y.max() + BAY_PITCH
+    i = index[origin]
+    row = _travel(x[i], y[i], x, y, front, back).astype(np.float32)
+    row[i] = 0.0
+    for t, target in enumerate(targets):
+        j = index.get(target)
+        if j is not None:
+            out[t] = row[j]
+    return out
+
+def invalidate_layout(site_id: str | None = None, *, all_sites: bool = False) -> None:
+    with _lock:
+        if all_sites:
+            _cache.clear()
+        else:
+            _cache.pop(site_id, None)
+
+def _layout_changed(mapper, connection, target: WMSLocation) -> None:
+    invalidate_layout(target.site_id)
+
+def _layout_updated(mapper, connection, target: WMSLocation) -> None:
+    state = inspect(target)
+    if any(state.attrs[f].history.has_changes() for f in (*LAYOUT_FIELDS, "code")):
+        invalidate_layout(target.site_id)
+    if state.attrs.site_id.history.has_changes():
+        invalidate_layout(all_sites=True)
+
+event.listen(WMSLocation, "after_insert", _layout_changed)
+event.listen(WMSLocation, "after_delete", _layout_changed)
+event.listen(WMSLocation, "after_update", _layout_updated)
@@ -0,0 +1,225 @@
+from __future__ import annotations
+import logging
+import multiprocessing
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from app.db.models.common import uuid4_str
+from app.db.models.costing import ItemCost, ItemOnHand
+from app.db.models.inventory_exec import InventoryBalance, InventoryTxn, BALANCE_KEY
+from app.db.session import SessionLocal
+from app.db.upsert import insert_for
+from services.inventory.stock_status import apply_stock_status
+from services.wms.inventory_ops.occupancy import apply_occupancy
+from services.wms.inventory_ops.service import apply_onhand, lot_expiry
+
+# Ledger replay: rebuild wms_inventory_balance from wms_inventory_txn and diff (optionally repair).
+#
+# - The ledger is streamed with a server-side cursor (stream_results) in chunks of _FETCH_ROWS,
+#   so memory is bounded by the number of distinct balance keys, not the number of txns.
+# - Quantities are summed as integer micro-units (Numeric(18,6) * 10^6) in an array('q') indexed
+#   through a key -> slot dict: exact, and 8 bytes per key instead of a Decimal object.
+# - Work is split into item-id partitions. Item ids are uuid4 strings, so equal ranges of the
+#   leading hex digits are effectively hash buckets, and each range is an index range scan on
+#   item_id. Partitions run in separate processes, each with its own connection.
+# - Each partition reads the ledger and the balances in one REPEATABLE READ transaction on
+#   Postgres, so both come from the same snapshot; a repair that races a live movement fails
+#   with a serialization error instead of overwriting it.
+# - The API runs replays as background jobs (queue_replay_job / run_replay_job); their status and report are kept
+#   in-process (the last _MAX_JOBS), so a job is polled on the worker that started it.
+log = logging.getLogger(__name__)
+
+_FETCH_ROWS = 10_000
+_WRITE_ROWS = 500
+_SCALE = 10 ** 6
+_MAX_DIFFS = 1000  # diff rows kept in the report (counts are always complete)
+_MAX_JOBS = 100
+_jobs: OrderedDict[str, dict] = OrderedDict()  # job id -> {"status": ..., "report" | "error": ...}
+
+@dataclass
+class ReplayReport:
+    txns: int = 0
+    keys: int = 0
+    balances: int = 0
+    mismatched: int = 0
+    missing: int = 0
+    repaired: int = 0
+    diffs: list[dict] = field(default_factory=list)
+
+    def merge(self, other: "ReplayReport") -> None:
+        self.txns += other.txns
+        self.keys += other.keys
+        self.balances += other.balances
+        self.mismatched += other.mismatched
+        self.missing += other.missing
+        self.repaired += other.repaired
+        self.diffs.extend(other.diffs[:max(0, _MAX_DIFFS - len(self.diffs))])
+
+def _micro(q) -> int:
+    return int(Decimal(q).scaleb(6).to_integral_value())
+
+def _bounds(partitions: int) -> list[tuple[str | None, str | None]]:
+    cuts = [format(p * 0x10000 // partitions, "04x") for p in range(partitions)]
+    return [(cuts[p] if p else None, cuts[p + 1] if p + 1 < partitions else None) for p in range(partitions)]
+
+def _in_range(col, lo: str | None, hi: str | None) -> list:
+    clauses = []
+    if lo is not None:
+        clauses.append(col >= lo)
+    if hi is not None:
+        clauses.append(col < hi)
+    return clauses
+
+def replay_partition(db: Session, lo: str | None = None, hi: str | None = None, *, repair: bool = False) -> ReplayReport:
+    """Replay the ledger for item ids in [lo, hi) and diff against wms_inventory_balance."""
+    if db.get_bind().dialect.name == "postgresql":
+        db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    report = ReplayReport()
+    slots: dict[tuple, int] = {}
+    qty = array("q")
+
+    def add(key: tuple, delta: int) -> None:
+        i = slots.get(key)
+        if i is None:
+            slots[key] = len(qty)
+            qty.append(delta)
+        else:
+            qty[i] += delta
+
+    to_state = InventoryTxn.meta["to_state"].as_string()
+    ledger = db.execute(
+        select(InventoryTxn.item_id, InventoryTxn.from_location_id, InventoryTxn.to_location_id,
+               InventoryTxn.lot_id, InventoryTxn.handling_unit_id, InventoryTxn.state, to_state, InventoryTxn.qty)
+        .where(*_in_range(InventoryTxn.item_id, lo, hi))
+        .execution_options(stream_results=True, max_row_buffer=_FETCH_ROWS)
+    )
+    for chunk in ledger.partitions(_FETCH_ROWS):
+        report.txns += len(chunk)
+        for item_id, from_loc, to_loc, lot_id, hu_id, state, dest_state, q in chunk:
+            m = _micro(q)
+            if from_loc:
+                add((item_id, from_loc, lot_id, hu_id, state), -m)
+            if to_loc:
+                add((item_id, to_loc, lot_id, hu_id, dest_state or state), m)
+    report.keys = len(slots)
+
+    seen = bytearray(len(qty))
+    fixes: list[tuple[tuple, int, int]] = []  # (key, ledger qty, balance qty)
+    live = db.execute(
+        select(InventoryBalance.item_id, InventoryBalance.location_id, InventoryBalance.lot_id,
+               InventoryBalance.handling_unit_id, InventoryBalance.state, InventoryBalance.qty)
+        .where(*_in_range(InventoryBalance.item_id, lo, hi))
+        .execution_options(stream_results=True, max_row_buffer=_FETCH_ROWS)
+    )
+    for chunk in live.partitions(_FETCH_ROWS):
+        report.balances += len(chunk)
+        for row in chunk:
+            key, actual = tuple(row[:5]), _micro(row[5])
+            i = slots.get(key)
+            expected = 0 if i is None else qty[i]
+            if i is not None:
+                seen[i] = 1
+            if expected != actual:
+                report.mismatched += 1
+                fixes.append((key, expected, actual))
+                if len(report.diffs) < _MAX_DIFFS:
+                    report.diffs.append(_diff(key, expected, actual))
+    for key, i in slots.items():
+        if not seen[i] and qty[i] != 0:
+            report.missing += 1
+            fixes.append((key, qty[i], 0))
+            if len(report.diffs) < _MAX_DIFFS:
+                report.diffs.append(_diff(key, qty[i], None))
+
+    if repair and fixes:
+        report.repaired = _repair(db, fixes)
+        db.commit()
+    else:
+        db.rollback()
+    return report
+
+def _diff(key: tuple, expected: int, actual: int | None) -> dict:
+    return {
+        "item_id": key[0], "location_id": key[1], "lot_id": key[2], "handling_unit_id": key[3], "state": key[4],
+        "ledger_qty": float(Decimal(expected) / _SCALE),
+        "balance_qty": None if actual is None else float(Decimal(actual) / _SCALE),
+    }
+
+def _repair(db: Session, fixes: list[tuple[tuple, int, int]]) -> int:
+    """Set the balance rows to the ledger qty (insert missing ones) and carry the difference into
+    inv_stock_status and wms_location_occupancy; reset inv_item_onhand qty to the repaired balances."""
+    now = datetime.utcnow()
+    expiry = lot_expiry(db, {f[0][2] for f in fixes})
+    rows = [{
+        "id": uuid4_str(), "item_id": k[0], "location_id": k[1], "lot_id": k[2], "handling_unit_id": k[3],
+        "state": k[4], "qty": Decimal(q) / _SCALE, "expiry_date": expiry.get(k[2]), "meta": {}, "created_at": now,
+    } for k, q, _ in sorted(fixes, key=lambda f: tuple(x or "" for x in f[0]))]
+    for i in range(0, len(rows), _WRITE_ROWS):
+        stmt = insert_for(db, InventoryBalance).values(rows[i:i + _WRITE_ROWS])
+        db.execute(stmt.on_conflict_do_update(index_elements=list(BALANCE_KEY), set_={"qty": stmt.excluded.qty}))
+    deltas = {k: Decimal(q - actual) / _SCALE for k, q, actual in fixes}
+    apply_stock_status(db, deltas)
+    apply_occupancy(db, deltas)
+    # inv_item_onhand qty is reset to the repaired balances' total; the qty change is valued at average cost.
+    items = sorted({k[0] for k, _, _ in fixes})
+    totals = dict(db.execute(
+        select(InventoryBalance.item_id, func.sum(InventoryBalance.qty))
+        .where(InventoryBalance.item_id.in_(items)).group_by(InventoryBalance.item_id)
+    ).all())
+    onhand = {o.item_id: o.qty for o in db.query(ItemOnHand).filter(ItemOnHand.item_id.in_(items))}
+    avg = {ic.item_id: ic.avg_cost or 0 for ic in db.query(ItemCost).filter(ItemCost.item_id.in_(items))}
+    onhand_deltas = {}
+    for i in items:
+        d = Decimal(totals.get(i) or 0) - Decimal(onhand.get(i) or 0)
+        if d:
+            onhand_deltas[i] = [d, d * Decimal(avg.get(i, 0))]
+    if onhand_deltas:
+        apply_onhand(db, onhand_deltas)
+    return len(rows)
+
+def _run_partition(bounds: tuple[str | None, str | None], repair: bool) -> ReplayReport:
+    with SessionLocal() as db:
+        return replay_partition(db, *bounds, repair=repair)
+
+def replay_ledger(*, partitions: int = 1, workers: int | None = None, repair: bool = False) -> ReplayReport:
+    """Replay the whole ledger in item-id partitions; workers > 1 runs them in parallel processes."""
+    bounds = _bounds(max(1, min(partitions, 0x10000)))
+    workers = min(workers or partitions, len(bounds))
+    report = ReplayReport()
+    if workers <= 1:
+        for b in bounds:
+            report.merge(_run_partition(b, repair))
+        return report
+    # spawn: children build their own engine/pool instead of sharing the parent's sockets
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        for r in pool.map(_run_partition, bounds, [repair] * len(bounds)):
+            report.merge(r)
+    return report
+
+def replay_job(job_id: str) -> dict | None:
+    return _jobs.get(job_id)
+
+def queue_replay_job(*, repair: bool = False) -> str:
+    """Register a replay job (status "queued") and return its id; run it with run_replay_job."""
+    job_id = uuid4_str()
+    _jobs[job_id] = {"status": "queued", "repair": repair}
+    while len(_jobs) > _MAX_JOBS:
+        _jobs.popitem(last=False)
+    return job_id
+
+def run_replay_job(job_id: str, *, partitions: int = 1, workers: int | None = None, repair: bool = False) -> None:
+    """replay_ledger as a background job; the outcome is stored under job_id (see replay_job)."""
+    _jobs[job_id] = {"status": "running", "repair": repair}
+    try:
+        report = replay_ledger(partitions=partitions, workers=workers, repair=repair)
+    except Exception as e:
+        log.exception("ledger replay %s failed", job_id)
+        _jobs[job_id] = {"status": "failed", "repair": repair, "error": str(e)}
+    else:
+        _jobs[job_id] = {"status": "done", "repair": repair, "report": asdict(report)}
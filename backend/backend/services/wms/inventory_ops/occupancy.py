@@ -0,0 +1,71 @@
+from __future__ import annotations
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from app.db.models.inventory import InventoryItem
+from app.db.models.inventory_exec import InventoryBalance, LocationOccupancy
+from app.db.upsert import insert_for
+
+# Occupancy per location (wms_location_occupancy), kept in step with wms_inventory_balance.
+#
+# Every caller of apply_stock_status() passes the same per-balance-key deltas to apply_occupancy()
+# in the same transaction. Deltas are summed per location over all states (a state change in place
+# nets to zero), converted to cube and weight with the item master's unit volume / weight (missing
+# dimensions count as 0), and upserted with SET units = units + delta. rebuild_occupancy() recomputes
+# every row from the balances, e.g. after item dimensions change.
+_WRITE_ROWS = 500
+
+def _dims(db: Session, item_ids) -> dict[str, tuple[Decimal, Decimal]]:
+    return {i: (Decimal(v or 0), Decimal(w or 0)) for i, v, w in db.execute(
+        select(InventoryItem.id, InventoryItem.volume, InventoryItem.weight).where(InventoryItem.id.in_(set(item_ids)))
+    )}
+
+def _upsert(db: Session, per_location: dict[str, list[Decimal]]) -> None:
+    O = LocationOccupancy
+    now = datetime.utcnow()
+    rows = [{"location_id": loc, "units": u, "volume": v, "weight": w, "updated_at": now}
+            for loc, (u, v, w) in sorted(per_location.items())]
+    for i in range(0, len(rows), _WRITE_ROWS):
+        stmt = insert_for(db, O).values(rows[i:i + _WRITE_ROWS])
+        x = stmt.excluded
+        db.execute(stmt.on_conflict_do_update(index_elements=[O.location_id], set_={
+            "units": O.units + x.units, "volume": O.volume + x.volume, "weight": O.weight + x.weight,
+            "updated_at": x.updated_at}))
+
+def apply_occupancy(db: Session, deltas: dict[tuple, Decimal]) -> None:
+    """Fold balance-key deltas (item, location, lot, hu, state) into the locations' occupancy."""
+    per_location: dict[str, dict[str, Decimal]] = {}
+    for (item_id, location_id, *_), qty in deltas.items():
+        if location_id and qty:
+            per_location.setdefault(location_id, {}).setdefault(item_id, Decimal("0"))
+            per_location[location_id][item_id] += Decimal(qty)
+    if not per_location:
+        return
+    dims = _dims(db, {i for per_item in per_location.values() for i in per_item})
+    totals: dict[str, list[Decimal]] = {}
+    for location_id, per_item in per_location.items():
+        acc = [Decimal("0")] * 3
+        for item_id, qty in per_item.items():
+            volume, weight = dims.get(item_id, (Decimal("0"), Decimal("0")))
+            acc[0] += qty
+            acc[1] += qty * volume
+            acc[2] += qty * weight
+        if any(acc):
+            totals[location_id] = acc
+    _upsert(db, totals)
+
+def rebuild_occupancy(db: Session, *, commit: bool = True) -> int:
+    """Recompute every location's row from the balances; returns rows written."""
+    B, I = InventoryBalance, InventoryItem
+    totals = {loc: [Decimal(u or 0), Decimal(v or 0), Decimal(w or 0)] for loc, u, v, w in db.execute(
+        select(B.location_id, func.sum(B.qty), func.sum(B.qty * func.coalesce(I.volume, 0)),
+               func.sum(B.qty * func.coalesce(I.weight, 0)))
+        .join(I, I.id == B.item_id)
+        .group_by(B.location_id)
+    )}
+    db.query(LocationOccupancy).delete(synchronize_session=False)
+    _upsert(db, totals)
+    if commit:
+        db.commit()
+    return len(totals)
@@ -1,40 +1,104 @@
 from __future__ import annotations
+from dataclasses import dataclass
+from decimal import Decimal
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from app.db.models.inventory_exec import Item, Location, InventoryBalance
-
-# v1 rule engine:
-# - prefer bins in item's preferred zone if provided
-# - otherwise any BIN location
-# - basic capacity: if capacity_units set, prefer locations where total qty < capacity_units (soft)
-def suggest_putaway_location(db: Session, *, item: Item, qty: float) -> Location:
-    # preferred zone can be stored in item.description or later a proper field; use meta in future
-    pref_zone = None
-    # try parse "zone:XYZ" from description
-    if item.description and "zone:" in item.description:
-        try:
-            pref_zone = item.description.split("zone:")[1].split()[0].strip()
-        except Exception:
-            pref_zone = None
-
-    q = db.query(Location).filter(Location.type == "BIN")
-    if pref_zone:
-        q = q.filter(Location.zone == pref_zone)
-    locs = q.order_by(Location.code.asc()).all()
-    if not locs and pref_zone:
-        locs = db.query(Location).filter(Location.type == "BIN").order_by(Location.code.asc()).all()
-    if not locs:
-        raise ValueError("No BIN locations exist")
-
-    # capacity preference
-    best = None
-    best_ratio = None
-    for l in locs:
-        if l.capacity_units is None:
-            return l
-        total = db.query(InventoryBalance).filter(InventoryBalance.location_id == l.id).all()
-        tot_qty = sum(float(b.qty) for b in total)
-        ratio = (tot_qty + qty) / max(l.capacity_units, 1)
-        if best is None or ratio < best_ratio:
-            best = l
-            best_ratio = ratio
-    return best or locs[0]
+from app.db.models.inventory_exec import Item, Location, LocationOccupancy
+from services.wms.inventory_ops.layout import distances_from
+
+# Putaway scoring engine.
+#
+# One query loads every BIN location with its occupancy (wms_location_occupancy, kept from balance
+# deltas). A receipt is planned in memory: lines in receipt order, each to the lowest-scoring bin,
+# whose units / cube / weight then include the line before the next one is scored. Score terms:
+#   zone      the bin's zone is not the item's putaway zone (item.meta["putaway_zone"], or the older
+#             "zone:XYZ" in the description)
+#   fill      fill ratio after the putaway, the tightest of units / cube / weight against the bin's
+#             meta capacity_units / max_volume / max_weight (no capacity set: 0)
+#   distance  travel distance from the staging location (layout.distances_from), relative to the
+#             farthest bin; a bin missing from the layout counts as the farthest
+# With a staging location only the BIN locations on its site (or, for no site, those without
+# one) are candidates.
+# Capacity stays soft: a bin the line would overfill adds OVERFLOW, so it is only chosen when
+# every bin would overflow. Ties go to the lowest location code.
+WEIGHTS = {"zone": 4.0, "fill": 1.0, "distance": 1.0}
+OVERFLOW = 100.0
+_CAPACITY_KEYS = ("capacity_units", "max_volume", "max_weight")
+
+@dataclass
+class PutawayLine:
+    item: Item
+    qty: float
+
+@dataclass
+class _Bin:
+    location: Location
+    zone: str
+    distance: float
+    used: list[Decimal]                        # units, volume, weight
+    capacity: tuple[Decimal | None, ...]       # same order; None = unlimited
+
+    def fill(self, load: tuple[Decimal, ...]) -> float:
+        ratios = [float((u + l) / c) for u, l, c in zip(self.used, load, self.capacity) if c]
+        return max(ratios, default=0.0)
+
+def _capacity(meta: dict) -> tuple[Decimal | None, ...]:
+    return tuple(Decimal(str(meta[k])) if meta.get(k) else None for k in _CAPACITY_KEYS)
+
+def _putaway_zone(item: Item) -> str | None:
+    zone = (item.meta or {}).get("putaway_zone")
+    if not zone and item.description and "zone:" in item.description:
+        zone = next(iter(item.description.split("zone:")[1].split()), None)
+    return zone or None
+
+def _bins(db: Session, staging: Location | None) -> list[_Bin]:
+    O = LocationOccupancy
+    q = (select(Location, O.units, O.volume, O.weight)
+         .outerjoin(O, O.location_id == Location.id)
+         .where(Location.type == "BIN"))
+    if staging is not None:
+        q = q.where(Location.site_id == staging.site_id if staging.site_id is not None else Location.site_id.is_(None))
+    rows = db.execute(q.order_by(Location.code.asc())).all()
+    distances = (distances_from(db, staging.id, [r[0].id for r in rows], staging.site_id)
+                 if staging is not None else [0.0] * len(rows))
+    bins = []
+    for (loc, units, volume, weight), distance in zip(rows, distances):
+        meta = loc.meta or {}
+        bins.append(_Bin(
+            location=loc,
+            zone=loc.zone,
+            distance=float(distance),
+            used=[Decimal(units or 0), Decimal(volume or 0), Decimal(weight or 0)],
+            capacity=_capacity(meta),
+        ))
+    return bins
+
+def plan_putaway(db: Session, lines: list[PutawayLine], *, staging: Location | None = None) -> list[Location]:
+    """Target bin per line, in line order, for a whole receipt."""
+    if not lines:
+        return []
+    bins = _bins(db, staging)
+    if not bins:
+        raise ValueError("No BIN locations exist" if staging is None else "No BIN locations on the staging site")
+    farthest = max((b.distance for b in bins if b.distance != float("inf")), default=0) or 1
+
+    plan = []
+    for ln in lines:
+        qty = Decimal(str(ln.qty))
+        load = (qty, qty * Decimal(ln.item.volume or 0), qty * Decimal(ln.item.weight or 0))
+        zone = _putaway_zone(ln.item)
+
+        def score(b: _Bin) -> float:
+            fill = b.fill(load)
+            return (WEIGHTS["zone"] * (zone is not None and b.zone != zone)
+                    + WEIGHTS["fill"] * min(fill, 1.0)
+                    + WEIGHTS["distance"] * min(b.distance / farthest, 1.0)
+                    + (OVERFLOW if fill > 1 else 0.0))
+
+        best = min(bins, key=score)  # bins are in code order, min keeps the first of equals
+        best.used = [u + l for u, l in zip(best.used, load)]
+        plan.append(best.location)
+    return plan
+
+def suggest_putaway_location(db: Session, *, item: Item, qty: float, staging: Location | None = None) -> Location:
+    return plan_putaway(db, [PutawayLine(item=item, qty=qty)], staging=staging)[0]
@@ -1,63 +1,151 @@
 from __future__ import annotations
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import delete, literal_column, select
 from sqlalchemy.orm import Session
-from app.db.models.inventory_exec import InventoryBalance, Location, Item
-from services.wms.inventory_ops.service import apply_movement
-
-def reserve_from_balance(db: Session, *, correlation_id: str, item_id: str, location_id: str, qty: float, actor: str, reason: str | None):
-    # Represent reservation as internal movement AVAILABLE -> RESERVED within same location.
-    item = db.query(Item).filter(Item.id == item_id).first()
-    loc = db.query(Location).filter(Location.id == location_id).first()
-    if not item or not loc:
-        raise ValueError("Bad item or location")
-
-    # subtract from AVAILABLE (to nil location but state change handled by apply_movement? In this starter we emulate by moving out then in with state)
-    # We do it by manual balance update for states while still writing a txn via apply_movement with meta.
-    # v1: use apply_movement to create txn, then adjust balances by state directly.
-    # Decrement AVAILABLE
-    bal_av = (db.query(InventoryBalance)
-              .filter(InventoryBalance.item_id == item_id, InventoryBalance.location_id == location_id, InventoryBalance.state == "AVAILABLE")
-              .with_for_update()
-              .first())
-    if not bal_av or float(bal_av.qty) < qty - 1e-9:
-        raise ValueError("Insufficient available qty to reserve")
-    bal_av.qty = float(bal_av.qty) - qty
-
-    # Increment RESERVED
-    bal_res = (db.query(InventoryBalance)
-               .filter(InventoryBalance.item_id == item_id, InventoryBalance.location_id == location_id, InventoryBalance.state == "RESERVED")
-               .with_for_update()
-               .first())
-    if not bal_res:
-        bal_res = InventoryBalance(item_id=item_id, location_id=location_id, state="RESERVED", qty=0)
-        db.add(bal_res)
-    bal_res.qty = float(bal_res.qty) + qty
-
-    # Write a txn marker
-    apply_movement(db, correlation_id=correlation_id, item=item, qty=qty, from_location=loc, to_location=loc, actor=actor, reason=reason)
-
-def release_reservation(db: Session, *, correlation_id: str, item_id: str, location_id: str, qty: float, actor: str, reason: str | None):
-    item = db.query(Item).filter(Item.id == item_id).first()
-    loc = db.query(Location).filter(Location.id == location_id).first()
-    if not item or not loc:
-        raise ValueError("Bad item or location")
-
-    bal_res = (db.query(InventoryBalance)
-               .filter(InventoryBalance.item_id == item_id, InventoryBalance.location_id == location_id, InventoryBalance.state == "RESERVED")
-               .with_for_update()
-               .first())
-    if not bal_res or float(bal_res.qty) < qty - 1e-9:
-        # best effort: nothing to release
+from app.db.models.common import uuid4_str
+from app.db.models.inventory_exec import InventoryBalance, InventoryReservation, BalanceReserved, BALANCE_KEY
+from app.db.upsert import insert_for
+from services.inventory.stock_status import apply_reservations
+
+# Reservations are ledger rows (wms_inventory_reservation), one per demand line and balance,
+# not qty shifted into RESERVED balances. Available = balance qty - wms_balance_reserved.qty,
+# where the counter moves by the same deltas as the ledger rows in the same transaction.
+#
+# Neither path reads or writes the balance row under a lock: reserving is an upsert on the
+# ledger plus a guarded counter increment (the guard compares against the balance qty in the
+# same statement, so two reservations racing for the last units serialize on the counter row,
+# not on the balance), and releasing is a delete plus a counter decrement.
+_WRITE_ROWS = 500
+
+def _dec(x) -> Decimal:
+    return Decimal(str(x))
+
+def _bump_counters(db: Session, deltas: dict[str, Decimal], *, guard: bool) -> set[str]:
+    """Add per-balance deltas to wms_balance_reserved; returns the balance ids updated.
+
+    With guard=True an increment that would reserve more than the balance holds is skipped
+    (its id is missing from the result).
+    """
+    C = BalanceReserved
+    now = datetime.utcnow()
+    ids = sorted(deltas)  # fixed lock order for concurrent batches
+    updated: set[str] = set()
+    for i in range(0, len(ids), _WRITE_ROWS):
+        chunk = ids[i:i + _WRITE_ROWS]
+        # Make sure every counter exists so each increment below takes the (guarded) update path.
+        db.execute(insert_for(db, C).values([{"balance_id": b, "qty": 0, "updated_at": now} for b in chunk])
+                   .on_conflict_do_nothing(index_elements=[C.balance_id]))
+        stmt = insert_for(db, C).values([{"balance_id": b, "qty": deltas[b], "updated_at": now} for b in chunk])
+        x = stmt.excluded
+        on_hand = (select(InventoryBalance.qty)  # correlated by name; SQLAlchemy does not correlate into INSERTs
+                   .where(InventoryBalance.id == literal_column(f"{C.__tablename__}.balance_id")).scalar_subquery())
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[C.balance_id],
+            set_={"qty": C.qty + x.qty, "updated_at": x.updated_at},
+            where=(C.qty + x.qty <= on_hand) if guard else None,
+        ).returning(C.balance_id)
+        updated.update(db.execute(stmt).scalars())
+    return updated
+
+def reserve(db: Session, rows: list[dict]) -> None:
+    """Insert reservation rows (demand_id, demand_line_id, balance_id, item_id, location_id, qty, ...).
+
+    Re-reserving the same line against the same balance adds to its row. Raises ValueError
+    (nothing written by this call survives the caller's rollback) when a balance lacks the
+    unreserved qty.
+    """
+    rows = [r for r in rows if _dec(r["qty"]) > 0]
+    if not rows:
         return
+    per_balance: dict[str, Decimal] = defaultdict(Decimal)
+    per_location: dict[tuple, Decimal] = defaultdict(Decimal)
+    for r in rows:
+        per_balance[r["balance_id"]] += _dec(r["qty"])
+        per_location[(r["item_id"], r["location_id"])] += _dec(r["qty"])
+    short = set(per_balance) - _bump_counters(db, per_balance, guard=True)
+    if short:
+        raise ValueError("Insufficient available qty to reserve")
+
+    R = InventoryReservation
+    now = datetime.utcnow()
+    values = [{"id": uuid4_str(), "created_at": now, "demand_id": r.get("demand_id"), "demand_line_id": r["demand_line_id"],
+               "balance_id": r["balance_id"], "item_id": r["item_id"], "location_id": r["location_id"], "qty": _dec(r["qty"]),
+               "correlation_id": r.get("correlation_id"), "actor": r.get("actor") or "system", "reason": r.get("reason")}
+              for r in sorted(rows, key=lambda r: (r["demand_line_id"], r["balance_id"]))]
+    for i in range(0, len(values), _WRITE_ROWS):
+        stmt = insert_for(db, R).values(values[i:i + _WRITE_ROWS])
+        db.execute(stmt.on_conflict_do_update(index_elements=[R.demand_line_id, R.balance_id],
+                                              set_={"qty": R.qty + stmt.excluded.qty}))
+    apply_reservations(db, per_location)
 
-    bal_res.qty = float(bal_res.qty) - qty
+def release(db: Session, *conditions) -> Decimal:
+    """Delete every reservation matching the filter conditions; returns the qty released."""
+    if not conditions:
+        raise ValueError("release needs at least one condition")
+    R = InventoryReservation
+    gone = db.execute(delete(R).where(*conditions).returning(R.balance_id, R.item_id, R.location_id, R.qty)).all()
+    return _unreserve(db, gone)
+
+def _unreserve(db: Session, gone) -> Decimal:
+    per_balance: dict[str, Decimal] = defaultdict(Decimal)
+    per_location: dict[tuple, Decimal] = defaultdict(Decimal)
+    for balance_id, item_id, location_id, qty in gone:
+        per_balance[balance_id] -= _dec(qty)
+        per_location[(item_id, location_id)] -= _dec(qty)
+    if per_balance:
+        _bump_counters(db, per_balance, guard=False)
+        apply_reservations(db, per_location)
+    return -sum(per_balance.values(), Decimal("0"))
+
+def reserve_from_balance(db: Session, *, correlation_id: str, item_id: str, location_id: str, qty: float, actor: str,
+                         reason: str | None, demand_line_id: str | None = None, demand_id: str | None = None,
+                         lot_id: str | None = None, handling_unit_id: str | None = None) -> None:
+    """Reserve qty of the AVAILABLE balance at the key for a demand line (defaults to correlation_id)."""
+    balance_id = db.execute(
+        select(InventoryBalance.id).where(*(col == v for col, v in zip(
+            BALANCE_KEY, (item_id, location_id, lot_id or "", handling_unit_id or "", "AVAILABLE"))))
+    ).scalar()
+    if balance_id is None:
+        raise ValueError("Insufficient available qty to reserve")
+    try:
+        reserve(db, [{"demand_id": demand_id, "demand_line_id": demand_line_id or correlation_id, "balance_id": balance_id,
+                      "item_id": item_id, "location_id": location_id, "qty": qty, "correlation_id": correlation_id,
+                      "actor": actor, "reason": reason}])
+    except ValueError:
+        db.rollback()
+        raise
+    db.commit()
 
-    bal_av = (db.query(InventoryBalance)
-              .filter(InventoryBalance.item_id == item_id, InventoryBalance.location_id == location_id, InventoryBalance.state == "AVAILABLE")
-              .with_for_update()
-              .first())
-    if not bal_av:
-        bal_av = InventoryBalance(item_id=item_id, location_id=location_id, state="AVAILABLE", qty=0)
-        db.add(bal_av)
-    bal_av.qty = float(bal_av.qty) + qty
+def release_reservation(db: Session, *, correlation_id: str, item_id: str, location_id: str, qty: float | None, actor: str,
+                        reason: str | None, demand_line_id: str | None = None) -> Decimal:
+    """Release up to qty (None: all) of the line's reservations at the location; returns the qty released.
 
-    apply_movement(db, correlation_id=correlation_id, item=item, qty=qty, from_location=loc, to_location=loc, actor=actor, reason=reason)
+    Best effort: releasing more than is reserved releases what there is.
+    """
+    R = InventoryReservation
+    rows = db.execute(
+        select(R.id, R.balance_id, R.item_id, R.location_id, R.qty)
+        .where(R.demand_line_id == (demand_line_id or correlation_id), R.item_id == item_id, R.location_id == location_id)
+        .order_by(R.created_at.desc(), R.id)
+        .with_for_update()
+    ).all()
+    left = None if qty is None else _dec(qty)
+    gone, drop = [], []
+    for rid, balance_id, item, loc, reserved in rows:
+        take = _dec(reserved) if left is None else min(_dec(reserved), left)
+        if take <= 0:
+            break
+        gone.append((balance_id, item, loc, take))
+        if take == _dec(reserved):
+            drop.append(rid)
+        else:
+            db.query(R).filter(R.id == rid).update({R.qty: R.qty - take}, synchronize_session=False)
+        if left is not None:
+            left -= take
+    if drop:
+        db.execute(delete(R).where(R.id.in_(drop)))
+    released = _unreserve(db, gone)
+    db.commit()
+    return released
@@ -1,166 +1,323 @@
 from __future__ import annotations
+import hashlib
+from dataclasses import dataclass
+from datetime import datetime
 from decimal import Decimal
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
-from app.db.models.inventory_exec import InventoryTxn, InventoryBalance, Item, Location, Lot
+from sqlalchemy import and_, insert, select
+from app.db.models.common import uuid4_str
+from app.db.models.inventory import InventoryItem
+from app.db.models.inventory_exec import InventoryTxn, InventoryBalance, BALANCE_KEY, WMSLocation, WMSLot
+from app.db.models.costing import ItemCost, ItemOnHand, ValuationTxn
+from app.db.upsert import insert_for
+from services.wms.inventory_ops.fifo_layers import add_layer, consume_layers
+from services.inventory.stock_status import apply_stock_status
+from services.wms.inventory_ops.occupancy import apply_occupancy
 from app.events.outbox import OutboxEvent
 
 def _dec(x) -> Decimal:
     return Decimal(str(x))
 
+_QTY_SCALE = Decimal("0.000001")  # wms_inventory_txn.qty is Numeric(18,6)
 
+def movement_key(*, correlation_id: str, item_id: str, from_location_id: str | None, to_location_id: str | None,
+                 lot_id: str | None, handling_unit_id: str | None, state: str, qty, to_state: str | None = None) -> str:
+    """Deterministic idempotency key for a movement (stored in InventoryTxn.idempotency_key)."""
+    parts = (correlation_id, item_id, from_location_id or "", to_location_id or "", lot_id or "",
+             handling_unit_id or "", state, format(_dec(qty).quantize(_QTY_SCALE), "f"))
+    if to_state and to_state != state:
+        parts += (to_state,)
+    return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
 
-def _fifo_add_layer(db: Session, *, item_id: str, location_id: str | None, qty: float, unit_cost: float, correlation_id: str | None):
-    if qty <= 0:
-        return
-    db.add(FifoLayer(item_id=item_id, location_id=location_id, qty_remaining=qty, unit_cost=unit_cost, correlation_id=correlation_id, meta={}))
-
-def _fifo_consume(db: Session, *, item_id: str, location_id: str | None, qty: float) -> float:
-    # returns extended cost consumed
-    remaining = qty
-    ext = 0.0
-    q = (db.query(FifoLayer)
-         .filter(FifoLayer.item_id == item_id)
-         .order_by(FifoLayer.created_at.asc())
-         .all())
-    for layer in q:
-        if remaining <= 1e-9:
-            break
-        take = min(float(layer.qty_remaining), remaining)
-        if take <= 0:
-            continue
-        layer.qty_remaining = float(layer.qty_remaining) - take
-        remaining -= take
-        ext += take * float(layer.unit_cost)
-    # if not enough layers, ext will be partial; caller can fallback
-    return ext
-
-def _get_or_create_item_cost(db: Session, item_id: str) -> ItemCost:
-    ic = db.query(ItemCost).filter(ItemCost.item_id == item_id).first()
-    if not ic:
-        ic = ItemCost(item_id=item_id, method="AVG", currency="USD", avg_cost=0, std_cost=0, meta={})
-        db.add(ic); db.flush()
-    return ic
-
-def _record_valuation(db: Session, *, item: Item, qty: float, direction: str, correlation_id: str | None, unit_cost: float, meta: dict | None = None):
+def _item_costs(db: Session, item_ids: set[str]) -> dict[str, ItemCost]:
+    """ItemCost rows for the items, creating missing ones (race-safe via the unique item_id).
+
+    New rows start at the on-hand value / qty (what inv_item_onhand was seeded or kept at),
+    else the item master's average cost; std_cost comes from the item master.
+    """
+    costs = {ic.item_id: ic for ic in db.query(ItemCost).filter(ItemCost.item_id.in_(item_ids))}
+    missing = sorted(item_ids - costs.keys())
+    if missing:
+        onhand = {o.item_id: o for o in db.query(ItemOnHand).filter(ItemOnHand.item_id.in_(missing))}
+        master = {r[0]: r[1:] for r in db.execute(
+            select(InventoryItem.id, InventoryItem.average_cost, InventoryItem.standard_cost)
+            .where(InventoryItem.id.in_(missing))
+        )}
+
+        def seed(item_id: str) -> dict:
+            average, standard = master.get(item_id, (None, None))
+            oh = onhand.get(item_id)
+            avg = oh.value / oh.qty if oh is not None and oh.qty > 0 else average
+            return {"avg_cost": avg or 0, "std_cost": standard or 0}
+
+        db.execute(insert_for(db, ItemCost).values([
+            {"id": uuid4_str(), "created_at": datetime.utcnow(), "item_id": i, "method": "AVG", "currency": "USD",
+             **seed(i), "meta": {}}
+            for i in missing
+        ]).on_conflict_do_nothing(index_elements=[ItemCost.item_id]))
+        costs.update({ic.item_id: ic for ic in db.query(ItemCost).filter(ItemCost.item_id.in_(missing))})
+    return costs
+
+def _record_valuation(db: Session, *, item: InventoryItem, qty: float, direction: str, correlation_id: str | None, unit_cost: float, meta: dict | None = None):
     ext = qty * unit_cost
     db.add(ValuationTxn(item_id=item.id, qty=qty, unit_cost=unit_cost, extended_cost=ext, direction=direction, correlation_id=correlation_id, meta=meta or {}))
 
+@dataclass
+class Movement:
+    """One line of an apply_movements batch (same meaning as apply_movement's arguments)."""
+    correlation_id: str
+    item: InventoryItem
+    qty: float
+    from_location: WMSLocation | None
+    to_location: WMSLocation | None
+    actor: str
+    state: str = "AVAILABLE"
+    # State on the destination side; set for state transitions such as AVAILABLE -> RESERVED.
+    to_state: str | None = None
+    lot: WMSLot | None = None
+    handling_unit_id: str | None = None
+    uom: str = "EA"
+    reason: str | None = None
+    meta: dict | None = None
+
+    def key(self) -> str:
+        return movement_key(
+            correlation_id=self.correlation_id, item_id=self.item.id,
+            from_location_id=self.from_location.id if self.from_location else None,
+            to_location_id=self.to_location.id if self.to_location else None,
+            lot_id=self.lot.id if self.lot else None, handling_unit_id=self.handling_unit_id,
+            state=self.state, qty=self.qty, to_state=self.to_state,
+        )
+
+
 def apply_movement(
     db: Session,
     *,
     correlation_id: str,
-    item: Item,
+    item: InventoryItem,
     qty: float,
-    from_location: Location | None,
-    to_location: Location | None,
+    from_location: WMSLocation | None,
+    to_location: WMSLocation | None,
     state: str = "AVAILABLE",
-    lot: Lot | None = None,
+    to_state: str | None = None,
+    lot: WMSLot | None = None,
     handling_unit_id: str | None = None,
     uom: str = "EA",
     actor: str,
     reason: str | None = None,
     meta: dict | None = None,
 ) -> InventoryTxn:
-    # Idempotency: if we already have a txn with same correlation+item+from+to+lot+state+qty, return it
-    existing = (db.query(InventoryTxn)
-        .filter(
-            InventoryTxn.correlation_id == correlation_id,
-            InventoryTxn.item_id == item.id,
-            InventoryTxn.from_location_id == (from_location.id if from_location else None),
-            InventoryTxn.to_location_id == (to_location.id if to_location else None),
-            InventoryTxn.lot_id == (lot.id if lot else None),
-            InventoryTxn.handling_unit_id == handling_unit_id,
-            InventoryTxn.state == state,
-            InventoryTxn.qty == _dec(qty),
+    return apply_movements(db, [Movement(
+        correlation_id=correlation_id, item=item, qty=qty, from_location=from_location, to_location=to_location,
+        actor=actor, state=state, to_state=to_state, lot=lot, handling_unit_id=handling_unit_id, uom=uom,
+        reason=reason, meta=meta,
+    )])[0]
+
+
+_BATCH_ROWS = 500  # rows per multi-VALUES statement (keeps bind params well under driver limits)
+
+def _chunks(rows: list, size: int = _BATCH_ROWS):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+def apply_movements(db: Session, movements: list[Movement], *, commit: bool = True) -> list[InventoryTxn]:
+    """Apply a batch of movements in one transaction; returns one InventoryTxn per input, in order.
+
+    Set-based: txns are inserted with multi-row ON CONFLICT DO NOTHING (rows that already exist
+    are replays and change nothing), balance deltas are summed per balance key and upserted
+    together, and outbox events are bulk-inserted. With commit=False the caller owns the commit.
+    """
+    for m in movements:
+        if m.item is None:
+            raise ValueError("Movement item is required")
+        if m.from_location is None and m.to_location is None:
+            raise ValueError("Movement needs a from_location or a to_location")
+        if _dec(m.qty) < 0:
+            raise ValueError("Movement qty must not be negative")
+
+    keys = [m.key() for m in movements]
+    pending: dict[str, Movement] = {}
+    for k, m in zip(keys, movements):
+        pending.setdefault(k, m)  # the same movement twice in one batch applies once
+
+    now = datetime.utcnow()
+    rows = [{
+        "id": uuid4_str(),
+        "created_at": now,
+        "idempotency_key": k,
+        "correlation_id": m.correlation_id,
+        "item_id": m.item.id,
+        "from_location_id": m.from_location.id if m.from_location else None,
+        "to_location_id": m.to_location.id if m.to_location else None,
+        "lot_id": m.lot.id if m.lot else None,
+        "handling_unit_id": m.handling_unit_id,
+        "state": m.state,
+        "qty": _dec(m.qty),
+        "uom": m.uom,
+        "actor": m.actor,
+        "reason": m.reason,
+        "meta": {**(m.meta or {}), **({"to_state": m.to_state} if m.to_state and m.to_state != m.state else {})},
+    } for k, m in pending.items()]
+
+    # Idempotency, set-based: one probe of ux_txn_idempotency_key per row. Replays (and concurrent
+    # duplicates, which block on the unique index until the first commits) insert nothing.
+    inserted: set[str] = set()
+    for chunk in _chunks(rows):
+        result = db.execute(
+            insert_for(db, InventoryTxn)
+            .values(chunk)
+            .on_conflict_do_nothing(index_elements=[InventoryTxn.idempotency_key])
+            .returning(InventoryTxn.idempotency_key)
         )
-        .first()
-    )
-    if existing:
-        return existing
-
-    txn = InventoryTxn(
-        correlation_id=correlation_id,
-        item_id=item.id,
-        from_location_id=from_location.id if from_location else None,
-        to_location_id=to_location.id if to_location else None,
-        lot_id=lot.id if lot else None,
-        handling_unit_id=handling_unit_id,
-        state=state,
-        qty=_dec(qty),
-        uom=uom,
-        actor=actor,
-        reason=reason,
-        meta=meta or {},
-    )
-    db.add(txn)
-
-    # decrement from
-    if from_location:
-        _apply_balance(db, item_id=item.id, location_id=from_location.id, lot_id=lot.id if lot else None,
-        handling_unit_id=handling_unit_id, state=state, delta=-_dec(qty))
-    # increment to
-    if to_location:
-        _apply_balance(db, item_id=item.id, location_id=to_location.id, lot_id=lot.id if lot else None,
-        handling_unit_id=handling_unit_id, state=state, delta=_dec(qty))
-
-    
-    # Costing / valuation + FIFO (starter)
-    try:
-        ic = _get_or_create_item_cost(db, item.id)
+        inserted.update(result.scalars())
+
+    applied = [m for k, m in pending.items() if k in inserted]
+    if applied:
+        deltas: dict[tuple, Decimal] = {}
+        for m in applied:
+            lot_id = m.lot.id if m.lot else None
+            if m.from_location:
+                bk = (m.item.id, m.from_location.id, lot_id, m.handling_unit_id, m.state)
+                deltas[bk] = deltas.get(bk, Decimal("0")) - _dec(m.qty)
+            if m.to_location:
+                bk = (m.item.id, m.to_location.id, lot_id, m.handling_unit_id, m.to_state or m.state)
+                deltas[bk] = deltas.get(bk, Decimal("0")) + _dec(m.qty)
+        _apply_balances(db, deltas)
+        apply_stock_status(db, deltas)
+        apply_occupancy(db, deltas)
+
+        apply_costing(db, applied)
+
+        db.execute(insert(OutboxEvent), [{"topic": "InventoryChanged", "payload": {
+            "correlation_id": m.correlation_id,
+            "item_id": m.item.id,
+            "from_location_id": m.from_location.id if m.from_location else None,
+            "to_location_id": m.to_location.id if m.to_location else None,
+            "lot_id": m.lot.id if m.lot else None,
+            "handling_unit_id": m.handling_unit_id,
+            "state": m.state,
+            "to_state": m.to_state or m.state,
+            "qty": float(m.qty),
+            "uom": m.uom,
+            "actor": m.actor,
+            "reason": m.reason,
+        }} for m in applied])
+
+    if commit:
+        db.commit()
+    else:
+        db.flush()
+
+    by_key: dict[str, InventoryTxn] = {}
+    unique_keys = list(pending)
+    for chunk in _chunks(unique_keys):
+        for txn in db.query(InventoryTxn).filter(InventoryTxn.idempotency_key.in_(chunk)):
+            by_key[txn.idempotency_key] = txn
+    return [by_key[k] for k in keys]
+
+def apply_costing(db: Session, applied: list[Movement]) -> list[Decimal | None]:
+    """Costing / valuation + FIFO (starter) and the per-item on-hand aggregate for a batch.
+
+    Returns the extended cost of each movement, in order (None for internal moves).
+
+    Receipts and issues change inv_item_onhand (qty and value) through one upsert per batch;
+    the moving average is then value / qty of that row, so receipt costing no longer
+    depends on how many balance rows the item has. Internal moves change neither.
+    Issues consume FIFO layers for the txn's unit cost (meta unit_cost values what the layers
+    don't cover); only FIFO-costed items also relieve
+    on-hand value at that cost, the others at the current average so the average holds.
+    """
+    onhand: dict[str, list[Decimal]] = {}  # item_id -> [qty delta, value delta]
+    received: set[str] = set()
+    extended: list[Decimal | None] = []
+    costs = _item_costs(db, {m.item.id for m in applied})
+    for m in applied:
+        receipt = m.to_location is not None and m.from_location is None
+        issue = m.from_location is not None and m.to_location is None
+        if not (receipt or issue):
+            extended.append(None)
+            continue
+        qty = _dec(m.qty)
+        agg = onhand.setdefault(m.item.id, [Decimal("0"), Decimal("0")])
+        ic = costs[m.item.id]
         avg = float(ic.avg_cost or 0)
         # Receipt into stock: from_location None -> to_location not None
-        if to_location is not None and from_location is None:
+        if receipt:
             # Prefer explicit unit_cost passed via meta (e.g., PO receipt / MO receipt)
-            unit_cost = float((meta or {}).get("unit_cost") or 0)
+            unit_cost = float((m.meta or {}).get("unit_cost") or 0)
             if unit_cost <= 0:
                 unit_cost = avg if avg > 0 else float(ic.std_cost or 0)
+            _record_valuation(db, item=m.item, qty=float(qty), direction="IN", correlation_id=m.correlation_id, unit_cost=unit_cost, meta={"mode": "receipt"})
+            agg[0] += qty
+            agg[1] += qty * _dec(unit_cost)
+            extended.append(qty * _dec(unit_cost))
+            received.add(m.item.id)
             # FIFO layer at the receipt cost
-            _fifo_add_layer(db, item_id=item.id, location_id=to_location.id, qty=qty, unit_cost=unit_cost, correlation_id=correlation_id)
-            # Update AVG cost (moving average, using pre-receipt qty estimate)
-            old_qty = sum(float(b.qty) for b in db.query(InventoryBalance).filter(InventoryBalance.item_id == item.id).all())
-            # balances already updated, so estimate old_qty by subtracting this receipt qty
-            old_qty = max(old_qty - float(qty), 0.0)
-            new_qty = old_qty + float(qty)
-            if new_qty > 0:
-                ic.avg_cost = (avg * old_qty + unit_cost * float(qty)) / new_qty
-            _record_valuation(db, item=item, qty=float(qty), direction="IN", correlation_id=correlation_id, unit_cost=unit_cost, meta={"mode": "receipt"})
+            add_layer(db, item_id=m.item.id, location_id=m.to_location.id, qty=qty, unit_cost=unit_cost, correlation_id=m.correlation_id)
         # Issue out of stock: from_location not None -> to_location None
-        elif from_location is not None and to_location is None:
-            ext = _fifo_consume(db, item_id=item.id, location_id=from_location.id, qty=float(qty))
-            unit_cost = (ext / float(qty)) if ext > 0 and float(qty) > 0 else avg
-            _record_valuation(db, item=item, qty=float(qty), direction="OUT", correlation_id=correlation_id, unit_cost=unit_cost, meta={"mode": "issue", "fifo_ext_cost": ext})
-        # Internal move: no valuation impact
-    except Exception:
-        pass
-
-    db.add(OutboxEvent(topic="InventoryChanged", payload={
-        "correlation_id": correlation_id,
-        "item_id": item.id,
-        "from_location_id": from_location.id if from_location else None,
-        "to_location_id": to_location.id if to_location else None,
-        "lot_id": lot.id if lot else None,
-        "handling_unit_id": handling_unit_id,
-        "state": state,
-        "qty": float(qty),
-        "uom": uom,
-        "actor": actor,
-        "reason": reason,
-    }))
-    db.commit()
-    db.refresh(txn)
-    return txn
-
-def _apply_balance(db: Session, *, item_id: str, location_id: str, lot_id: str | None, handling_unit_id: str | None, state: str, delta: Decimal):
-    bal = (db.query(InventoryBalance)
-           .filter(
-               InventoryBalance.item_id == item_id,
-               InventoryBalance.location_id == location_id,
-               InventoryBalance.lot_id == lot_id,
-                InventoryBalance.handling_unit_id == handling_unit_id,
-               InventoryBalance.state == state,
-           ).first())
-    if not bal:
-        bal = InventoryBalance(item_id=item_id, location_id=location_id, lot_id=lot_id, state=state, qty=Decimal("0"))
-        db.add(bal)
-    bal.qty = _dec(bal.qty) + delta
+        else:
+            covered, ext = consume_layers(db, item_id=m.item.id, location_id=m.from_location.id, qty=qty)
+            # Any qty the layers don't cover (stock that predates layering) is valued at the caller's
+            # meta unit_cost, else the average cost, else the item master's average / standard cost.
+            fallback = (float((m.meta or {}).get("unit_cost") or 0) or avg
+                        or float(m.item.average_cost or m.item.standard_cost or 0))
+            ext += (qty - covered) * _dec(fallback)
+            unit_cost = float(ext / qty) if qty > 0 else avg
+            _record_valuation(db, item=m.item, qty=float(qty), direction="OUT", correlation_id=m.correlation_id, unit_cost=unit_cost, meta={"mode": "issue", "fifo_ext_cost": float(ext)})
+            agg[0] -= qty
+            agg[1] -= ext if ic.method == "FIFO" else qty * _dec(avg)
+            extended.append(ext)
+
+    if onhand:
+        totals = apply_onhand(db, onhand)
+        # Moving average after receipts: (old value + receipt value) / (old qty + receipt qty)
+        for item_id in received:
+            qty, value = totals[item_id]
+            if qty > 0:
+                costs[item_id].avg_cost = value / qty
+    return extended
+
+def apply_onhand(db: Session, deltas: dict[str, list[Decimal]]) -> dict[str, tuple[Decimal, Decimal]]:
+    """Upsert per-item (qty, value) deltas into inv_item_onhand; returns the new totals."""
+    now = datetime.utcnow()
+    stmt = insert_for(db, ItemOnHand).values([
+        {"item_id": item_id, "qty": dq, "value": dv, "updated_at": now}
+        for item_id, (dq, dv) in sorted(deltas.items())
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ItemOnHand.item_id],
+        set_={"qty": ItemOnHand.qty + stmt.excluded.qty, "value": ItemOnHand.value + stmt.excluded.value,
+              "updated_at": stmt.excluded.updated_at},
+    ).returning(ItemOnHand.item_id, ItemOnHand.qty, ItemOnHand.value)
+    return {r.item_id: (_dec(r.qty), _dec(r.value)) for r in db.execute(stmt)}
+
+def lot_expiry(db: Session, lot_ids) -> dict:
+    """lot id -> expiry_date for new balance rows (InventoryBalance.expiry_date)."""
+    lot_ids = {i for i in lot_ids if i}
+    return dict(db.execute(select(WMSLot.id, WMSLot.expiry_date).where(WMSLot.id.in_(lot_ids))).all()) if lot_ids else {}
+
+def _apply_balances(db: Session, deltas: dict[tuple, Decimal]) -> dict[tuple, Decimal]:
+    """Upsert balance deltas keyed by (item, location, lot, HU, state); returns the new qtys.
+
+    One INSERT ... ON CONFLICT DO UPDATE SET qty = qty + delta per chunk: the increment happens
+    in the database, so concurrent movements on a key serialize on the row instead of losing
+    updates. Keys go in sorted order so concurrent batches lock rows in the same order.
+    New rows take their lot's expiry_date.
+    """
+    new_qty: dict[tuple, Decimal] = {}
+    expiry = lot_expiry(db, {bk[2] for bk in deltas})
+    rows = [{
+        "id": uuid4_str(), "item_id": bk[0], "location_id": bk[1], "lot_id": bk[2],
+        "handling_unit_id": bk[3], "state": bk[4], "qty": delta, "expiry_date": expiry.get(bk[2]),
+        "meta": {}, "created_at": datetime.utcnow(),
+    } for bk, delta in sorted(deltas.items(), key=lambda kv: tuple(x or "" for x in kv[0]))]
+    for chunk in _chunks(rows):
+        stmt = insert_for(db, InventoryBalance).values(chunk)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(BALANCE_KEY),
+            set_={"qty": InventoryBalance.qty + stmt.excluded.qty},
+        ).returning(InventoryBalance.item_id, InventoryBalance.location_id, InventoryBalance.lot_id,
+                    InventoryBalance.handling_unit_id, InventoryBalance.state, InventoryBalance.qty)
+        for r in db.execute(stmt):
+            new_qty[tuple(r[:5])] = r[5]
+    return new_qty
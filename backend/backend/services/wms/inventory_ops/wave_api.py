@@ -11,7 +11,11 @@ router = APIRouter(prefix="/waves", tags=["waves"])
 def create(payload: dict, db: Session = Depends(get_db), p=Depends(get_principal)):
     code = payload.get("code") or f"WAVE-{p.username}-001"
     order_ids = payload.get("order_ids") or []
-    wv = create_wave(db, code=code, created_by=p.username, order_ids=order_ids)
+    try:
+        wv = create_wave(db, code=code, created_by=p.username, order_ids=order_ids,
+                         allocation_strategy=payload.get("allocation_strategy"))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
     return {"id": wv.id, "code": wv.code, "status": wv.status}
 
 @router.get("")
@@ -1,12 +1,12 @@
 from __future__ import annotations
 from dataclasses import dataclass
-import re
 from typing import Any
 from sqlalchemy.orm import Session
 from sqlalchemy import asc
 from app.db.models.planning import WaveOrder
 from app.db.models.wms.allocation import Allocation
 from app.db.models.inventory_exec import Location, Item
+from services.wms.inventory_ops.layout import DistanceMatrix, distance_matrix, parse_code
 
 @dataclass(frozen=True)
 class LocKey:
@@ -17,78 +17,15 @@ class LocKey:
     pos: int
     code: str
 
-def _to_int(x: str | None, default: int = 0) -> int:
-    try:
-        return int(x) if x is not None else default
-    except Exception:
-        return default
-
 def parse_location(loc: Location) -> LocKey:
-    # Uses Location.zone when present; otherwise tries to parse from code.
-    code = loc.code or ""
-    zone = (getattr(loc, "zone", None) or "") or _to_zone(code)
-    aisle, bay, level, pos = _parse_code_dims(code)
-    return LocKey(zone=zone or "Z0", aisle=aisle, bay=bay, level=level, pos=pos, code=code)
-
-def _to_zone(code: str) -> str:
-    # Examples supported:
-    # Z1-A02-B03-L01-P05
-    # Z1-A02-03-01-05
-    m = re.search(r"\bZ(\d+)\b", code, re.IGNORECASE)
-    if m:
-        return f"Z{_to_int(m.group(1), 0)}"
-    # fallback: first token
-    tok = code.split("-")[0].strip()
-    return tok if tok else "Z0"
-
-def _parse_code_dims(code: str):
-    # We try multiple patterns to extract aisle/bay/level/pos.
-    # If missing, default 0.
-    aisle = bay = level = pos = 0
-    # Aisle like A02 or AISLE-02
-    m = re.search(r"(?:\bA(?:ISLE)?[- ]?)(\d+)", code, re.IGNORECASE)
-    if m:
-        aisle = _to_int(m.group(1), 0)
-    # Bay/Bin like B03
-    m = re.search(r"(?:\bB|\bBAY[- ]?)(\d+)", code, re.IGNORECASE)
-    if m:
-        bay = _to_int(m.group(1), 0)
-    # Level like L01
-    m = re.search(r"(?:\bL|\bLVL[- ]?)(\d+)", code, re.IGNORECASE)
-    if m:
-        level = _to_int(m.group(1), 0)
-    # Position like P05
-    m = re.search(r"(?:\bP|\bPOS[- ]?)(\d+)", code, re.IGNORECASE)
-    if m:
-        pos = _to_int(m.group(1), 0)
-
-    # If still empty, attempt hyphen-separated numeric dims (Z?-A?-B?-L?-P?)
-    parts = [p for p in re.split(r"[-_ ]+", code) if p]
-    # crude: take last 4 numeric tokens as aisle,bay,level,pos if not found
-    nums = []
-    for p in parts:
-        if p.isdigit():
-            nums.append(int(p))
-        elif re.match(r"^\d+$", p):
-            nums.append(int(p))
-    if nums:
-        if aisle == 0 and len(nums) >= 1:
-            aisle = nums[-4] if len(nums) >= 4 else nums[0]
-        if bay == 0 and len(nums) >= 2:
-            bay = nums[-3] if len(nums) >= 3 else nums[1]
-        if level == 0 and len(nums) >= 3:
-            level = nums[-2]
-        if pos == 0 and len(nums) >= 4:
-            pos = nums[-1]
-    return aisle, bay, level, pos
-
-def _distance(a: LocKey, b: LocKey) -> int:
-    # Simple warehouse heuristic distance (no coordinates):
-    # zone change is expensive; aisle change next; then bay/pos.
-    dz = 10000 if a.zone != b.zone else 0
-    return dz + abs(a.aisle - b.aisle) * 100 + abs(a.bay - b.bay) * 10 + abs(a.pos - b.pos)
-
-def order_stops(stops: list[dict[str, Any]], keys: dict[str, LocKey]) -> list[dict[str, Any]]:
+    # Layout columns are set when the location is created / imported; parse the code only for
+    # rows that predate them.
+    if loc.aisle is None:
+        return LocKey(code=loc.code or "", **parse_code(loc.code))
+    return LocKey(zone=loc.zone or "Z0", aisle=loc.aisle, bay=loc.bay or 0, level=loc.level or 0, pos=loc.pos or 0,
+                  code=loc.code)
+
+def order_stops(stops: list[dict[str, Any]], keys: dict[str, LocKey], dist: DistanceMatrix) -> list[dict[str, Any]]:
     if not stops:
         return stops
     remaining = stops[:]
@@ -97,9 +34,9 @@ def order_stops(stops: list[dict[str, Any]], keys: dict[str, LocKey]) -> list[di
     ordered = [remaining.pop(0)]
     while remaining:
         last = ordered[-1]
-        lk = keys[last["location_id"]]
-        # nearest neighbor selection
-        next_idx = min(range(len(remaining)), key=lambda i: _distance(lk, keys[remaining[i]["location_id"]]))
+        # nearest neighbor selection, by travel distance
+        row = dist.square([last["location_id"]], [s["location_id"] for s in remaining])[0]
+        next_idx = int(row.argmin())
         ordered.append(remaining.pop(next_idx))
     return ordered
 
@@ -155,8 +92,9 @@ def build_wave_pick_plan(db: Session, wave_id: str) -> dict:
         stop["lines"].sort(key=lambda ln: (ln.get("tote_code") or "", ln.get("sku") or "", ln["order_id"]))
         stops.append(stop)
 
-    # Path heuristics: zone/aisle clustering + nearest-neighbor between stops
-    ordered_stops = order_stops(stops, keys)
+    # Path heuristics: zone/aisle clustering + nearest-neighbor between stops over the site's aisle graph
+    site_id = loc_rows[0].site_id if loc_rows else None
+    ordered_stops = order_stops(stops, keys, distance_matrix(db, site_id))
 
     # Cart assignment: v1 assume one cart per wave, carrying the computed totes
     cart = {"cart_code": f"CART-{wave_id[:6]}", "totes": totes}
@@ -170,7 +108,7 @@ def build_wave_pick_plan(db: Session, wave_id: str) -> dict:
         "stops": ordered_stops,
         "heuristics": {
             "cluster": "zone/aisle + nearest-neighbor",
-            "distance_metric": "zone heavy, aisle medium, bay/pos light",
+            "distance_metric": "travel distance over the aisle graph (layout.distance_matrix)",
             "max_orders_per_tote": 4,
         },
     }
@@ -2,28 +2,28 @@ from __future__ import annotations
 from sqlalchemy.orm import Session
 from collections import defaultdict
 from app.db.models.planning import WaveOrder
-from app.db.models.inventory_exec import InventoryBalance, Location
+from app.db.models.inventory_exec import InventoryReservation, Location
 
 def optimize_wave(db: Session, wave_id: str) -> dict:
     # Simple heuristic:
     # - group picks by location.zone
     # - order zones alphabetically
     # - within zone, highest qty first
-    orders = db.query(WaveOrder).filter(WaveOrder.wave_id == wave_id).all()
+    order_ids = [wo.order_id for wo in db.query(WaveOrder).filter(WaveOrder.wave_id == wave_id)]
     zone_map = defaultdict(list)
 
-    for wo in orders:
-        balances = (db.query(InventoryBalance)
-                    .join(Location, Location.id == InventoryBalance.location_id)
-                    .filter(InventoryBalance.state == "RESERVED")
-                    .all())
-        for b in balances:
-            zone_map[b.location.zone or "ZZZ"].append({
-                "order_id": wo.order_id,
-                "location_code": b.location.code,
-                "zone": b.location.zone,
-                "qty": float(b.qty)
-            })
+    R = InventoryReservation
+    rows = (db.query(R.demand_id, R.qty, Location)
+            .join(Location, Location.id == R.location_id)
+            .filter(R.demand_id.in_(order_ids))
+            .all()) if order_ids else []
+    for order_id, qty, loc in rows:
+        zone_map[loc.zone or "ZZZ"].append({
+            "order_id": order_id,
+            "location_code": loc.code,
+            "zone": loc.zone,
+            "qty": float(qty)
+        })
 
     sequence = []
     for zone in sorted(zone_map.keys()):
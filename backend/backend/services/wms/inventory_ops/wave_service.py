@@ -3,13 +3,17 @@ from sqlalchemy.orm import Session
 from datetime import datetime
 from app.db.models.planning import Wave, WaveOrder
 from app.db.models.docs import OutboundOrder
-from services.wms.inventory_ops.allocation_service import allocate_order
+from services.wms.inventory_ops.allocation_service import DEFAULT_STRATEGY, STRATEGIES, allocate_wave
 from services.wms.tasking.service import create_pick_pack_tasks
 from services.wms.tasking.wave_pick import create_wave_pick_task
 from app.events.outbox import OutboxEvent
 
-def create_wave(db: Session, *, code: str, created_by: str | None, order_ids: list[str]) -> Wave:
-    w = Wave(code=code, status="PLANNED", created_by=created_by)
+def create_wave(db: Session, *, code: str, created_by: str | None, order_ids: list[str],
+                allocation_strategy: str | None = None) -> Wave:
+    if allocation_strategy and allocation_strategy not in STRATEGIES:
+        raise ValueError(f"allocation_strategy must be one of {', '.join(STRATEGIES)}")
+    w = Wave(code=code, status="PLANNED", created_by=created_by,
+             params={"allocation_strategy": allocation_strategy} if allocation_strategy else {})
     db.add(w); db.flush()
     for oid in order_ids:
         db.add(WaveOrder(wave_id=w.id, order_id=oid, status="IN_WAVE"))
@@ -24,10 +28,11 @@ def release_wave(db: Session, *, wave_id: str, actor: str):
     if wv.status != "PLANNED":
         return wv
 
-    orders = db.query(WaveOrder).filter(WaveOrder.wave_id == wave_id).all()
+    orders = db.query(WaveOrder).filter(WaveOrder.wave_id == wave_id).order_by(WaveOrder.created_at, WaveOrder.id).all()
+    # Allocate and reserve the whole wave at once (orders served in wave order)
+    allocate_wave(db, [wo.order_id for wo in orders], create_backorders=True, commit=False,
+                  strategy=(wv.params or {}).get("allocation_strategy") or DEFAULT_STRATEGY)
     for wo in orders:
-        # Allocate and reserve per order
-        allocate_order(db, wo.order_id, create_backorders=True)
         # Create PACK task per order (pick happens at wave level)
         create_pick_pack_tasks(db, wo.order_id, pick_only=False)
         wo.status = "PICKING"
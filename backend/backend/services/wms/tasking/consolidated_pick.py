@@ -3,27 +3,27 @@ from sqlalchemy.orm import Session
 from collections import defaultdict
 from app.db.models.planning import WaveOrder
 from app.db.models.wms.tasking import Task, TaskStep
-from app.db.models.inventory_exec import InventoryBalance, Location
+from app.db.models.inventory_exec import InventoryReservation, Location
 
 def create_consolidated_pick_tasks(db: Session, wave_id: str):
     # One pick task per location, serving multiple orders
-    rows = (db.query(WaveOrder)
-            .filter(WaveOrder.wave_id == wave_id)
-            .all())
+    order_ids = [wo.order_id for wo in db.query(WaveOrder).filter(WaveOrder.wave_id == wave_id)]
 
     loc_map = defaultdict(list)
 
-    for wo in rows:
-        balances = (db.query(InventoryBalance)
-                    .join(Location, Location.id == InventoryBalance.location_id)
-                    .filter(InventoryBalance.state == "RESERVED")
-                    .all())
-        for b in balances:
-            loc_map[b.location.code].append({
-                "order_id": wo.order_id,
-                "item_id": b.item_id,
-                "qty": float(b.qty)
-            })
+    # What the wave's orders have reserved, one query.
+    R = InventoryReservation
+    rows = (db.query(R.demand_id, R.item_id, R.qty, Location.code)
+            .join(Location, Location.id == R.location_id)
+            .filter(R.demand_id.in_(order_ids))
+            .order_by(Location.code, R.demand_id)
+            .all()) if order_ids else []
+    for order_id, item_id, qty, loc_code in rows:
+        loc_map[loc_code].append({
+            "order_id": order_id,
+            "item_id": item_id,
+            "qty": float(qty)
+        })
 
     tasks = []
     for loc_code, lines in loc_map.items():
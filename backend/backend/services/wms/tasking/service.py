@@ -1,13 +1,14 @@
 from __future__ import annotations
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, tuple_
 from datetime import datetime
 from app.db.models.wms.tasking import Task, TaskStep, TaskException
-from app.db.models.inventory_exec import Item, Location, InventoryBalance, HandlingUnit
+from app.db.models.inventory_exec import Item, Location, InventoryBalance, InventoryReservation, HandlingUnit
 from app.db.models.wms.counting import CountSubmission
 from app.db.models.docs import InboundReceipt, InboundReceiptLine, OutboundOrder, OutboundOrderLine, CycleCountRequest, CycleCountLine
-from services.wms.inventory_ops.service import apply_movement
-from services.wms.inventory_ops.putaway_rules import suggest_putaway_location
+from services.wms.inventory_ops.service import Movement, apply_movement, apply_movements
+from services.wms.inventory_ops.putaway_rules import PutawayLine, plan_putaway
+from services.wms.inventory_ops.reservation import release
 from app.core.audit import AuditLog
 from app.events.outbox import OutboxEvent
 
@@ -19,9 +20,11 @@ def create_receiving_and_putaway_tasks(db: Session, receipt_id: str, *, actor: s
     staging = db.query(Location).filter(Location.code == staging_location_code).first()
     if not staging:
         raise ValueError(f"Staging location '{staging_location_code}' not found")
+    # Whole receipt at once, so later lines see the bin capacity taken by earlier ones
+    targets = plan_putaway(db, [PutawayLine(item=ln.item, qty=float(ln.expected_qty)) for ln in lines], staging=staging)
 
     tasks: list[Task] = []
-    for ln in lines:
+    for ln, target in zip(lines, targets):
         item = ln.item
         # RECEIVE task
         t_recv = Task(type="RECEIVE", status="READY", source_type="RECEIPT", source_id=receipt_id, context={
@@ -45,7 +48,7 @@ def create_receiving_and_putaway_tasks(db: Session, receipt_id: str, *, actor: s
             "item_id": item.id,
             "qty": float(ln.expected_qty),
             "from_location_code": staging.code,
-            "to_location_code": suggest_putaway_location(db, item=item, qty=float(ln.expected_qty)).code,  # rule engine
+            "to_location_code": target.code,  # rule engine
         })
         db.add(t_put)
         db.flush()
@@ -249,17 +252,28 @@ def _finalize_task(db: Session, task: Task, steps: list[TaskStep], *, actor: str
         apply_movement(db, correlation_id=f"task:{task.id}", item=item, qty=qty, from_location=from_loc, to_location=to_loc, actor=actor, reason=reason, meta={"task_type": "PUTAWAY"})
     
     elif task.type == "WAVE_PICK":
-        # Multi-order picking using allocations (consumes RESERVED and moves to PACK).
+        # Multi-order picking using allocations (consumes the orders' reservations, moves stock to PACK).
         plan = (ctx.get("plan") or {})
         stops = plan.get("stops") or []
         pack_loc = db.query(Location).filter(Location.code == "PACK").first()
         if not pack_loc:
             pack_loc = db.query(Location).filter(Location.type == "STAGE").first()
     
+        # Resolve every location and SKU in the plan up front (one query each), then apply all
+        # picks as one movement batch (pick face -> PACK) and release the picked reservations.
+        loc_codes = {stop.get("location_code") for stop in stops}
+        locs = {l.code: l for l in db.query(Location).filter(Location.code.in_(loc_codes))}
+        skus = {ln.get("sku") for stop in stops for ln in stop.get("lines", []) if ln.get("sku")}
+        items = {i.sku: i for i in db.query(Item).filter(Item.sku.in_(skus))} if skus else {}
+
         picked_lines = []
+        movements = []
+        picked_keys = set()
         for stop in stops:
             loc_code = stop.get("location_code")
-            from_loc = loc(loc_code)
+            from_loc = locs.get(loc_code)
+            if not from_loc:
+                raise ValueError(f"Location {loc_code} not found")
             for ln in stop.get("lines", []):
                 sku = ln.get("sku")
                 qty = float(ln.get("qty", 0))
@@ -267,13 +281,17 @@ def _finalize_task(db: Session, task: Task, steps: list[TaskStep], *, actor: str
                 order_id = ln.get("order_id")
                 if not sku or qty <= 0:
                     continue
-                item_obj = db.query(Item).filter(Item.sku == sku).first()
+                item_obj = items.get(sku)
                 if not item_obj:
                     continue
-                # consume RESERVED then move physical
-                _consume_reserved(db, item_id=item_obj.id, location_id=from_loc.id, qty=qty)
-                apply_movement(db, correlation_id=f"wavepick:{task.id}:{order_id}", item=item_obj, qty=qty, from_location=from_loc, to_location=pack_loc, actor=actor, reason=reason)
+                movements.append(Movement(correlation_id=f"wavepick:{task.id}:{order_id}", item=item_obj, qty=qty,
+                                          from_location=from_loc, to_location=pack_loc, actor=actor, reason=reason))
+                picked_keys.add((order_id, item_obj.id, from_loc.id))
                 picked_lines.append({"order_id": order_id, "sku": sku, "qty": qty, "from": from_loc.code, "to": pack_loc.code if pack_loc else None, "tote_code": tote_code})
+        if picked_keys:
+            R = InventoryReservation
+            release(db, tuple_(R.demand_id, R.item_id, R.location_id).in_(sorted(picked_keys)))
+        apply_movements(db, movements, commit=False)
     
         db.add(OutboxEvent(topic="WavePickCompleted", payload={"task_id": task.id, "wave_id": ctx.get("wave_id"), "cart": plan.get("cart"), "picked": picked_lines}))
     
@@ -284,19 +302,22 @@ def _finalize_task(db: Session, task: Task, steps: list[TaskStep], *, actor: str
         from_loc = loc(ctx["from_location_code"])
         to_loc = loc(ctx["to_location_code"])
 
-        # Consume RESERVED at pick location, move to PACK as AVAILABLE
+        # The line's reservation at the pick location ends either way (picked or short);
+        # the picked qty moves to PACK.
         hu_id = ctx.get("hu_id")
+        if ctx.get("order_line_id"):
+            release(db, InventoryReservation.demand_line_id == ctx["order_line_id"], InventoryReservation.location_id == from_loc.id)
         if picked > 0:
-            apply_movement(db, correlation_id=f"task:{task.id}:resv_out", item=item, qty=picked, from_location=from_loc, to_location=None,
-                          state="RESERVED", actor=actor, reason=reason, handling_unit_id=hu_id, meta={"task_type": "PICK"})
-            apply_movement(db, correlation_id=f"task:{task.id}:pack_in", item=item, qty=picked, from_location=None, to_location=to_loc,
-                          state="AVAILABLE", actor=actor, reason=reason, handling_unit_id=hu_id, meta={"task_type": "PICK"})
-
-        # Short pick: release remaining reservation back to AVAILABLE and create exception
+            apply_movements(db, [
+                Movement(correlation_id=f"task:{task.id}:resv_out", item=item, qty=picked, from_location=from_loc, to_location=None,
+                         actor=actor, reason=reason, handling_unit_id=hu_id, meta={"task_type": "PICK"}),
+                Movement(correlation_id=f"task:{task.id}:pack_in", item=item, qty=picked, from_location=None, to_location=to_loc,
+                         state="AVAILABLE", actor=actor, reason=reason, handling_unit_id=hu_id, meta={"task_type": "PICK"}),
+            ], commit=False)
+
+        # Short pick: record the exception (the unpicked reservation was released above)
         if picked + 1e-9 < expected:
             remaining = expected - picked
-            from services.wms.inventory_ops.reservation import release
-            release(db, correlation_id=f"short:{task.id}", item=item, qty=remaining, location=from_loc, handling_unit_id=hu_id, actor=actor, reason="short-pick release")
             db.add(TaskException(task_id=task.id, kind="SHORT_PICK", status="OPEN", data={
                 "order_id": ctx.get("order_id"),
                 "order_line_id": ctx.get("order_line_id"),
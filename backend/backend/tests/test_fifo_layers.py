@@ -0,0 +1,47 @@
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db.base import Base
+from app.db import models  # noqa: F401  (registers every table)
+from app.db.models.costing import FifoLayer
+from services.wms.inventory_ops.fifo_layers import add_layer, consume_layers
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine, autoflush=False, future=True)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def _remaining(db):
+    return [layer.qty_remaining for layer in db.query(FifoLayer).order_by(FifoLayer.created_at, FifoLayer.id)]
+
+
+def test_consumes_in_the_same_batch_see_each_other(db):
+    add_layer(db, item_id="i1", location_id="l1", qty=10, unit_cost=1, correlation_id="r1")
+    db.commit()
+    add_layer(db, item_id="i1", location_id="l1", qty=10, unit_cost=2, correlation_id="r2")
+    db.commit()
+
+    assert consume_layers(db, item_id="i1", location_id="l1", qty=6) == (Decimal("6"), Decimal("6"))
+    assert consume_layers(db, item_id="i1", location_id="l1", qty=6) == (Decimal("6"), Decimal("8"))
+    db.commit()
+    assert _remaining(db) == [Decimal("0"), Decimal("8")]
+
+
+def test_layer_added_in_the_batch_is_consumable(db):
+    add_layer(db, item_id="i1", location_id="l1", qty=5, unit_cost=3, correlation_id="r1")
+
+    assert consume_layers(db, item_id="i1", location_id="l1", qty=4) == (Decimal("4"), Decimal("12"))
+    db.commit()
+    assert _remaining(db) == [Decimal("1")]
@@ -0,0 +1,56 @@
+import math
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db.base import Base
+from app.db import models  # noqa: F401  (registers every table)
+from app.db.models.inventory_exec import WMSLocation
+from services.wms.inventory_ops.layout import DistanceMatrix, build_distance_matrix, distances_from, invalidate_layout
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine, autoflush=False, future=True)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+        invalidate_layout(all_sites=True)
+
+
+def _matrix(ids, condensed):
+    return DistanceMatrix(ids=ids, index={x: i for i, x in enumerate(ids)},
+                          condensed=np.array(condensed, dtype=np.float32), built_at=0.0)
+
+
+def test_square_marks_unknown_locations_inf():
+    m = _matrix(["a", "b", "c"], [1.0, 2.0, 3.0])  # ab, ac, bc
+    out = m.square(["a", "zz", "c"], ["c", "b", "zz", "a"])
+    assert out.tolist() == [[2.0, 1.0, math.inf, 0.0],
+                            [math.inf, math.inf, math.inf, math.inf],
+                            [0.0, 3.0, math.inf, 2.0]]
+
+
+def test_square_on_single_location_layout():
+    m = _matrix(["a"], [])
+    assert m.square(["a", "zz"], ["a"]).tolist() == [[0.0], [math.inf]]
+
+
+def test_distances_from_matches_the_matrix(db):
+    for i, code in enumerate(["Z1-A01-B01", "Z1-A01-B05", "Z1-A02-B03", "Z1-A03-B01"]):
+        db.add(WMSLocation(id=f"l{i}", code=code, type="BIN", site_id="s1",
+                           zone="Z1", aisle=int(code[4:6]), bay=int(code[8:10]), level=0, pos=0))
+    db.commit()
+    invalidate_layout(all_sites=True)
+    targets = ["l3", "l0", "missing", "l2"]
+    row = distances_from(db, "l1", targets, "s1")
+    expected = build_distance_matrix(db, "s1").square(["l1"], targets)[0]
+    assert row.tolist() == expected.tolist()
+    assert distances_from(db, "missing", targets, "s1").tolist() == [math.inf] * 4